@@ -16,6 +16,23 @@ class Settings(BaseSettings):
     RELEASE_NOTES_DIR: str = Field(default=os.path.join(os.path.dirname(__file__), "release_notes"), env="RELEASE_NOTES_DIR")
     DOCS_DIR: str = Field(default="./docs", env="DOCS_DIR")
 
+    # LLM呼び出しの再試行の設定
+    LLM_MAX_RETRIES: int = Field(default=5, env="LLM_MAX_RETRIES")
+    LLM_BACKOFF_BASE_SECONDS: float = Field(default=2.0, env="LLM_BACKOFF_BASE_SECONDS")
+    LLM_BACKOFF_MAX_SECONDS: float = Field(default=60.0, env="LLM_BACKOFF_MAX_SECONDS")
+    LLM_DEADLINE_SECONDS: float = Field(default=600.0, env="LLM_DEADLINE_SECONDS")
+    # モデルごとの同時呼び出し数の上限
+    LLM_MAX_CONCURRENCY: int = Field(default=4, env="LLM_MAX_CONCURRENCY")
+    # プロンプトのトークン数の上限（0の場合はモデルのコンテキスト長から決める）と出力用に空けておくトークン数（コンテキスト長の1/4まで）
+    LLM_CONTEXT_WINDOW_TOKENS: int = Field(default=0, env="LLM_CONTEXT_WINDOW_TOKENS")
+    LLM_OUTPUT_RESERVE_TOKENS: int = Field(default=8192, env="LLM_OUTPUT_RESERVE_TOKENS")
+
+    # LLMのレスポンスのキャッシュの設定（オプショナル）
+    LLM_CACHE_ENABLED: bool = Field(default=False, env="LLM_CACHE_ENABLED")
+    LLM_CACHE_BACKEND: str = Field(default="dir", env="LLM_CACHE_BACKEND")
+    LLM_CACHE_DIR: str = Field(default=".llm_cache", env="LLM_CACHE_DIR")
+    LLM_CACHE_MAX_MB: float = Field(default=100.0, env="LLM_CACHE_MAX_MB")
+
     # GitHub Actionsの環境変数を使用してリポジトリの可視性を取得
     GITHUB_REPOSITORY_VISIBILITY: str = Field(default="public", env="GITHUB_REPOSITORY_VISIBILITY")
 
@@ -9,8 +9,8 @@ from config import get_settings
 from services.llm_service import LLMService
 from services.github_service import GitHubService
 from services.git_service import GitService
-from utils.diff_utils import DiffUtils, create_comment
-from utils.patch_utils import apply_patch, get_patch_file_path
+from utils.diff_utils import DiffUtils, DiffProcessingError, create_comment, run_per_file, write_file_atomic
+from utils.fuzzy_patch import apply_unified_diff
 
 class SuggestionApplier:
     def __init__(self):
@@ -82,27 +82,31 @@ class SuggestionApplier:
         return next((comment for comment in reversed(comments[:-1]) if comment.user.login == "Sunwood-ai-labs"), None)
 
     def _process_diffs(self, diffs):
-        modified_files = []
-        for file_path, diff_content in diffs.items():
-            logger.info(f"{file_path} のパッチ適用を試みます。")
-            patch_file_path = get_patch_file_path(file_path)
-            with open(patch_file_path, 'w', encoding='utf-8') as f:
-                f.write(diff_content)
-            print(diff_content)
-            if apply_patch(patch_file_path, file_path):
-                modified_files.append(file_path)
-            else:
-                logger.info(f"{file_path} のパッチ適用に失敗しました。LLMを使用して変更を生成します。")
-                self._apply_llm_changes(file_path, diff_content)
-                modified_files.append(file_path)
-        return modified_files
-
-    def _apply_llm_changes(self, file_path, diff_content):
-        with open(file_path, "r", encoding="utf-8") as f:
-            original_content = f.read()
-        modified_content = self.llm_service.apply_diff(original_content, diff_content)
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(modified_content)
+        # ファイルごとに並列に処理し、modified_files は diffs と同じ順序にする
+        # 一部のファイルだけを適用したPRを作らないように、失敗したファイルがあれば中止する
+        results, errors = run_per_file(diffs, self._apply_patch, self.llm_service.max_concurrency)
+        if errors:
+            raise DiffProcessingError(errors, results)
+        return list(results)
+
+    def _apply_patch(self, file_path, diff_content):
+        """diffをPythonで適用し、一致しないハンクだけ周辺の行をLLMで変更する"""
+        logger.info(f"{file_path} のパッチ適用を試みます。")
+        logger.debug(diff_content)
+
+        original_content = ""
+        if os.path.exists(file_path):
+            with open(file_path, "r", encoding="utf-8") as f:
+                original_content = f.read()
+        modified_content, failed = apply_unified_diff(
+            original_content, diff_content, llm_fallback=self.llm_service.apply_hunk_to_excerpt
+        )
+        if failed:
+            # 一部のハンクだけを適用した内容は書き込まない
+            raise RuntimeError(f"{file_path} の {len(failed)} 個のハンクを適用できませんでした。")
+        write_file_atomic(file_path, modified_content)
+        logger.info(f"{file_path} にパッチを適用しました。")
+        return file_path
 
     def _create_pull_request(self, issue, modified_files):
         branch_name = f"suggestion-issue-{self.settings.ISSUE_NUMBER}"
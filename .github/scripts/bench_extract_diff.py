@@ -0,0 +1,194 @@
+import argparse
+import os
+import sys
+import timeit
+
+# Add the parent directory of 'scripts' to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import markdown
+from bs4 import BeautifulSoup
+from loguru import logger
+from utils.diff_utils import DiffUtils
+
+# 互換性を確認する代表的なコメント本文
+SAMPLE_BODIES = {
+    "単一のdiff": """
+提案する変更は以下の通りです。
+
+```diff
+--- a/src/app.py
++++ b/src/app.py
+@@ -1,3 +1,3 @@
+ import os
+-print("hello")
++print("hello, world")
+```
+""",
+    "複数ファイル": """
+## 変更点
+
+```diff
+--- a/README.md
++++ b/README.md
+@@ -1 +1 @@
+-# Old
++# New
+```
+
+説明の段落と、diff以外のコードブロック:
+
+```python
+print("not a diff")
+```
+
+~~~diff
+--- a/.github/config.py
++++ b/.github/config.py
+@@ -10,2 +10,2 @@
+-LLM_MAX_CONCURRENCY = 2
++LLM_MAX_CONCURRENCY = 4
+~~~
+""",
+    "属性と長いフェンス": """
+````{.diff}
+--- a/docs/a.md
++++ b/docs/a.md
+@@ -1,4 +1,4 @@
+ ```python
+-x = 1
++x = 2
+ ```
+````
+
+``` .diff
+--- a/docs/b.md
++++ b/docs/b.md
+@@ -1 +1 @@
+-<b>old & "quoted"</b>
++<b>new & "quoted"</b>
+```
+""",
+    "閉じられていないフェンス": """
+```text
+閉じられていないブロック
+
+```diff
+--- a/c.py
++++ b/c.py
+@@ -1 +1 @@
+-a
++b
+```
+""",
+    "ファイル名のないdiffとインデント": """
+```diff
+@@ -1 +1 @@
+-a
++b
+```
+
+    ```diff
+    --- a/indented.py
+    +++ b/indented.py
+    ```
+
+```diff
+--- a/last.py
++++ b/last.py
+@@ -1,2 +1,2 @@
+
+-old
++new
+```
+""",
+    "diffなし": "diffを含まないコメントです。\n\n```\nplain\n```\n",
+}
+
+
+def reference_extract_diff(comment_body):
+    """fenced_code拡張でHTMLに変換し、language-diff のコードブロックを取り出す（従来の方法の基準）"""
+    soup = BeautifulSoup(markdown.markdown(comment_body, extensions=["fenced_code"]), "html.parser")
+    diffs = {}
+    for code in soup.find_all("code", class_="language-diff"):
+        diff_content = code.get_text() + "\n"
+        file_name = DiffUtils.extract_file_name(diff_content)
+        if file_name:
+            diffs[file_name] = diff_content
+    return diffs or None
+
+
+def legacy_extract_diff(comment_body):
+    """変更前の extract_diff と同じ処理（fenced_code と codehilite でHTMLに変換して解析する）"""
+    soup = BeautifulSoup(DiffUtils.convert_md_to_html(comment_body), "html.parser")
+    diffs = {}
+    for diff_block in soup.find_all("pre", class_="codehilite"):
+        diff_code = diff_block.find("code", class_="language-diff")
+        if diff_code:
+            diff_content = diff_code.get_text() + "\n"
+            file_name = DiffUtils.extract_file_name(diff_content)
+            if file_name:
+                diffs[file_name] = diff_content
+    return diffs or None
+
+
+def build_large_body(files, lines_per_file):
+    """大きなbotコメント（説明文とdiffブロックの繰り返し）を作る"""
+    parts = ["# 変更の提案\n"]
+    for i in range(files):
+        body = "\n".join(f"-old line {j}\n+new line {j}" for j in range(lines_per_file))
+        parts.append(
+            f"\n### file_{i}.py の変更\n\n説明の段落です。\n\n"
+            f"```diff\n--- a/src/file_{i}.py\n+++ b/src/file_{i}.py\n@@ -1,{lines_per_file} +1,{lines_per_file} @@\n{body}\n```\n"
+        )
+    return "".join(parts)
+
+
+def check_compatibility():
+    logger.disable("utils.diff_utils")
+    ok = True
+    for name, body in SAMPLE_BODIES.items():
+        expected = reference_extract_diff(body)
+        actual = DiffUtils.extract_diff(body)
+        if actual == expected:
+            logger.info(f"一致: {name} ({len(actual or {})} ファイル)")
+        else:
+            ok = False
+            logger.error(f"不一致: {name}\n期待値: {expected}\n結果: {actual}")
+    logger.enable("utils.diff_utils")
+    return ok
+
+
+def benchmark(files, lines_per_file, number):
+    logger.disable("utils.diff_utils")
+    body = build_large_body(files, lines_per_file)
+    logger.info(f"コメント本文: {len(body)} 文字, {files} ファイル")
+    legacy = timeit.timeit(lambda: legacy_extract_diff(body), number=number) / number
+    reference = timeit.timeit(lambda: reference_extract_diff(body), number=number) / number
+    scanner = timeit.timeit(lambda: DiffUtils.extract_diff(body), number=number) / number
+    logger.enable("utils.diff_utils")
+    logger.info(f"従来の方法 (fenced_code + codehilite + BeautifulSoup): {legacy * 1000:.2f} ms")
+    logger.info(f"従来の方法 (fenced_code + BeautifulSoup): {reference * 1000:.2f} ms")
+    logger.info(f"行の走査: {scanner * 1000:.2f} ms ({reference / scanner:.1f} 倍)")
+    if legacy_extract_diff(body) is None:
+        logger.warning("codehilite を使う従来の方法では diff を取り出せませんでした（Pygments がインストールされている環境）。")
+    return reference_extract_diff(body) == DiffUtils.extract_diff(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DiffUtils.extract_diff の互換性の確認とベンチマーク")
+    parser.add_argument("--files", type=int, default=50, help="ベンチマークのコメントに含めるdiffの数")
+    parser.add_argument("--lines", type=int, default=40, help="diffごとの変更行数")
+    parser.add_argument("--number", type=int, default=5, help="計測の繰り返し回数")
+    args = parser.parse_args()
+
+    compatible = check_compatibility()
+    compatible = benchmark(args.files, args.lines, args.number) and compatible
+    if not compatible:
+        logger.error("従来の方法と結果が一致しないコメント本文があります。")
+        sys.exit(1)
+    logger.success("すべてのコメント本文で従来の方法と同じ結果になりました。")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import os
+import sys
+
+# Add the parent directory of 'scripts' to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loguru import logger
+from utils.fuzzy_patch import apply_unified_diff
+
+# (名前, 元の内容, diff, 期待する適用後の内容, 適用できないハンクの数, LLMの呼び出し回数)
+CASES = [
+    (
+        "完全一致",
+        "import os\nimport sys\n\nclass Foo:\n    pass\n",
+        "@@ -1,4 +1,5 @@\n import os\n import sys\n+import json\n \n class Foo:\n",
+        "import os\nimport sys\nimport json\n\nclass Foo:\n    pass\n",
+        0, 0,
+    ),
+    (
+        "行番号のずれ",
+        "# header\n# header\nimport os\nimport sys\n\nclass Foo:\n    pass\n",
+        "@@ -1,4 +1,5 @@\n import os\n import sys\n+import json\n \n class Foo:\n",
+        "# header\n# header\nimport os\nimport sys\nimport json\n\nclass Foo:\n    pass\n",
+        0, 0,
+    ),
+    (
+        "前後のコンテキストの不一致（fuzz）",
+        "import os\nimport sys\nX\nclass Foo:\n    pass\n",
+        "@@ -1,5 +1,6 @@\n import os\n import sys\n+import json\n X\n class Bar:\n     pass\n",
+        "import os\nimport sys\nimport json\nX\nclass Foo:\n    pass\n",
+        0, 0,
+    ),
+    (
+        "コンテキストがどこにも一致しない",
+        "alpha\nbeta\ngamma\ndelta\n",
+        "@@ -1,3 +1,4 @@\n import os\n import sys\n+import json\n class Foo:\n",
+        "alpha\nbeta\ngamma\ndelta\n",
+        1, 0,
+    ),
+]
+
+
+def check(name, content, diff, expected, expected_failed, expected_calls, use_llm):
+    calls = []
+
+    def llm_fallback(window, hunk):
+        calls.append(window)
+        return window
+
+    result, failed = apply_unified_diff(content, diff, llm_fallback=llm_fallback if use_llm else None)
+    # LLMを使う場合、適用できないハンクはLLMに渡される
+    want_failed = 0 if use_llm else expected_failed
+    want_calls = expected_failed + expected_calls if use_llm else 0
+    ok = result == expected and len(failed) == want_failed and len(calls) == want_calls
+    label = f"{name}（LLMあり）" if use_llm else name
+    if ok:
+        logger.info(f"一致: {label}")
+    else:
+        logger.error(f"不一致: {label}\n結果: {result!r}\n失敗したハンク: {len(failed)} / LLMの呼び出し: {len(calls)}")
+    return ok
+
+
+def main():
+    ok = all([check(*case, use_llm) for case in CASES for use_llm in (False, True)])
+    if not ok:
+        logger.error("期待と異なる結果になったケースがあります。")
+        sys.exit(1)
+    logger.success("すべてのケースで期待通りに適用されました。")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config import get_settings
 from services.llm_service import LLMService
+from services.prompt_budget import PromptSection
 from services.github_service import GitHubService
 
 def main():
@@ -25,17 +26,22 @@ def main():
         repository_summary = f.read()
     logger.info("リポジトリの概要を読み込みました。")
 
-    prompt = f"""
+    # コンテキスト長を超える場合は、イシュー本文よりも先にリポジトリの概要を縮める
+    prompt = llm_service.build_prompt("""
 以下のGitHubイシューに対して、リポジトリの情報を踏まえた詳細なコメントを生成してください：
 
-イシュータイトル: {issue.title}
-イシュー本文: {issue.body}
+イシュータイトル: {issue_title}
+イシュー本文: {issue_body}
 
 リポジトリの概要:
 {repository_summary}
 
 詳細なコメント:
-    """
+    """, [
+        PromptSection("issue_title", issue.title, priority=20, required=True),
+        PromptSection("issue_body", issue.body or "", priority=10, required=True),
+        PromptSection("repository_summary", repository_summary, priority=0),
+    ])
 
     logger.info("LLMを使用して深いコメントを生成中...")
     deep_comment = llm_service.get_response(prompt)
@@ -73,19 +73,24 @@ def generate_prompt(latest_tag):
     logger.info(f"プロンプトの長さ: {len(prompt)} 文字")
     return prompt
 
-def save_release_notes(release_notes, latest_tag):
+def stream_release_notes(llm_service, prompt, latest_tag):
+    """LLMからリリースノートを受け取りながらファイルに書き込み、(リリースノート, 保存先) を返す"""
     release_notes_dir = '.github/release_notes'
     os.makedirs(release_notes_dir, exist_ok=True)
     release_notes_path = os.path.join(release_notes_dir, f'RELEASE_NOTES_{latest_tag}.md')
     
+    chunks = []
     try:
         with open(release_notes_path, 'w') as file:
-            file.write(release_notes)
+            for chunk in llm_service.get_response_stream(prompt, remove_code_block=True, use_cache=True):
+                chunks.append(chunk)
+                file.write(chunk)
+                file.flush()
         logger.info(f"リリースノートを保存しました: {release_notes_path}")
-        return release_notes_path
+        return "".join(chunks), release_notes_path
     except IOError as e:
         logger.error(f"リリースノートの保存中にエラーが発生しました: {str(e)}")
-        return None
+        return "".join(chunks), None
 
 def get_header_image_url(latest_tag):
     settings = get_settings()
@@ -147,10 +152,9 @@ def main():
 
     logger.info("LLMを使用してリリースノートを生成します。")
     logger.debug(f"リリースノート生成プロンプト：{prompt}")
-    release_notes = llm_service.get_response(prompt, remove_code_block=True)
+    release_notes, release_notes_path = stream_release_notes(llm_service, prompt, latest_tag)
     logger.info(f"リリースノートの生成が完了しました。長さ: {len(release_notes)} 文字")
 
-    release_notes_path = save_release_notes(release_notes, latest_tag)
     if not release_notes_path:
         logger.error("リリースノートの保存に失敗しました。プロセスを終了します。")
         sys.exit(1)
@@ -35,7 +35,7 @@ def main():
     logger.info(f"読み込まれたラベル: {', '.join(existing_labels)}")
     
     logger.info("LLMを使用してイシューを分析し、ラベルを提案しています...")
-    suggested_labels = llm_service.analyze_issue(issue.title, issue.body, existing_labels)
+    suggested_labels = llm_service.analyze_issue(issue.title, issue.body, existing_labels, use_cache=True)
     
     label_list = [label.strip().replace("*", "") for label in suggested_labels.split(',')]
     logger.info(f"提案されたラベル: {', '.join(label_list)}")
@@ -1,3 +1,4 @@
+import json
 import os
 import sys
 
@@ -7,11 +8,41 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from loguru import logger
 from config import get_settings
 from services.llm_service import LLMService
+from utils.markdown_sections import split_sections, contains_japanese, keep_trailing_whitespace
+
+OUTPUT_PATH = "docs/README.en.md"
+# セクションごとの翻訳を原文のハッシュで保存するファイル（変更のないセクションは再翻訳しない）
+SECTION_CACHE_PATH = "docs/README.en.sections.json"
 
 def display_content_preview(content, title):
     preview_length = 200  # プレビューの長さ（文字数）
     logger.info(f"{title}:\n{content[:preview_length]}...")
 
+def load_section_cache():
+    try:
+        with open(SECTION_CACHE_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.warning(f"セクションの翻訳キャッシュを読み込めませんでした。全セクションを翻訳します: {str(e)}")
+        return {}
+
+def save_section_cache(cache):
+    with open(SECTION_CACHE_PATH, "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write("\n")
+
+def build_prompt(section_text):
+    return f"""
+Please translate the following section of a Japanese README into English.
+Keep the Markdown/HTML structure, links and code as they are, and output only the translated section:
+
+```
+{section_text}
+```
+    """
+
 def main():
     logger.info("README翻訳プロセスを開始します。")
 
@@ -36,32 +67,50 @@ def main():
         logger.error(f"README.mdファイルの読み込み中にエラーが発生しました: {str(e)}")
         return
 
-    prompt = f"""
-Please translate the following Japanese README into English:
+    sections = split_sections(readme_content)
+    cache = load_section_cache()
+    # 翻訳が必要なのは、日本語を含み、かつ前回から内容が変わったセクションだけ
+    pending = list({
+        section.hash: section for section in sections
+        if contains_japanese(section.text) and section.hash not in cache
+    }.values())
+    logger.info(f"READMEを {len(sections)} セクションに分割しました。翻訳が必要なセクション: {len(pending)}")
+    for section in pending:
+        logger.info(f"  - {section.title}")
 
-```
-{readme_content}
-```
-    """
-
-    logger.info("LLMにREADMEの英訳を依頼しています...")
+    logger.info("LLMにセクションごとの英訳を依頼し、揃った部分から保存しています...")
+    # 途中で失敗した場合に既存のファイルを壊さないよう、一時ファイルに書いてから置き換える
+    partial_path = OUTPUT_PATH + ".part"
     try:
-        translated_readme = llm_service.get_response(prompt, remove_code_block=True)
-        logger.success("LLMからの英訳の取得が完了しました。")
-        display_content_preview(translated_readme, "翻訳後のREADMEの冒頭")
+        os.makedirs("docs", exist_ok=True)
+        translations = llm_service.iter_responses(
+            [build_prompt(section.text) for section in pending], remove_code_block=True, use_cache=True
+        )
+        with open(partial_path, "w", encoding="utf-8") as f:
+            for section in sections:
+                if not contains_japanese(section.text):
+                    translated = section.text
+                elif section.hash in cache:
+                    translated = cache[section.hash]
+                else:
+                    translated = keep_trailing_whitespace(section.text, next(translations))
+                    cache[section.hash] = translated
+                f.write(translated)
+                f.flush()
+        os.replace(partial_path, OUTPUT_PATH)
+        logger.success("LLMからの英訳の取得と保存が完了しました。")
     except Exception as e:
         logger.error(f"LLMからの英訳の取得中にエラーが発生しました: {str(e)}")
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
         return
 
-    logger.info("翻訳されたREADMEを保存しています...")
-    try:
-        os.makedirs("docs", exist_ok=True)
-        with open("docs/README.en.md", "w", encoding="utf-8") as f:
-            f.write(translated_readme)
-        logger.success("翻訳されたREADMEの保存が完了しました。")
-    except Exception as e:
-        logger.error(f"翻訳されたREADMEの保存中にエラーが発生しました: {str(e)}")
-        return
+    # 現在のREADMEにないセクションの翻訳はキャッシュから削除する
+    current_hashes = {section.hash for section in sections}
+    save_section_cache({key: value for key, value in cache.items() if key in current_hashes})
+
+    with open(OUTPUT_PATH, "r", encoding="utf-8") as f:
+        display_content_preview(f.read(), "翻訳後のREADMEの冒頭")
 
     logger.info("READMEの英訳プロセスが正常に完了しました。")
 
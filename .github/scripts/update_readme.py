@@ -1,4 +1,8 @@
+import argparse
+import hashlib
+import json
 import os
+import re
 import sys
 
 # Add the parent directory of 'scripts' to the Python path
@@ -8,8 +12,192 @@ from github import Github
 from loguru import logger
 from config import get_settings
 from services.llm_service import LLMService
+from services.prompt_budget import PromptSection
+from utils.markdown_sections import split_sections, keep_trailing_whitespace
+
+README_PATH = "README.md"
+# 前回更新した後の各セクションの内容のハッシュと、その時の入力（セクション・リリース情報・サマリー）の
+# ハッシュを保存するファイル（見出しが重複・変更されても、内容で対応付ける）
+SECTION_STATE_PATH = ".github/readme_update_state.json"
+
+SECTION_SELECTION_PROMPT = """
+以下は最新のリリース情報と、READMEのセクションの一覧です。
+このリリースの変更を反映するために内容を更新すべきセクションの番号を、JSONの配列で回答してください（例: [0, 3]）。
+更新が必要なセクションがない場合は [] と回答してください。JSONの配列以外は出力しないでください。
+
+# 最新のリリース情報:
+<Latest release information>
+バージョン: {release_title}
+主な変更点:
+{release_body}
+</Latest release information>
+
+# セクションの一覧:
+{section_list}
+"""
+
+SECTION_UPDATE_PROMPT = """
+以下の情報を元に、READMEの「{section_title}」セクションだけを更新してください：
+
+# 更新のガイドライン:
+<Update guidelines>
+1. 最新のリリースで追加された主要な機能や重要な変更点のうち、このセクションに関係するものだけを簡潔に反映してください。詳細な更新情報は不要です。
+2. 既存のマークダウンやHTMLの構造を維持しつつ、必要な箇所のみを更新してください。
+3. リポジトリのサマリーを参考にして、内容が正確に伝わるようにしてください。
+4. 読みやすく、理解しやすい日本語で記述してください。
+5. バージョン番号が記載されている場合は、最新のバージョン番号に更新してください。
+6. 見出しの絵文字は維持し、絵文字は適度に使用して読みやすさを損なわないようにしてください。
+7. リポジトリ中身を深く観察し存在しないファイルへのパスは記載しないで
+8. > [!IMPORTANT] などの注釈部分には手を加えないでそのままにして
+
+見出しを含む、更新後のこのセクションの全文だけを出力してください。他のセクションは出力しないでください。
+</Update guidelines>
+
+# 現在のセクション:
+<Current section>
+{section_text}
+</Current section>
+
+# 最新のリリース情報:
+<Latest release information>
+バージョン: {release_title}
+主な変更点:
+{release_body}
+</Latest release information>
+
+# リポジトリのサマリー:
+<Repository summary>
+{repo_summary_content}
+</Repository summary>
+"""
+
+def load_repo_summary():
+    repo_summary_path = ".SourceSageAssets/DOCUMIND/Repository_summary.md"
+    repo_summary_content = ""
+
+    # リポジトリのサマリーファイルをローカルから読み込む
+    try:
+        with open(repo_summary_path, 'r', encoding='utf-8') as f:
+            repo_summary_content = f.read()
+        logger.info("リポジトリのサマリーファイルを読み込みました。")
+    except FileNotFoundError:
+        logger.warning(f"リポジトリのサマリーファイルが見つかりません: {repo_summary_path}")
+    except Exception as e:
+        logger.warning(f"リポジトリのサマリーファイルの読み込みに失敗しました: {str(e)}")
+    return repo_summary_content
+
+def load_section_state():
+    try:
+        with open(SECTION_STATE_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.warning(f"セクションの更新状態を読み込めませんでした: {str(e)}")
+        return {}
+
+def input_hash(section_text, latest_release, repo_summary_content):
+    payload = json.dumps(
+        [section_text, latest_release.title, latest_release.body or "", repo_summary_content], ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def parse_section_numbers(answer, count):
+    """LLMの回答からJSON配列のセクション番号を取り出す（解釈できない場合はNone）"""
+    match = re.search(r"\[[^\[\]]*\]", answer)
+    if not match:
+        return None
+    try:
+        numbers = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return None
+    if not all(isinstance(n, int) and not isinstance(n, bool) for n in numbers):
+        return None
+    return {n for n in numbers if 0 <= n < count}
+
+def previous_release_tag(repo, latest_release):
+    """最新のリリースの1つ前のリリースのタグを取得する（ない場合は None）"""
+    for release in repo.get_releases():
+        if not release.draft and not release.prerelease and release.tag_name != latest_release.tag_name:
+            return release.tag_name
+    return None
+
+def tag_pattern(tag):
+    """READMEに書かれたタグ（v の有無は問わない）に一致する正規表現を作る（3.9.0 のような他のバージョンには一致しない）"""
+    version = re.escape(tag[1:] if tag[:1] in ("v", "V") else tag)
+    return re.compile(rf"(?<![\w.])[vV]?{version}(?!\.?\w)")
+
+def select_sections(llm_service, sections, latest_release, previous_tag=None):
+    """リリース情報の影響を受けるセクションの番号を選ぶ（前回のリリースのタグを含むセクションは常に対象）"""
+    section_list = "\n".join(f"{i}: {section.title}" for i, section in enumerate(sections))
+    prompt = llm_service.build_prompt(SECTION_SELECTION_PROMPT, [
+        PromptSection("release_title", latest_release.title, priority=20, required=True),
+        PromptSection("release_body", latest_release.body or "", priority=0),
+        PromptSection("section_list", section_list, priority=10, required=True),
+    ])
+    answer = llm_service.get_response(prompt, remove_code_block=True, use_cache=True)
+    selected = parse_section_numbers(answer, len(sections))
+    if selected is None:
+        logger.warning(f"セクションの選択結果を解釈できないため、全セクションを更新対象にします: {answer}")
+        selected = set(range(len(sections)))
+    if previous_tag:
+        pattern = tag_pattern(previous_tag)
+        selected |= {i for i, section in enumerate(sections) if pattern.search(section.text)}
+    return sorted(selected)
+
+def update_sections(llm_service, latest_release, repo_summary_content, previous_tag=None):
+    """ローカルのREADMEのうち、リリースの影響を受けるセクションだけを並列に更新する"""
+    with open(README_PATH, "r", encoding="utf-8") as f:
+        readme_content = f.read()
+    # 大見出し（#, ##）ごとに分割し、小見出しは親のセクションに含める
+    sections = split_sections(readme_content, max_level=2)
+    logger.info(f"READMEを {len(sections)} セクションに分割しました。")
+
+    state = load_section_state()
+    if all(state.get(s.hash) == input_hash(s.text, latest_release, repo_summary_content) for s in sections):
+        logger.info("READMEとリリース情報が前回の更新から変わっていないため、更新をスキップします。")
+        return readme_content
+    targets = []
+    for i in select_sections(llm_service, sections, latest_release, previous_tag):
+        section = sections[i]
+        if state.get(section.hash) == input_hash(section.text, latest_release, repo_summary_content):
+            logger.info(f"入力が前回から変わっていないためスキップします: {section.title}")
+            continue
+        targets.append(i)
+    logger.info(f"更新するセクション: {', '.join(sections[i].title for i in targets) or 'なし'}")
+
+    prompts = [
+        llm_service.build_prompt(SECTION_UPDATE_PROMPT, [
+            PromptSection("section_title", sections[i].title, priority=30, required=True),
+            PromptSection("section_text", sections[i].text, priority=30, required=True),
+            PromptSection("release_title", latest_release.title, priority=20, required=True),
+            PromptSection("release_body", latest_release.body or "", priority=10, required=True),
+            PromptSection("repo_summary_content", repo_summary_content, priority=0),
+        ])
+        for i in targets
+    ]
+    texts = [section.text for section in sections]
+    for i, updated in zip(targets, llm_service.get_responses(prompts, remove_code_block=True, use_cache=True)):
+        texts[i] = keep_trailing_whitespace(sections[i].text, updated)
+    updated_readme = "".join(texts)
+
+    # 更新後の各セクションの内容のハッシュを入力のハッシュとともに保存し、次回同じ入力であればスキップする
+    # （現在のREADMEにないセクションの記録は残さない）
+    state = {
+        section.hash: input_hash(section.text, latest_release, repo_summary_content)
+        for section in split_sections(updated_readme, max_level=2)
+    }
+    with open(SECTION_STATE_PATH, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write("\n")
+    return updated_readme
 
 def main():
+    parser = argparse.ArgumentParser(description="最新のリリースに合わせてREADMEを更新する")
+    parser.add_argument("--local", action="store_true",
+                        help="ローカルのREADME.mdを読み込み、リリースの影響を受けるセクションだけを更新する")
+    args = parser.parse_args()
+
     logger.info("README更新プロセスを開始します。")
     
     settings = get_settings()
@@ -21,26 +209,24 @@ def main():
     latest_release = repo.get_latest_release()
     logger.info(f"最新のリリース: {latest_release.title}")
 
+    repo_summary_content = load_repo_summary()
+
+    if args.local:
+        previous_tag = previous_release_tag(repo, latest_release)
+        logger.info(f"前回のリリース: {previous_tag or 'なし'}")
+        updated_readme = update_sections(llm_service, latest_release, repo_summary_content, previous_tag)
+        with open(README_PATH, "w", encoding="utf-8") as f:
+            f.write(updated_readme)
+        logger.info("READMEの更新が完了しました。")
+        return
+
     # READMEの内容を取得
     readme = repo.get_contents("README.md")
     readme_content = readme.decoded_content.decode("utf-8")
-    
-    repo_summary_path = ".SourceSageAssets/DOCUMIND/Repository_summary.md"
-    repo_summary_content = ""
-
-    # リポジトリのサマリーファイルをローカルから読み込む
-    try:
-        with open(repo_summary_path, 'r', encoding='utf-8') as f:
-            repo_summary_content = f.read()
-        logger.info("リポジトリのサマリーファイルを読み込みました。")
-    except FileNotFoundError:
-        logger.warning(f"リポジトリのサマリーファイルが見つかりません: {repo_summary_path}")
-    except Exception as e:
-        logger.warning(f"リポジトリのサマリーファイルの読み込みに失敗しました: {str(e)}")
 
     # LLMにプロンプトを送信
-
-    prompt = f"""
+    # コンテキスト長を超える場合は、リリース情報よりも先にリポジトリのサマリーを縮める
+    prompt = llm_service.build_prompt("""
 以下の情報を元に、READMEを更新してください：
 
 # 更新のガイドライン:
@@ -68,9 +254,9 @@ def main():
 
 # 最新のリリース情報:
 <Latest release information>
-バージョン: {latest_release.title}
+バージョン: {release_title}
 主な変更点:
-{latest_release.body}
+{release_body}
 </Latest release information>
 
 # リポジトリのサマリー:
@@ -80,11 +266,15 @@ def main():
 
 
 
-    """
+    """, [
+        PromptSection("release_title", latest_release.title, priority=20, required=True),
+        PromptSection("release_body", latest_release.body or "", priority=10, required=True),
+        PromptSection("repo_summary_content", repo_summary_content, priority=0),
+    ])
 
     logger.info("LLMに更新を依頼しています...")
     logger.info(f"プロンプト：\n{prompt}")
-    updated_readme = llm_service.get_response(prompt, remove_code_block=True)
+    updated_readme = llm_service.get_response(prompt, remove_code_block=True, use_cache=True)
 
     logger.info(f">> updated_readme：\n{updated_readme}")
     
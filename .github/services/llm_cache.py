@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from typing import Optional
+
+from loguru import logger
+
+
+def make_cache_key(model: str, prompt: str, **flags) -> str:
+    """モデル名・プロンプト・後処理のフラグから内容に基づくキャッシュキーを作る"""
+    payload = json.dumps({"model": model, "prompt": prompt, "flags": flags}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class DirectoryCacheStore:
+    """
+    1件を1ファイルとしてディレクトリに保存するストア（更新日時をLRUの基準にする）
+
+    合計サイズは起動時に1回だけ数えて以降は書き込みごとに加算し、
+    容量上限を超えた時だけディレクトリを走査して古いものから削除する
+    """
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self._total = sum(size for _, size, _ in self._entries())
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], f"{key}.txt")
+
+    def _entries(self):
+        """保存されているファイルの (更新日時, サイズ, パス) の一覧"""
+        entries = []
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                if name.endswith(".txt"):
+                    try:
+                        stat = os.stat(os.path.join(root, name))
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, os.path.join(root, name)))
+        return entries
+
+    def get(self, key: str) -> Optional[str]:
+        file = self._file(key)
+        try:
+            with open(file, "r", encoding="utf-8") as f:
+                value = f.read()
+        except FileNotFoundError:
+            return None
+        os.utime(file)
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        file = self._file(key)
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        tmp_file = f"{file}.{threading.get_ident()}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            f.write(value)
+        size = os.path.getsize(tmp_file)
+        with self._lock:
+            try:
+                self._total -= os.path.getsize(file)
+            except FileNotFoundError:
+                pass
+            os.replace(tmp_file, file)
+            self._total += size
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """容量上限に収まるまで古いものから削除する（ロックを取得した状態で呼び出す）"""
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, file in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(file)
+            total -= size
+            logger.info(f"[LLM cache] 容量上限のため削除しました: {os.path.basename(file)}")
+        self._total = total
+
+
+class SQLiteCacheStore:
+    """SQLiteの1ファイルに保存するストア（最終アクセス日時をLRUの基準にする）"""
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, accessed_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock, closing(self._connect()) as conn, conn:
+            row = conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def set(self, key: str, value: str) -> None:
+        size = len(value.encode("utf-8"))
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time()),
+            )
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            for old_key, old_size in conn.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall():
+                if total <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM responses WHERE key = ?", (old_key,))
+                total -= old_size
+                logger.info(f"[LLM cache] 容量上限のため削除しました: {old_key}")
+
+
+class ResponseCache:
+    """LLMのレスポンスを内容に基づくキーでディスクに保存するキャッシュ"""
+    def __init__(self, store):
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.store.get(key)
+        if value is None:
+            self.misses += 1
+            logger.info(f"[LLM cache] miss: {key[:12]}")
+        else:
+            self.hits += 1
+            logger.info(f"[LLM cache] hit: {key[:12]}")
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        self.store.set(key, value)
+
+
+def create_cache(backend: str, path: str, max_mb: float) -> ResponseCache:
+    """設定からキャッシュを作成する（backend: dir または sqlite）"""
+    max_bytes = int(max_mb * 1024 * 1024)
+    if backend == "sqlite":
+        store = SQLiteCacheStore(path if path.endswith(".db") else os.path.join(path, "responses.db"), max_bytes)
+    elif backend == "dir":
+        store = DirectoryCacheStore(path, max_bytes)
+    else:
+        raise ValueError(f"不明なキャッシュのバックエンドです: {backend}（dir または sqlite を指定してください）")
+    logger.info(f"[LLM cache] {backend} キャッシュを使用します: {path}")
+    return ResponseCache(store)
@@ -0,0 +1,108 @@
+import email.utils
+import random
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import litellm
+
+# エラーの分類
+RATE_LIMIT = "rate_limit"
+CONTEXT_OVERFLOW = "context_overflow"
+TRANSIENT = "transient"
+FATAL = "fatal"
+
+# 例外の型で判別できない場合に、メッセージから分類するためのキーワード
+CONTEXT_OVERFLOW_KEYWORDS = (
+    "context length", "context_length", "context window", "maximum context",
+    "too many tokens", "token limit", "input is too long", "exceeds the maximum",
+)
+RATE_LIMIT_KEYWORDS = ("rate limit", "ratelimit", "quota", "resource_exhausted", "too many requests")
+
+
+def _litellm_types(*names):
+    """litellmのバージョンに存在する例外の型だけを返す"""
+    return tuple(getattr(litellm, name) for name in names if isinstance(getattr(litellm, name, None), type))
+
+
+CONTEXT_OVERFLOW_TYPES = _litellm_types("ContextWindowExceededError")
+RATE_LIMIT_TYPES = _litellm_types("RateLimitError")
+TRANSIENT_TYPES = _litellm_types(
+    "APIConnectionError", "Timeout", "ServiceUnavailableError", "InternalServerError", "APIError"
+)
+FATAL_TYPES = _litellm_types(
+    "AuthenticationError", "PermissionDeniedError", "NotFoundError", "BadRequestError", "UnprocessableEntityError"
+)
+
+
+def classify_error(error: Exception) -> str:
+    """例外を rate_limit / context_overflow / transient / fatal に分類する"""
+    message = str(error).lower()
+    # ContextWindowExceededErrorはBadRequestErrorのサブクラスのため先に判定する
+    if isinstance(error, CONTEXT_OVERFLOW_TYPES) or any(k in message for k in CONTEXT_OVERFLOW_KEYWORDS):
+        return CONTEXT_OVERFLOW
+    if isinstance(error, RATE_LIMIT_TYPES) or any(k in message for k in RATE_LIMIT_KEYWORDS):
+        return RATE_LIMIT
+    if isinstance(error, FATAL_TYPES):
+        return FATAL
+    if isinstance(error, TRANSIENT_TYPES) or isinstance(error, (ConnectionError, TimeoutError)):
+        return TRANSIENT
+
+    status_code = getattr(error, "status_code", None)
+    if status_code == 429:
+        return RATE_LIMIT
+    if isinstance(status_code, int) and (status_code >= 500 or status_code in (408, 409)):
+        return TRANSIENT
+    if isinstance(status_code, int) and 400 <= status_code < 500:
+        return FATAL
+    # 分類できないエラーは一時的なものとして再試行する
+    return TRANSIENT
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """例外に含まれるRetry-Afterヘッダーの待ち時間（秒）を取得する"""
+    headers = getattr(error, "litellm_response_headers", None) or getattr(error, "headers", None)
+    response = getattr(error, "response", None)
+    if headers is None and response is not None:
+        headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if value is None:
+        retry_after_ms = headers.get("retry-after-ms")
+        return float(retry_after_ms) / 1000 if retry_after_ms else None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        # HTTP日付形式の場合
+        retry_at = email.utils.parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time()) if retry_at else None
+
+
+def truncate_prompt(prompt: str, ratio: float) -> str:
+    """プロンプトを指定した割合に短縮する（行の途中で切らないように直前の改行で切る）"""
+    limit = int(len(prompt) * ratio)
+    cut = prompt.rfind("\n", 0, limit)
+    return prompt[:cut if cut > 0 else limit]
+
+
+@dataclass
+class RetryPolicy:
+    """指数バックオフ（ジッター付き）と全体の期限による再試行の方針"""
+    max_retries: int = 5
+    base_delay: float = 2.0
+    max_delay: float = 60.0
+    deadline: float = 600.0
+    truncate_ratio: float = 0.5
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """attempt回目の失敗後の待ち時間（Retry-Afterがあればそれを優先）"""
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        # Full Jitter: 0 〜 base * 2^(attempt-1) の範囲でランダムに待つ
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def remaining(self, started_at: float) -> float:
+        """全体の期限までの残り時間（秒）"""
+        return self.deadline - (time.monotonic() - started_at)
@@ -1,44 +1,236 @@
 from loguru import logger
 from litellm import completion
 from config import get_settings
+from services.llm_cache import create_cache, make_cache_key
+from services.prompt_budget import PromptSection, count_tokens, fit_prompt, fit_sections, get_context_window, get_prompt_budget
+from services.llm_stream import CodeFenceStripper, iter_stream_text
+from services.llm_retry import RetryPolicy, classify_error, get_retry_after, truncate_prompt, CONTEXT_OVERFLOW, FATAL
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, List
+import threading
 import time
 
+# attempt_metrics に保持する直近の試行の数
+MAX_ATTEMPT_METRICS = 1000
+
 class LLMService:
+    # モデルごとの同時呼び出し数を制限するセマフォ（インスタンス間で共有）
+    _model_semaphores = {}
+    _semaphores_lock = threading.Lock()
+
     def __init__(self):
         self.settings = get_settings()
         self.model = self.settings.LITELLM_MODEL
-        self.max_retries = 5
-        self.retry_delay = 60
+        self.retry_policy = RetryPolicy(
+            max_retries=self.settings.LLM_MAX_RETRIES,
+            base_delay=self.settings.LLM_BACKOFF_BASE_SECONDS,
+            max_delay=self.settings.LLM_BACKOFF_MAX_SECONDS,
+            deadline=self.settings.LLM_DEADLINE_SECONDS,
+        )
+        self.max_retries = self.retry_policy.max_retries
+        # 直近の試行ごとの結果（モデル、試行回数、結果、レイテンシ、プロンプト長）
+        self.attempt_metrics = deque(maxlen=MAX_ATTEMPT_METRICS)
+        self.max_concurrency = self.settings.LLM_MAX_CONCURRENCY
+        self.prompt_budget = get_prompt_budget(
+            get_context_window(self.model, self.settings.LLM_CONTEXT_WINDOW_TOKENS), self.settings.LLM_OUTPUT_RESERVE_TOKENS
+        )
+        self.cache = None
+        if self.settings.LLM_CACHE_ENABLED:
+            self.cache = create_cache(
+                self.settings.LLM_CACHE_BACKEND, self.settings.LLM_CACHE_DIR, self.settings.LLM_CACHE_MAX_MB
+            )
+
+    def _model_semaphore(self) -> threading.BoundedSemaphore:
+        with self._semaphores_lock:
+            if self.model not in self._model_semaphores:
+                self._model_semaphores[self.model] = threading.BoundedSemaphore(self.max_concurrency)
+            return self._model_semaphores[self.model]
+
+    def _record_attempt(self, attempt: int, outcome: str, latency: float, prompt_length: int, delay: float = 0.0):
+        metric = {
+            "model": self.model,
+            "attempt": attempt,
+            "outcome": outcome,
+            "latency": round(latency, 3),
+            "prompt_length": prompt_length,
+            "next_delay": round(delay, 3),
+        }
+        self.attempt_metrics.append(metric)
+        logger.info(f"[LLM metrics] {metric}")
+
+    def _strip_code_block(self, content: str) -> str:
+        lines = content.split('\n')
+        if len(lines) >= 2 and lines[0].startswith('```') and lines[-1].strip() == '```':
+            # Remove the first and last line
+            content = '\n'.join(lines[1:-1])
+        return content
+
+    def get_response(self, prompt: str, remove_code_block: bool = False, use_cache: bool = False) -> str:
+        # キャッシュはLLM_CACHE_ENABLEDが有効で、呼び出し側がuse_cache=Trueを指定した場合のみ使う
+        cache_key = None
+        if use_cache and self.cache is not None:
+            cache_key = make_cache_key(self.model, prompt, remove_code_block=remove_code_block)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        content = self._call_with_retries(prompt, self._complete)
+        if remove_code_block:
+            content = self._strip_code_block(content)
+        if cache_key is not None:
+            self.cache.set(cache_key, content)
+        return content
+
+    def build_prompt(self, template: str, sections: List[PromptSection]) -> str:
+        """テンプレートにセクションを埋め込み、優先度の低いセクションから縮めてコンテキスト長に収める"""
+        return fit_sections(template, sections, self.prompt_budget)
+
+    def get_response_stream(self, prompt: str, remove_code_block: bool = False, use_cache: bool = False) -> Iterator[str]:
+        """レスポンスをチャンクごとに返す（remove_code_blockの場合はコードブロックを逐次取り除く）"""
+        cache_key = None
+        if use_cache and self.cache is not None:
+            cache_key = make_cache_key(self.model, prompt, remove_code_block=remove_code_block)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+
+        started_at = time.monotonic()
+        # 最初のチャンクを受け取るまでを1回の試行とし、失敗した場合は再試行する
+        # （出力を始めた後は、重複して出力しないように再試行しない）
+        semaphore, stream, first_chunk = self._call_with_retries(prompt, self._open_stream)
+        ttfb = time.monotonic() - started_at
+        logger.info(f"[LLM metrics] 最初のチャンクを受信しました (TTFB: {ttfb:.2f}秒)")
+
+        stripper = CodeFenceStripper() if remove_code_block else None
+        received = []
+        try:
+            for chunk in self._chain_first(first_chunk, stream):
+                received.append(chunk)
+                text = stripper.feed(chunk) if stripper else chunk
+                if text:
+                    yield text
+            if stripper:
+                text = stripper.finish()
+                if text:
+                    yield text
+        finally:
+            semaphore.release()
+
+        content = "".join(received).strip()
+        if remove_code_block:
+            content = self._strip_code_block(content)
+        metric = {
+            "model": self.model,
+            "outcome": "stream",
+            "ttfb": round(ttfb, 3),
+            "latency": round(time.monotonic() - started_at, 3),
+            "response_length": len(content),
+        }
+        self.attempt_metrics.append(metric)
+        logger.info(f"[LLM metrics] {metric}")
+        if cache_key is not None:
+            self.cache.set(cache_key, content)
+
+    @staticmethod
+    def _chain_first(first_chunk: str, stream: Iterator[str]) -> Iterator[str]:
+        yield first_chunk
+        yield from stream
+
+    def _complete(self, prompt: str, timeout: float) -> str:
+        with self._model_semaphore():
+            response = completion(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                timeout=timeout
+            )
+        return response.choices[0].message.content.strip()
 
-    def get_response(self, prompt: str, remove_code_block: bool = False) -> str:
+    def _open_stream(self, prompt: str, timeout: float):
+        """ストリーミングを開始し、最初のチャンクまで受け取る（実行枠はストリームの終わりまで確保する）"""
+        semaphore = self._model_semaphore()
+        semaphore.acquire()
+        try:
+            response = completion(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                stream=True,
+                timeout=timeout
+            )
+            stream = iter_stream_text(response)
+            first_chunk = next(stream, "")
+        except Exception:
+            semaphore.release()
+            raise
+        return semaphore, stream, first_chunk
+
+    def _call_with_retries(self, prompt: str, call: Callable):
         current_prompt = prompt
-        for attempt in range(self.max_retries):
+        # 送信前にトークン数を見積もり、コンテキスト長を超える場合は行単位で縮める
+        fitted_prompt = fit_prompt(current_prompt, self.prompt_budget)
+        if fitted_prompt is not None:
+            logger.warning(f"プロンプトが上限 {self.prompt_budget} トークンを超えるため送信前に縮めました: "
+                           f"{count_tokens(current_prompt)} -> {count_tokens(fitted_prompt)} トークン")
+            current_prompt = fitted_prompt
+        started_at = time.monotonic()
+        for attempt in range(1, self.max_retries + 1):
+            # 1回の呼び出しが止まっても全体の期限を超えないよう、残り時間をタイムアウトとして渡す
+            remaining = self.retry_policy.remaining(started_at)
+            if remaining <= 0:
+                raise TimeoutError(f"再試行の期限（{self.retry_policy.deadline}秒）を超えました")
+            attempt_started_at = time.monotonic()
             try:
-                response = completion(
-                    model=self.model,
-                    messages=[{"role": "user", "content": current_prompt}]
-                )
-                content = response.choices[0].message.content.strip()
-                
-                if remove_code_block:
-                    lines = content.split('\n')
-                    if len(lines) >= 2 and lines[0].startswith('```') and lines[-1].strip() == '```':
-                        # Remove the first and last line
-                        content = '\n'.join(lines[1:-1])
-                
-                return content
+                result = call(current_prompt, remaining)
+                self._record_attempt(attempt, "success", time.monotonic() - attempt_started_at, len(current_prompt))
+                return result
             except Exception as e:
-                logger.error(f"LLMからのレスポンス取得中にエラーが発生しました (試行 {attempt + 1}/{self.max_retries}): {str(e)}")
-                if attempt < self.max_retries - 1:
-                    current_prompt = current_prompt[:int(len(current_prompt) * 0.5)]
+                kind = classify_error(e)
+                latency = time.monotonic() - attempt_started_at
+                logger.error(f"LLMからのレスポンス取得中にエラーが発生しました (試行 {attempt}/{self.max_retries}, 分類: {kind}): {str(e)}")
+                if kind == FATAL or attempt == self.max_retries:
+                    self._record_attempt(attempt, kind, latency, len(current_prompt))
+                    raise
+
+                if kind == CONTEXT_OVERFLOW:
+                    # コンテキスト長を超えた場合のみプロンプトを短縮し、待たずに再試行する
+                    delay = 0.0
+                    current_prompt = truncate_prompt(current_prompt, self.retry_policy.truncate_ratio)
                     num_lines = current_prompt.count('\n') + 1
                     logger.info(f"プロンプトを短縮しました。新しい長さ: {len(current_prompt)} 文字, {num_lines} 行")
-                    time.sleep(self.retry_delay)
                 else:
+                    delay = self.retry_policy.backoff(attempt, get_retry_after(e))
+                self._record_attempt(attempt, kind, latency, len(current_prompt), delay)
+
+                if self.retry_policy.remaining(started_at) < delay:
+                    logger.error(f"再試行の期限（{self.retry_policy.deadline}秒）を超えるため中止します")
                     raise
+                logger.info(f"{delay:.1f}秒後に再試行します")
+                time.sleep(delay)
+
+    def get_responses(self, prompts: List[str], remove_code_block: bool = False, use_cache: bool = False) -> List[str]:
+        """複数のプロンプトを並列に処理し、プロンプトと同じ順序でレスポンスを返す"""
+        return list(self.iter_responses(prompts, remove_code_block, use_cache))
+
+    def iter_responses(self, prompts: List[str], remove_code_block: bool = False, use_cache: bool = False) -> Iterator[str]:
+        """複数のプロンプトを並列に処理し、レスポンスをプロンプトの順序で揃ったものから返す"""
+        if not prompts:
+            return
+        logger.info(f"{len(prompts)} 件のプロンプトを並列に処理します (最大同時実行数: {self.max_concurrency})")
+        started_at = time.monotonic()
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(prompts))) as executor:
+            yield from executor.map(lambda prompt: self.get_response(prompt, remove_code_block, use_cache), prompts)
+        logger.info(f"{len(prompts)} 件のレスポンスを取得しました ({time.monotonic() - started_at:.1f}秒)")
 
     def apply_diff(self, original_content: str, diff: str) -> str:
-        prompt = f"""```diff
+        return self.get_response(self._apply_diff_prompt(original_content, diff))
+
+    def apply_diffs(self, items: List[tuple]) -> List[str]:
+        """(元のファイル内容, diff) のリストにdiffを並列に適用する"""
+        return self.get_responses([self._apply_diff_prompt(original_content, diff) for original_content, diff in items])
+
+    def _apply_diff_prompt(self, original_content: str, diff: str) -> str:
+        return f"""```diff
         {diff}
         ```
 
@@ -47,11 +239,23 @@ class LLMService:
         ```
         {original_content}
         ```"""
-        
-        return self.get_response(prompt)
 
-    def analyze_issue(self, issue_title: str, issue_body: str, existing_labels: list) -> str:
-        prompt = f"""
+    def apply_hunk_to_excerpt(self, excerpt: str, hunk: str) -> str:
+        """ファイルの一部分（ハンクの周辺の行）にだけdiffのハンクを適用する"""
+        prompt = f"""```diff
+{hunk}```
+
+上記のdiffのハンクを、以下のファイルの一部分に適用してください。
+行番号やコンテキストが完全には一致しない場合は、意図に沿うように適用してください。
+適用後の一部分だけを、インデントを保ったままコードブロックで出力してください。説明は不要です。
+ファイルの一部分:
+```
+{excerpt}
+```"""
+        return self.get_response(prompt, remove_code_block=True)
+
+    def analyze_issue(self, issue_title: str, issue_body: str, existing_labels: list, use_cache: bool = False) -> str:
+        prompt = self.build_prompt("""
         以下のGitHubイシューを分析し、適切なラベルを提案してください：
 
         タイトル: {issue_title}
@@ -60,12 +264,16 @@ class LLMService:
         {issue_body}
 
         既存のラベルのリスト:
-        {', '.join(existing_labels)}
+        {existing_labels}
 
         上記の既存のラベルのリストから、このイシューに最も適切なラベルを最大3つ選んでください。
         選んだラベルをカンマ区切りで提案してください。既存のラベルにない新しいラベルは提案しないでください。
         
         回答は以下の形式でラベルのみを提供してください：
         label1, label2, label3
-        """
-        return self.get_response(prompt)
+        """, [
+            PromptSection("issue_title", issue_title, priority=20, required=True),
+            PromptSection("existing_labels", ', '.join(existing_labels), priority=20, required=True),
+            PromptSection("issue_body", issue_body or "", priority=0),
+        ])
+        return self.get_response(prompt, use_cache=use_cache)
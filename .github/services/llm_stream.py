@@ -0,0 +1,60 @@
+from typing import Iterator, List
+
+
+class CodeFenceStripper:
+    """
+    ストリーミング中のレスポンスから、全体を囲むコードブロック（```）を逐次取り除く
+
+    最初の行が ``` で始まる場合はその行を出力せず、最後の行は応答の終わりまで保留して
+    ``` だけの行であれば取り除きます（LLMService._strip_code_block と同じ結果になります）。
+    ただし、最初の行が ``` で最後の行が ``` でない場合、最初の行は既に取り除かれています。
+    """
+    def __init__(self):
+        self._head: List[str] = []
+        self._head_done = False
+        self._fenced = False
+        # 最後の改行以降の、まだ出力していない部分
+        self._tail = ""
+
+    def feed(self, chunk: str) -> str:
+        """チャンクを受け取り、出力できる部分を返す"""
+        if not self._head_done:
+            self._head.append(chunk)
+            text = "".join(self._head).lstrip()
+            if "\n" not in text:
+                return ""
+            self._head_done = True
+            first_line, _, rest = text.partition("\n")
+            if first_line.startswith("```"):
+                self._fenced = True
+                chunk = rest
+            else:
+                chunk = text
+        text = self._tail + chunk
+        # 空白でない最後の行とその直前の改行（と末尾の空白）は、閉じの ``` かどうかが分かるまで保留する
+        cut = text.rstrip().rfind("\n")
+        if cut < 0:
+            self._tail = text
+            return ""
+        self._tail = text[cut:]
+        return text[:cut]
+
+    def finish(self) -> str:
+        """応答の終わりに、保留していた部分を返す"""
+        if not self._head_done:
+            return "".join(self._head).strip()
+        tail = self._tail.rstrip()
+        self._tail = ""
+        if self._fenced and tail.strip() == "```":
+            return ""
+        return tail
+
+
+def iter_stream_text(stream) -> Iterator[str]:
+    """litellmのストリーミングレスポンスからテキストのチャンクを取り出す"""
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        content = chunk.choices[0].delta.content
+        if content:
+            yield content
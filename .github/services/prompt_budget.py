@@ -0,0 +1,174 @@
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Optional
+
+from loguru import logger
+
+try:
+    import tiktoken
+except ImportError:  # tiktokenがない環境では文字数からの概算にフォールバック
+    tiktoken = None
+
+# litellmにコンテキスト長が登録されていないモデルの既定値（プレフィックスで判定）
+DEFAULT_CONTEXT_WINDOWS = {
+    "gemini/": 1_000_000,
+    "claude": 200_000,
+}
+FALLBACK_CONTEXT_WINDOW = 128_000
+
+OMITTED_MARKER = "\n...（以下 {lines} 行を省略）\n"
+TRUNCATED_MARKER = "\n...（以下を省略）\n"
+
+
+class PromptBudgetError(ValueError):
+    """プロンプトを上限に収めようとすると、送信する内容が残らない場合のエラー"""
+
+
+@dataclass
+class PromptSection:
+    """プロンプトの一部分（priorityが小さいものから先に縮める）"""
+    name: str
+    text: str
+    priority: int = 0
+    # Trueのセクションは、他のセクションを全て削っても収まらない場合のみ縮める
+    required: bool = False
+
+
+@lru_cache()
+def _encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # エンコーディングのダウンロードに失敗した場合など
+        logger.warning(f"tiktokenを使用できないため文字数から概算します: {str(e)}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """トークン数を数える（tiktokenがなければ文字数から概算する）"""
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return estimate_tokens(text)
+
+
+def estimate_tokens(text: str) -> int:
+    """文字数からトークン数を概算する（英数字は約4文字、日本語などは約1文字で1トークン）"""
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return ascii_chars // 4 + (len(text) - ascii_chars) + 1
+
+
+def get_context_window(model: str, override: int = 0) -> int:
+    """モデルの入力コンテキスト長（トークン）を取得する"""
+    if override:
+        return override
+    try:
+        import litellm
+        max_input_tokens = litellm.get_model_info(model).get("max_input_tokens")
+        if max_input_tokens:
+            return max_input_tokens
+    except Exception:
+        pass
+    for prefix, window in DEFAULT_CONTEXT_WINDOWS.items():
+        if model.startswith(prefix):
+            return window
+    return FALLBACK_CONTEXT_WINDOW
+
+
+def get_prompt_budget(context_window: int, output_reserve: int) -> int:
+    """
+    プロンプトに使えるトークン数（コンテキスト長から出力用の予約分を引いたもの）
+
+    コンテキスト長の小さいモデルでは予約分がコンテキスト長の大半を占めてしまうため、
+    予約分はコンテキスト長の1/4までに抑える
+    """
+    return context_window - min(output_reserve, context_window // 4)
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """テキストの先頭から max_tokens トークンに収まる部分を、トークンの境界で切り出す"""
+    if max_tokens <= 0:
+        return ""
+    encoding = _encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        return encoding.decode(tokens[:max_tokens]).rstrip("\ufffd")
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(text[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low]
+
+
+def shrink_text(text: str, max_tokens: int) -> str:
+    """
+    行の途中で切らないように、先頭から max_tokens に収まる行だけを残す
+
+    最初の行だけで max_tokens を超える場合（改行のない長い本文など）は、その行をトークンの境界で切る
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+    lines = text.split("\n")
+    kept: List[str] = []
+    used = count_tokens(OMITTED_MARKER.format(lines=len(lines)))
+    for line in lines:
+        line_tokens = count_tokens(line + "\n")
+        if used + line_tokens > max_tokens:
+            break
+        kept.append(line)
+        used += line_tokens
+    if not kept:
+        head = truncate_tokens(lines[0], max_tokens - count_tokens(TRUNCATED_MARKER))
+        return head + TRUNCATED_MARKER if head.strip() else ""
+    return "\n".join(kept) + OMITTED_MARKER.format(lines=len(lines) - len(kept))
+
+
+def fit_sections(template: str, sections: List[PromptSection], budget: int) -> str:
+    """
+    テンプレートの {セクション名} にセクションを埋め込み、budgetトークンに収まるように
+    優先度の低いセクションから縮める（それでも足りなければ丸ごと省略する）
+    """
+    tokens = {section.name: count_tokens(section.text) for section in sections}
+    texts = {section.name: section.text for section in sections}
+    # セクションの本文に含まれる {...} を置換しないように、テンプレートの位置だけを1回で置換する
+    placeholder = re.compile(r"\{(" + "|".join(re.escape(name) for name in texts) + r")\}")
+    fixed = placeholder.sub("", template)
+    total = count_tokens(fixed) + sum(tokens.values())
+
+    if total > budget:
+        logger.info(f"[Prompt budget] 推定 {total} トークンが上限 {budget} を超えるため縮めます")
+        order = sorted(sections, key=lambda s: (s.required, s.priority))
+        for section in order:
+            if total <= budget:
+                break
+            allowed = max(0, tokens[section.name] - (total - budget))
+            texts[section.name] = shrink_text(section.text, allowed)
+            new_tokens = count_tokens(texts[section.name])
+            total -= tokens[section.name] - new_tokens
+            if texts[section.name]:
+                logger.info(f"[Prompt budget] {section.name}: {tokens[section.name]} -> {new_tokens} トークン")
+            else:
+                logger.info(f"[Prompt budget] {section.name}: 省略しました ({tokens[section.name]} トークン)")
+            tokens[section.name] = new_tokens
+
+        emptied = [section.name for section in sections if section.required and section.text and not texts[section.name]]
+        if emptied:
+            raise PromptBudgetError(f"上限 {budget} トークンに収めると必須のセクションが残りません: {', '.join(emptied)}")
+
+    return placeholder.sub(lambda match: texts[match.group(1)], template)
+
+
+def fit_prompt(prompt: str, budget: int) -> Optional[str]:
+    """セクション分けされていないプロンプトを行単位で budget に収める（収まっていればNone）"""
+    if count_tokens(prompt) <= budget:
+        return None
+    fitted = shrink_text(prompt, budget)
+    if not fitted.strip():
+        raise PromptBudgetError(f"上限 {budget} トークンに収めるとプロンプトが残りません ({count_tokens(prompt)} トークン)")
+    return fitted
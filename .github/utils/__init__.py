@@ -1 +1 @@
-from .diff_utils import DiffUtils, process_diffs, save_files, create_comment
+from .diff_utils import DiffUtils, DiffProcessingError, process_diffs, save_files, create_comment
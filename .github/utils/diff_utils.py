@@ -1,34 +1,77 @@
+import bisect
+import os
 import re
-from typing import Optional, Dict, List
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, Optional, Dict, List, Tuple
 from bs4 import BeautifulSoup
 import markdown
 from loguru import logger
 
+# Python-Markdownのfenced_code拡張と同じ規則のコードブロックの開始行
+# （行頭の ``` / ~~~ の後に、{.lang} または .lang / lang と hl_lines="..." が続く）
+FENCE_OPEN_PATTERN = re.compile(
+    r'^(?P<fence>~{3,}|`{3,})[ ]*'
+    r'(?:\{(?P<attrs>[^\n]*)\}|\.?(?P<lang>[\w#.+-]*)[ ]*(?:hl_lines=(?P<quot>"|\')(?:.*?)(?P=quot)[ ]*)?)$'
+)
+# コードブロックの終了行（開始行と同じ長さのフェンスと空白のみ）
+FENCE_CLOSE_PATTERN = re.compile(r'^(~{3,}|`{3,})[ ]*$')
+
 class DiffUtils:
     @staticmethod
     def convert_md_to_html(md_content: str) -> str:
         return markdown.markdown(md_content, extensions=['fenced_code', 'codehilite'])
 
+    @staticmethod
+    def iter_fenced_blocks(md_content: str) -> Iterator[Tuple[Optional[str], str]]:
+        """
+        Markdownのフェンス付きコードブロックを (言語, 内容) として順に返す
+
+        HTMLへの変換やハイライトを行わず、行を1回走査するだけで取り出します。
+        終了行が見つからない開始行は、fenced_code拡張と同様にコードブロックとして扱いません。
+        """
+        lines = md_content.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+        # 終了行になりうる行の位置をフェンスごとに集めておき、開始行から次の終了行を二分探索する
+        closings: Dict[str, List[int]] = {}
+        for index, line in enumerate(lines):
+            if line[:1] in ("`", "~"):
+                match = FENCE_CLOSE_PATTERN.match(line)
+                if match:
+                    closings.setdefault(match.group(1), []).append(index)
+
+        index = 0
+        while index < len(lines):
+            line = lines[index]
+            match = FENCE_OPEN_PATTERN.match(line) if line[:1] in ("`", "~") else None
+            if match:
+                candidates = closings.get(match.group("fence"), [])
+                position = bisect.bisect_right(candidates, index)
+                if position < len(candidates):
+                    end = candidates[position]
+                    lang = match.group("lang") or None
+                    if match.group("attrs") is not None:
+                        classes = [token[1:] for token in match.group("attrs").split() if token.startswith(".")]
+                        lang = classes[0] if classes else None
+                    yield lang, "".join(code_line + "\n" for code_line in lines[index + 1:end])
+                    index = end + 1
+                    continue
+            index += 1
+
     @staticmethod
     def extract_diff(comment_body: str) -> Optional[Dict[str, str]]:
         logger.info("コメント本文から diff を抽出しています...")
-        html_content = DiffUtils.convert_md_to_html(comment_body)
-        
-        soup = BeautifulSoup(html_content, 'html.parser')
-        diff_blocks = soup.find_all('pre', class_='codehilite')
+        diff_blocks = [code for lang, code in DiffUtils.iter_fenced_blocks(comment_body) if lang == "diff"]
         
         if not diff_blocks:
             logger.error("diff が見つかりません。")
             return None
         
         diffs = {}
-        for diff_block in diff_blocks:
-            diff_code = diff_block.find('code', class_='language-diff')
-            if diff_code:
-                diff_content = diff_code.get_text() + "\n"
-                file_name = DiffUtils.extract_file_name(diff_content)
-                if file_name:
-                    diffs[file_name] = diff_content
+        for diff_code in diff_blocks:
+            diff_content = diff_code + "\n"
+            file_name = DiffUtils.extract_file_name(diff_content)
+            if file_name:
+                diffs[file_name] = diff_content
         
         if not diffs:
             logger.error("有効な diff が見つかりません。")
@@ -55,22 +98,70 @@ class DiffUtils:
                 return code.get_text().strip()
         return ""
 
+class DiffProcessingError(Exception):
+    """一部のファイルの処理に失敗した場合のエラー（成功したファイルの結果も保持する）"""
+    def __init__(self, errors: Dict[str, Exception], results: Dict[str, str]):
+        super().__init__("、".join(f"{file_name}: {error}" for file_name, error in errors.items()))
+        self.errors = errors
+        self.results = results
+
+def run_per_file(items: Dict[str, str], func: Callable[[str, str], str], max_workers: int = 4) -> Tuple[Dict[str, str], Dict[str, Exception]]:
+    """
+    ファイルごとの処理を上限付きのスレッドプールで並列に実行する
+
+    Returns:
+        Tuple[Dict[str, str], Dict[str, Exception]]: 成功したファイルの結果と、失敗したファイルのエラー
+        （どちらも items と同じ順序）
+    """
+    results: Dict[str, str] = {}
+    errors: Dict[str, Exception] = {}
+    if not items:
+        return results, errors
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as executor:
+        futures = {file_name: executor.submit(func, file_name, value) for file_name, value in items.items()}
+        for file_name, future in futures.items():
+            try:
+                results[file_name] = future.result()
+            except Exception as e:
+                logger.error(f"{file_name} の処理中にエラーが発生しました: {str(e)}")
+                errors[file_name] = e
+    return results, errors
+
+def write_file_atomic(file_name: str, content: str) -> None:
+    """一時ファイルに書き込んでから置き換え、書き込み途中の内容が残らないようにする"""
+    directory = os.path.dirname(file_name) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(file_name)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        if os.path.exists(file_name):
+            os.chmod(tmp_path, os.stat(file_name).st_mode)
+        os.replace(tmp_path, file_name)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
 def process_diffs(diffs: Dict[str, str], llm_service) -> Dict[str, str]:
-    modified_contents = {}
-    for file_name, diff in diffs.items():
+    def apply(file_name: str, diff: str) -> str:
         with open(file_name, "r", encoding="utf-8") as f:
             original_content = f.read()
         modified_content = llm_service.apply_diff(original_content, diff)
         html_content = DiffUtils.convert_md_to_html(modified_content)
         extracted_content = DiffUtils.extract_code_block_content(html_content)
-        modified_contents[file_name] = extracted_content if extracted_content else modified_content
+        return extracted_content if extracted_content else modified_content
+
+    # ファイルごとに並列に処理する（結果は diffs と同じ順序）
+    modified_contents, errors = run_per_file(diffs, apply, llm_service.max_concurrency)
+    if errors:
+        raise DiffProcessingError(errors, modified_contents)
     return modified_contents
 
 def save_files(modified_contents: Dict[str, str]) -> List[str]:
     saved_files = []
     for file_name, content in modified_contents.items():
-        with open(file_name, "w", encoding="utf-8") as f:
-            f.write(content)
+        write_file_atomic(file_name, content)
         logger.info(f"{file_name} に変更を保存しました。")
         saved_files.append(file_name)
     return saved_files
@@ -0,0 +1,179 @@
+import re
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Tuple
+
+from loguru import logger
+
+HUNK_HEADER_PATTERN = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+# コンテキスト行を前後から最大何行まで削って照合を試みるか（patchコマンドのfuzzに相当）
+MAX_FUZZ = 2
+# LLMにフォールバックする時に、ハンクの前後に含める行数
+LLM_WINDOW_MARGIN = 10
+
+
+@dataclass
+class Hunk:
+    """unified diffの1つのハンク"""
+    old_start: int
+    new_start: int
+    lines: List[Tuple[str, str]] = field(default_factory=list)
+
+    @property
+    def old_lines(self) -> List[str]:
+        return [text for tag, text in self.lines if tag in (" ", "-")]
+
+    @property
+    def new_lines(self) -> List[str]:
+        return [text for tag, text in self.lines if tag in (" ", "+")]
+
+    def to_text(self) -> str:
+        old, new = self.old_lines, self.new_lines
+        header = f"@@ -{self.old_start},{len(old)} +{self.new_start},{len(new)} @@"
+        return "\n".join([header] + [tag + text for tag, text in self.lines]) + "\n"
+
+    def trimmed(self, fuzz: int) -> "Hunk":
+        """
+        前後のコンテキスト行をそれぞれ最大 fuzz 行削ったハンクを返す
+
+        GNU patchと同様に、各側で削るのはその側のコンテキスト行の数 - 1 行までとし、
+        照合に使う行（コンテキスト行か「-」の行）が必ず残るようにする
+        """
+        lines = list(self.lines)
+        tags = [tag for tag, _ in lines]
+        leading = next((i for i, tag in enumerate(tags) if tag != " "), len(tags))
+        trailing = next((i for i, tag in enumerate(reversed(tags)) if tag != " "), len(tags))
+        start = max(0, min(fuzz, leading - 1))
+        end = max(start, len(lines) - max(0, min(fuzz, trailing - 1)))
+        return Hunk(self.old_start + start, self.new_start + start, lines[start:end])
+
+
+def parse_hunks(diff_content: str) -> List[Hunk]:
+    """unified diffからハンクを取り出す（ファイルのヘッダー行は無視する）"""
+    hunks: List[Hunk] = []
+    current: Optional[Hunk] = None
+    for line in diff_content.splitlines():
+        match = HUNK_HEADER_PATTERN.match(line)
+        if match:
+            current = Hunk(int(match.group(1)), int(match.group(3)))
+            hunks.append(current)
+        elif current is None or line.startswith(("--- ", "+++ ", "diff ", "index ")):
+            continue
+        elif line.startswith("\\"):
+            # "\ No newline at end of file"
+            continue
+        elif line[:1] in (" ", "-", "+"):
+            current.lines.append((line[0], line[1:]))
+        elif line == "":
+            # 末尾の空白が削られた空のコンテキスト行
+            current.lines.append((" ", ""))
+    return [hunk for hunk in hunks if hunk.lines]
+
+
+def _normalize(line: str) -> str:
+    return " ".join(line.split())
+
+
+def _find_block(lines: List[str], block: List[str], hint: int, lower: int, loose: bool) -> Optional[int]:
+    """block と一致する位置を hint から近い順に探す（lower より前は探さない）"""
+    if not block:
+        return max(lower, min(hint, len(lines)))
+    size = len(block)
+    target = [_normalize(line) for line in block] if loose else block
+    compare = (lambda i: [_normalize(line) for line in lines[i:i + size]] == target) if loose \
+        else (lambda i: lines[i:i + size] == target)
+    last = len(lines) - size
+    hint = max(lower, min(hint, last))
+    for distance in range(0, max(hint - lower, last - hint) + 1):
+        for i in (hint - distance, hint + distance) if distance else (hint,):
+            if lower <= i <= last and compare(i):
+                return i
+    return None
+
+
+def _locate(lines: List[str], hunk: Hunk, hint: int, lower: int) -> Optional[Tuple[int, Hunk, bool]]:
+    """ハンクを適用する位置を、完全一致 → 空白を無視 → コンテキストを削る の順に探す"""
+    for fuzz in range(MAX_FUZZ + 1):
+        candidate = hunk.trimmed(fuzz) if fuzz else hunk
+        if fuzz and len(candidate.lines) == len(hunk.lines):
+            break
+        if hunk.old_lines and not candidate.old_lines:
+            # 照合する行が残らない場合は、記載された行番号に盲目的に挿入しない
+            break
+        for loose in (False, True):
+            position = _find_block(lines, candidate.old_lines, hint + (candidate.old_start - hunk.old_start), lower, loose)
+            if position is not None:
+                return position, candidate, loose
+    return None
+
+
+def _replacement(lines: List[str], position: int, hunk: Hunk) -> List[str]:
+    """置き換え後の行（コンテキスト行はファイル側の行をそのまま使い、インデントなどを保つ）"""
+    result: List[str] = []
+    index = position
+    for tag, text in hunk.lines:
+        if tag == " ":
+            result.append(lines[index])
+            index += 1
+        elif tag == "-":
+            index += 1
+        else:
+            result.append(text)
+    return result
+
+
+def apply_unified_diff(
+    content: str,
+    diff_content: str,
+    llm_fallback: Optional[Callable[[str, str], str]] = None,
+) -> Tuple[str, List[Hunk]]:
+    """
+    unified diffをファイルの内容に適用する
+
+    各ハンクは、記載された行番号の付近から順に、完全一致・空白を無視した一致・前後のコンテキストを
+    削った一致で位置を探します。それでも見つからないハンクは、llm_fallback が指定されていれば
+    ハンクの周辺の行だけを llm_fallback(周辺の行, ハンク) に渡し、返された内容で置き換えます。
+
+    Returns:
+        Tuple[str, List[Hunk]]: 適用後の内容と、適用できなかったハンク
+    """
+    trailing_newline = content.endswith("\n") or not content
+    lines = content.splitlines()
+    offset = 0
+    lower = 0
+    failed: List[Hunk] = []
+
+    for number, hunk in enumerate(parse_hunks(diff_content), start=1):
+        hint = max(0, hunk.old_start - 1 + offset)
+        located = _locate(lines, hunk, hint, lower)
+        if located is not None:
+            position, applied, loose = located
+            replacement = _replacement(lines, position, applied)
+            size = len(applied.old_lines)
+            if position != hint or loose or applied is not hunk:
+                logger.info(
+                    f"ハンク {number} を {position + 1} 行目に適用しました "
+                    f"(ずれ: {position - hint} 行, 空白を無視: {loose}, コンテキストの削減: {applied is not hunk})"
+                )
+        elif llm_fallback is not None and lower < len(lines):
+            # ハンクの周辺の行だけをLLMに渡して変更を適用してもらう
+            # （行番号がファイルの末尾を超えている場合も、ファイルの末尾の行を渡す）
+            start = min(hint, max(lower, len(lines) - len(hunk.old_lines)))
+            position = max(lower, start - LLM_WINDOW_MARGIN)
+            size = min(len(lines), start + len(hunk.old_lines) + LLM_WINDOW_MARGIN) - position
+            window = "\n".join(lines[position:position + size])
+            logger.info(f"ハンク {number} が一致しないため、{position + 1}〜{position + size} 行目だけをLLMで変更します。")
+            replacement = llm_fallback(window, hunk.to_text()).split("\n")
+        else:
+            logger.warning(f"ハンク {number} を適用できませんでした。")
+            failed.append(hunk)
+            continue
+
+        lines[position:position + size] = replacement
+        offset += len(replacement) - size
+        lower = position + len(replacement)
+
+    result = "\n".join(lines)
+    if trailing_newline and lines:
+        result += "\n"
+    return result, failed
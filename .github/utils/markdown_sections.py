@@ -0,0 +1,65 @@
+import hashlib
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+
+HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+FENCE_PATTERN = re.compile(r"^\s*(```+|~~~+)")
+JAPANESE_PATTERN = re.compile(r"[぀-ヿ㐀-䶿一-鿿ｦ-ﾟ]")
+
+
+@dataclass
+class MarkdownSection:
+    """見出しから次の見出しの直前までの部分（最初の見出しより前の部分は heading=None）"""
+    heading: Optional[str]
+    level: int
+    text: str
+
+    @property
+    def hash(self) -> str:
+        return hashlib.sha256(self.text.encode("utf-8")).hexdigest()
+
+    @property
+    def title(self) -> str:
+        return self.heading or "(冒頭)"
+
+
+def split_sections(content: str, max_level: int = 6) -> List[MarkdownSection]:
+    """
+    Markdownを見出しごとのセクションに分割する
+
+    コードブロック（``` / ~~~）の中の「#」は見出しとして扱わないため、コードブロックが
+    セクションの途中で分かれることはありません。全セクションの text を連結すると元の内容に戻ります。
+    """
+    sections: List[MarkdownSection] = []
+    current: List[str] = []
+    heading, level = None, 0
+    fence = None
+    for line in content.splitlines(keepends=True):
+        fence_match = FENCE_PATTERN.match(line)
+        if fence_match:
+            marker = fence_match.group(1)
+            if fence is None:
+                fence = marker
+            elif marker[0] == fence[0] and len(marker) >= len(fence):
+                fence = None
+        elif fence is None:
+            heading_match = HEADING_PATTERN.match(line.rstrip("\n"))
+            if heading_match and len(heading_match.group(1)) <= max_level:
+                if current:
+                    sections.append(MarkdownSection(heading, level, "".join(current)))
+                current = []
+                heading, level = heading_match.group(2), len(heading_match.group(1))
+        current.append(line)
+    if current:
+        sections.append(MarkdownSection(heading, level, "".join(current)))
+    return sections
+
+
+def keep_trailing_whitespace(source: str, generated: str) -> str:
+    """セクション間の空行が保たれるように、元のセクションの末尾の空白を生成した内容にも付ける"""
+    return generated.rstrip() + source[len(source.rstrip()):]
+
+
+def contains_japanese(text: str) -> bool:
+    return JAPANESE_PATTERN.search(text) is not None
@@ -12,11 +12,14 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnableParallel
 from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models import BaseChatModel
 from logger_setup import setup_logger, print_tutorial_header
+from result_sink import ResultSink, invoke_with_sink
+from prompt_packing import PackedPromptRunnable
 import os
 import time
 import json
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 # ロガーのセットアップ
 logger = setup_logger()
@@ -103,16 +106,13 @@ class DebugCallbackHandler(BaseCallbackHandler):
         }
         logger.error(f"[Debug] チェーンエラー:\n{format_dict(error_info)}")
 
-def create_basic_parallel():
+def create_basic_prompts() -> Dict[str, ChatPromptTemplate]:
     """
-    基本的な並列チェーンを作成します。
+    並列チェーンで使うプロンプトを作成します。
 
     Returns:
-        RunnableParallel: 並列処理を行うチェーン
+        Dict[str, ChatPromptTemplate]: ブランチ名とプロンプトの辞書
     """
-    logger.info("基本的な並列チェーンを作成中")
-    
-    # プロンプトの作成
     description_prompt = ChatPromptTemplate.from_messages([
         ("human", "{animal}について1文で説明してください。")
     ])
@@ -131,25 +131,71 @@ def create_basic_parallel():
     }
     logger.debug(f"[Debug] 豆知識用プロンプトを作成:\n{format_dict(prompt_info)}")
     
+    return {"description": description_prompt, "fun_fact": fact_prompt}
+
+def create_basic_parallel(model: Optional[BaseChatModel] = None):
+    """
+    基本的な並列チェーンを作成します。
+
+    Args:
+        model: 使用するチャットモデル（省略時はChatOpenAI）
+
+    Returns:
+        RunnableParallel: 並列処理を行うチェーン
+    """
+    logger.info("基本的な並列チェーンを作成中")
+    
+    # プロンプトの作成
+    prompts = create_basic_prompts()
+    
     # モデルとパーサーの初期化
-    model = ChatOpenAI(
-        temperature=0.7,
-        callbacks=[DebugCallbackHandler()]
-    )
-    logger.debug("[Debug] ChatOpenAIモデルを初期化")
+    if model is None:
+        model = ChatOpenAI(
+            temperature=0.7,
+            callbacks=[DebugCallbackHandler()]
+        )
+        logger.debug("[Debug] ChatOpenAIモデルを初期化")
     
     parser = StrOutputParser()
     logger.debug("[Debug] 文字列パーサーを初期化")
     
     # チェーンの作成
     chain = RunnableParallel(
-        description=description_prompt | model | parser,
-        fun_fact=fact_prompt | model | parser
+        description=prompts["description"] | model | parser,
+        fun_fact=prompts["fun_fact"] | model | parser
     )
     logger.debug("[Debug] 並列チェーンを作成完了")
     
     return chain
 
+def create_packed_basic_parallel(
+    model: Optional[BaseChatModel] = None,
+    pack_size: int = 8
+) -> Dict[str, PackedPromptRunnable]:
+    """
+    パッキングモードの並列チェーンを作成します。
+
+    バッチ実行時に、各ブランチのプロンプトをpack_size件ずつ
+    1回のLLM呼び出しにまとめます。batch_packed_parallelで実行してください。
+
+    Args:
+        model: 使用するチャットモデル（省略時はChatOpenAI）
+        pack_size: 1回の呼び出しにまとめる入力の件数
+
+    Returns:
+        Dict[str, PackedPromptRunnable]: ブランチ名とパッキング用Runnableの辞書
+    """
+    logger.info(f"パッキングモードの並列チェーンを作成中 (pack_size={pack_size})")
+    if model is None:
+        model = ChatOpenAI(
+            temperature=0.7,
+            callbacks=[DebugCallbackHandler()]
+        )
+    return {
+        name: PackedPromptRunnable(prompt, model, pack_size=pack_size)
+        for name, prompt in create_basic_prompts().items()
+    }
+
 def measure_execution_time(func):
     """実行時間を計測するデコレータ"""
     def wrapper(*args, **kwargs):
@@ -162,18 +208,19 @@ def measure_execution_time(func):
     return wrapper
 
 @measure_execution_time
-def execute_parallel_chain(chain, input_data):
+def execute_parallel_chain(chain, input_data, sink: Optional[ResultSink] = None):
     """
     並列チェーンを実行し、実行時間を計測します。
     
     Args:
         chain (RunnableParallel): 実行する並列チェーン
         input_data (dict): 入力データ
+        sink: 結果を列指向の形式で保存するシンク（省略時は保存しない）
     Returns:
         dict: 実行結果
     """
     logger.debug(f"[Debug] 入力データ:\n{format_dict(input_data)}")
-    result = chain.invoke(input_data)
+    result = invoke_with_sink(chain, input_data, sink) if sink is not None else chain.invoke(input_data)
     logger.debug(f"[Debug] 実行結果:\n{format_dict(result)}")
     return result
 
@@ -192,7 +239,14 @@ def main():
     try:
         parallel_chain = create_basic_parallel()
         input_data = {"animal": "象"}
-        result = execute_parallel_chain(parallel_chain, input_data)
+        # RESULT_SINK=<ディレクトリ> で結果を列指向の形式で保存する
+        sink = ResultSink(os.environ["RESULT_SINK"]) if os.getenv("RESULT_SINK") else None
+        try:
+            result = execute_parallel_chain(parallel_chain, input_data, sink=sink)
+        finally:
+            # チェーンが失敗した場合も、バッファに残った結果を書き出す
+            if sink is not None:
+                sink.close()
         
         logger.success("並列処理の結果:")
         logger.success(f"説明: {result['description']}")
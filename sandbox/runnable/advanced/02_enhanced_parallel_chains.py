@@ -3,7 +3,7 @@ LangChainの高度な並列処理と連鎖的実行を示すモジュール
 
 このモジュールでは以下の機能を実装しています：
 1. 複数のLLMチェーンの並列実行
-2. チェーン結果の選択的利用（pick機能）
+2. 前段の結果の受け渡し（RunnablePassthrough.assign）
 3. 結果の組み合わせによる新規タスクの実行
 4. デバッグ情報の構造化出力
 5. パフォーマンス計測
@@ -15,14 +15,18 @@ LangChainの高度な並列処理と連鎖的実行を示すモジュール
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnableParallel, RunnablePassthrough
+from langchain_core.output_parsers import PydanticOutputParser, StrOutputParser
+from langchain_core.exceptions import OutputParserException
+from langchain_core.runnables import Runnable, RunnableLambda, RunnableParallel, RunnablePassthrough
 from langchain_core.callbacks import BaseCallbackHandler
 from logger_setup import setup_logger, print_tutorial_header
+from result_sink import ResultSink, invoke_with_sink
+from model_router import LatencyAwareRouter
+from pydantic import BaseModel, Field
 import os
 import time
 import json
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 # ロガーのセットアップ
 logger = setup_logger()
@@ -95,7 +99,7 @@ class DebugCallbackHandler(BaseCallbackHandler):
         }
         logger.debug(f"[Debug] LLM終了:\n{format_dict(formatted_response)}")
 
-def create_multi_chain():
+def create_multi_chain(model: Optional[Runnable] = None, router: Optional[LatencyAwareRouter] = None):
     """
     複数のチェーンを組み合わせた処理を作成
     
@@ -109,19 +113,28 @@ def create_multi_chain():
     
     チェーンの特徴:
     - 並列実行による効率化
-    - pick機能による必要な情報の選択的利用
+    - 並列部分を1回だけ実行し、その結果にRunnablePassthrough.assignで要約を追加
     - RunnablePassthroughによる入力の受け渡し
     
+    Args:
+        model: 使用するチャットモデル（省略時はChatOpenAI）
+        router: ブランチごとにモデルを選択するルーター（指定時はmodelより優先）
+    
     Returns:
-        RunnableParallel: 構築された複合チェーン
+        RunnableSequence: 構築された複合チェーン（先頭が3つのブランチのRunnableParallel）
     """
     logger.info("複数チェーンの作成を開始")
     
     # 基本的なモデルとパーサーの設定
     # temperature=0.7で適度なランダム性を持たせる
-    model = ChatOpenAI(temperature=0.7, callbacks=[DebugCallbackHandler()])
+    if model is None and router is None:
+        model = ChatOpenAI(temperature=0.7, callbacks=[DebugCallbackHandler()])
     parser = StrOutputParser()
     
+    def branch_model(branch: str) -> Runnable:
+        """ブランチで使うモデルを取得（ルーター指定時はブランチごとに選択）"""
+        return router.for_branch(branch) if router is not None else model
+    
     # 各種プロンプトの作成
     # 異なる視点からの情報を取得するための3つのプロンプト
     description_prompt = ChatPromptTemplate.from_messages([
@@ -148,54 +161,126 @@ def create_multi_chain():
     ])
     
     # Step 1: 基本的な並列チェーンの構築
-    # 3つのプロンプトを同時に実行
+    # 3つのプロンプトを同時に実行し、入力もそのまま次の段に渡す
     base_chain = RunnableParallel(
-        description=description_prompt | model | parser,
-        fun_fact=fact_prompt | model | parser,
-        habitat=habitat_prompt | model | parser
+        description=description_prompt | branch_model("description") | parser,
+        fun_fact=fact_prompt | branch_model("fun_fact") | parser,
+        habitat=habitat_prompt | branch_model("habitat") | parser,
+        animal=RunnablePassthrough()
     )
     
     # Step 2: 要約チェーンの作成
-    summary_chain = summary_prompt | model | parser
+    summary_chain = summary_prompt | branch_model("summary") | parser
     
     # Step 3: 全体のチェーンを組み立て
-    # まず、summaryチェーン用の入力を準備するチェーンを作成
-    summary_input_chain = RunnableParallel(
-        {
-            "description": base_chain.pick("description"),
-            "fun_fact": base_chain.pick("fun_fact"),
-            "animal": RunnablePassthrough()
-        }
-    )
+    # base_chainは1回だけ実行し、その結果（descriptionとfun_fact）から要約を追加する
+    # （キーごとにpickすると、pickのたびにbase_chain全体が再実行される）
+    final_chain = base_chain | RunnablePassthrough.assign(summary=summary_chain)
     
-    # 最終的なチェーンを構築
-    final_chain = RunnableParallel(
+    logger.debug("[Debug] 複数チェーンの作成完了")
+    return final_chain
+
+class AnimalProfile(BaseModel):
+    """
+    1回の構造化出力呼び出しで生成する動物情報のスキーマ
+    
+    description/fun_fact/habitat の各ブランチと、それらに依存する
+    summary を1つのJSONにまとめて生成します。
+    """
+    description: str = Field(min_length=1, description="動物の1文の説明")
+    fun_fact: str = Field(min_length=1, description="面白い豆知識")
+    habitat: str = Field(min_length=1, description="主な生息地")
+    summary: str = Field(min_length=1, description="説明と豆知識を元にした簡潔な要約")
+
+def parse_animal_profile(text: str) -> AnimalProfile:
+    """
+    構造化出力を検証してAnimalProfileに変換
+    
+    Args:
+        text: モデルの応答テキスト（JSON）
+    
+    Returns:
+        AnimalProfile: 検証済みの動物情報
+    
+    Raises:
+        OutputParserException: JSONの解析やスキーマの検証に失敗した場合
+    """
+    parser = PydanticOutputParser(pydantic_object=AnimalProfile)
+    try:
+        return parser.parse(text)
+    except OutputParserException as e:
+        logger.warning(f"構造化出力の検証に失敗したため複数呼び出しにフォールバックします: {str(e)[:200]}")
+        raise
+
+def create_structured_multi_chain(
+    model: Optional[Runnable] = None,
+    router: Optional[LatencyAwareRouter] = None,
+    fallback_chain: Optional[Runnable] = None
+):
+    """
+    複合チェーンを1回の構造化出力呼び出しにまとめたチェーンを作成
+    
+    create_multi_chain と同じキー（description, fun_fact, habitat, summary, animal）を
+    返しますが、3つのブランチと要約を1回のLLM呼び出しで生成します。
+    スキーマの検証に失敗した応答だけを、複数呼び出しのチェーンで作り直します。
+    
+    Args:
+        model: 使用するチャットモデル（省略時はChatOpenAI）
+        router: モデルを選択するルーター（要約と同じ "summary" ブランチとして選択）
+        fallback_chain: 検証失敗時に使うチェーン（省略時はcreate_multi_chainで作成）
+    
+    Returns:
+        Runnable: 構造化出力チェーン（フォールバック付き）
+    """
+    logger.info("構造化出力チェーンの作成を開始")
+    
+    if router is not None:
+        structured_model = router.for_branch("summary")
+    elif model is not None:
+        structured_model = model
+    else:
+        structured_model = ChatOpenAI(temperature=0.7, callbacks=[DebugCallbackHandler()])
+    if fallback_chain is None:
+        fallback_chain = create_multi_chain(model=model, router=router)
+    
+    structured_prompt = ChatPromptTemplate.from_messages([
+        ("human", """
+        {animal}について、次の4項目を作成してください：
+        - description: 1文での説明
+        - fun_fact: 面白い豆知識を1つ
+        - habitat: 主な生息地
+        - summary: descriptionとfun_factを元にした簡潔な要約
+        
+        回答は次の形式のJSONオブジェクトのみで出力してください：
+        {{"description": "...", "fun_fact": "...", "habitat": "...", "summary": "..."}}
+        """)
+    ])
+    
+    structured_chain = RunnableParallel(
         {
-            "description": base_chain.pick("description"),
-            "fun_fact": base_chain.pick("fun_fact"),
-            "habitat": base_chain.pick("habitat"),
-            "summary": summary_input_chain | summary_chain,
+            "profile": structured_prompt | structured_model | StrOutputParser() | RunnableLambda(parse_animal_profile),
             "animal": RunnablePassthrough()
         }
-    )
+    ) | RunnableLambda(lambda x: {**x["profile"].model_dump(), "animal": x["animal"]})
     
-    logger.debug("[Debug] 複数チェーンの作成完了")
-    return final_chain
+    logger.debug("[Debug] 構造化出力チェーンの作成完了")
+    return structured_chain.with_fallbacks([fallback_chain], exceptions_to_handle=(OutputParserException,))
 
 @measure_execution_time
-def execute_chain(chain, input_data):
+def execute_chain(chain, input_data, sink: Optional[ResultSink] = None):
     """
     チェーンを実行し、実行時間を計測
     
     Args:
         chain: 実行するチェーン
         input_data: 入力データ
+        sink: 結果を列指向の形式で保存するシンク（省略時は保存しない）
         
     Returns:
         dict: チェーンの実行結果
     """
     logger.debug(f"[Debug] 入力データ:\n{format_dict(input_data)}")
-    result = chain.invoke(input_data)
+    result = invoke_with_sink(chain, input_data, sink) if sink is not None else chain.invoke(input_data)
     logger.debug(f"[Debug] 実行結果:\n{format_dict(result)}")
     return result
 
@@ -215,10 +300,20 @@ def main():
     logger.info("複数チェーンを組み合わせた処理の実演を開始します")
     
     try:
-        # チェーンの作成と実行
-        chain = create_multi_chain()
+        # チェーンの作成と実行（STRUCTURED_OUTPUT=1 で1回の構造化出力呼び出しにまとめる）
+        if os.getenv("STRUCTURED_OUTPUT") == "1":
+            chain = create_structured_multi_chain()
+        else:
+            chain = create_multi_chain()
         input_data = {"animal": "象"}
-        result = execute_chain(chain, input_data)
+        # RESULT_SINK=<ディレクトリ> で結果を列指向の形式で保存する
+        sink = ResultSink(os.environ["RESULT_SINK"]) if os.getenv("RESULT_SINK") else None
+        try:
+            result = execute_chain(chain, input_data, sink=sink)
+        finally:
+            # チェーンが失敗した場合も、バッファに残った結果を書き出す
+            if sink is not None:
+                sink.close()
         
         # 結果の出力
         logger.success("処理結果:")
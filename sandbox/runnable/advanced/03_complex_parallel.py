@@ -11,12 +11,14 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnableParallel
 from logger_setup import setup_logger, print_tutorial_header
+from model_router import LatencyAwareRouter
+from typing import Optional
 import os
 
 # ロガーのセットアップ
 logger = setup_logger()
 
-def create_complex_parallel():
+def create_complex_parallel(model=None, router: Optional[LatencyAwareRouter] = None):
     """
     より複雑な並列チェーンを作成します。
 
@@ -25,6 +27,10 @@ def create_complex_parallel():
     2. 結果を構造化された形で取得できる
     3. 処理の依存関係を管理できる
 
+    Args:
+        model: 使用するチャットモデル（省略時はChatOpenAI）
+        router: ブランチごとにモデルを選択するルーター（指定時はmodelより優先）
+
     Returns:
         RunnableParallel: 複雑な並列処理を行うチェーン
     """
@@ -40,13 +46,18 @@ def create_complex_parallel():
         "{topic}の主な課題や欠点を3つ挙げてください。"
     )
     
-    model = ChatOpenAI(temperature=0.7)
+    if model is None and router is None:
+        model = ChatOpenAI(temperature=0.7)
     parser = StrOutputParser()
     
+    def branch_model(branch: str):
+        """ブランチで使うモデルを取得（ルーター指定時はブランチごとに選択）"""
+        return router.for_branch(branch) if router is not None else model
+    
     return RunnableParallel(
-        summary=summary_prompt | model | parser,
-        pros=pros_prompt | model | parser,
-        cons=cons_prompt | model | parser
+        summary=summary_prompt | branch_model("summary") | parser,
+        pros=pros_prompt | branch_model("pros") | parser,
+        cons=cons_prompt | branch_model("cons") | parser
     )
 
 def main():
@@ -0,0 +1,212 @@
+"""
+チェーンのバッチ実行を長いジョブから順に開始するスケジューラーのモジュール
+
+バッチの中には長い出力（summary や pros/cons のリストなど）を生成する入力があり、
+それらが最後に開始されると全体の完了時間（メイクスパン）が延びます。
+このモジュールでは、出力の長さをプロンプトの特徴と過去の観測値から予測し、
+同時実行数の上限の中で予測の長いジョブから順に開始します（Longest Job First）。
+
+予測の方法:
+1. 同じ入力を過去に実行していれば、その出力トークン数の指数移動平均
+2. それ以外は、入力トークン数から出力トークン数への線形回帰（観測値からオンライン学習）
+3. 観測値がない間は、入力トークン数と依頼内容のキーワードによるヒューリスティック
+
+使用例:
+    scheduler = LongestJobFirstScheduler()
+    results = scheduler.batch(chain, inputs, max_concurrency=4)
+"""
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.runnables import Runnable
+from loguru import logger
+
+from perf_metrics import MetricsRecorder, UsageCallbackHandler, estimate_tokens
+
+# 長い出力を求める依頼によく現れる語句と、予測に加える出力トークン数
+LONG_OUTPUT_KEYWORDS = {
+    "挙げて": 120,
+    "箇条書き": 100,
+    "要約": 80,
+    "詳しく": 150,
+    "概要": 60,
+}
+
+
+def input_text(input_data: Any) -> str:
+    """ジョブの入力をテキストとして取得する（辞書の場合は値を連結）"""
+    if isinstance(input_data, dict):
+        return " ".join(str(value) for value in input_data.values())
+    return str(input_data)
+
+
+def job_key(input_data: Any) -> str:
+    """過去の観測値を引くためのジョブのキーを計算する"""
+    return json.dumps(input_data, ensure_ascii=False, sort_keys=True, default=str)
+
+
+class OutputLengthPredictor:
+    """
+    ジョブの出力トークン数を予測するクラス
+
+    観測値は observe() で追加し、同じ入力の履歴と入力長からの線形回帰に反映します。
+    """
+    def __init__(self, prompt_hint: str = "", smoothing: float = 0.5, base_tokens: float = 50.0):
+        """
+        Args:
+            prompt_hint: チェーンのプロンプト文（キーワードによるヒューリスティックに使用）
+            smoothing: 同じ入力の観測値の指数移動平均の係数
+            base_tokens: 観測値がない場合の基本の出力トークン数
+        """
+        self.smoothing = smoothing
+        self.base_tokens = base_tokens
+        self.keyword_bonus = sum(bonus for keyword, bonus in LONG_OUTPUT_KEYWORDS.items() if keyword in prompt_hint)
+        self._lock = threading.Lock()
+        self._history: Dict[str, float] = {}
+        self._n = 0
+        self._sum_x = self._sum_y = self._sum_xx = self._sum_xy = 0.0
+
+    def predict(self, input_data: Any) -> Tuple[float, str]:
+        """
+        出力トークン数を予測する
+
+        Args:
+            input_data: ジョブの入力
+
+        Returns:
+            Tuple[float, str]: (予測出力トークン数, 予測の根拠)
+        """
+        x = float(estimate_tokens(input_text(input_data)))
+        with self._lock:
+            key = job_key(input_data)
+            if key in self._history:
+                return self._history[key], "history"
+            if self._n >= 2:
+                denominator = self._n * self._sum_xx - self._sum_x ** 2
+                if denominator > 0:
+                    slope = (self._n * self._sum_xy - self._sum_x * self._sum_y) / denominator
+                    intercept = (self._sum_y - slope * self._sum_x) / self._n
+                    return max(1.0, intercept + slope * x), "regression"
+                return self._sum_y / self._n, "mean"
+        return self.base_tokens + self.keyword_bonus + 4 * x, "heuristic"
+
+    def observe(self, input_data: Any, output_tokens: float) -> None:
+        """
+        ジョブの実際の出力トークン数を学習する
+
+        Args:
+            input_data: ジョブの入力
+            output_tokens: 観測された出力トークン数
+        """
+        x = float(estimate_tokens(input_text(input_data)))
+        with self._lock:
+            key = job_key(input_data)
+            previous = self._history.get(key)
+            self._history[key] = (
+                output_tokens if previous is None
+                else (1 - self.smoothing) * previous + self.smoothing * output_tokens
+            )
+            self._n += 1
+            self._sum_x += x
+            self._sum_y += output_tokens
+            self._sum_xx += x * x
+            self._sum_xy += x * output_tokens
+
+
+class LongestJobFirstScheduler:
+    """
+    予測出力長の長いジョブから順に開始するバッチスケジューラー
+
+    記録されるメトリクス:
+    - gauge makespan: 直近のバッチの完了時間（秒）
+    - timing job_duration / output_tokens: ジョブごとの処理時間と出力トークン数
+    - timing prediction_error: 予測と実測の出力トークン数の差の絶対値
+    """
+    def __init__(self, predictor: Optional[OutputLengthPredictor] = None, metrics: Optional[MetricsRecorder] = None):
+        self.predictor = predictor or OutputLengthPredictor()
+        self.metrics = metrics or MetricsRecorder()
+
+    def order(self, inputs: List[Any]) -> List[int]:
+        """
+        入力の実行順序を決める（予測出力長の降順、同じ長さなら元の順序）
+
+        Args:
+            inputs: 入力データのリスト
+
+        Returns:
+            List[int]: 実行する入力のインデックスの順序
+        """
+        predictions = [self.predictor.predict(input_data)[0] for input_data in inputs]
+        return sorted(range(len(inputs)), key=lambda i: (-predictions[i], i))
+
+    def batch(
+        self,
+        chain: Runnable,
+        inputs: List[Any],
+        max_concurrency: int = 4,
+        fifo: bool = False,
+    ) -> List[Any]:
+        """
+        チェーンをバッチ実行する
+
+        Args:
+            chain: 実行するチェーン
+            inputs: 入力データのリスト
+            max_concurrency: 同時に実行するジョブの数
+            fifo: Trueの場合は入力順（FIFO）で開始する（比較用）
+
+        Returns:
+            List[Any]: 入力と同じ順序の結果リスト
+        """
+        execution_order = list(range(len(inputs))) if fifo else self.order(inputs)
+        results: List[Any] = [None] * len(inputs)
+
+        def run_job(index: int) -> None:
+            input_data = inputs[index]
+            predicted, _ = self.predictor.predict(input_data)
+            usage = UsageCallbackHandler()
+            start_time = time.perf_counter()
+            results[index] = chain.invoke(input_data, {"callbacks": [usage]})
+            duration = time.perf_counter() - start_time
+            output_tokens = usage.metrics.counter("completion_tokens")
+            self.predictor.observe(input_data, output_tokens)
+            self.metrics.observe("job_duration", duration)
+            self.metrics.observe("output_tokens", output_tokens)
+            self.metrics.observe("prediction_error", abs(predicted - output_tokens))
+
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            list(executor.map(run_job, execution_order))
+        makespan = time.perf_counter() - start_time
+
+        self.metrics.set_gauge("makespan", makespan)
+        logger.info(f"[Scheduler] {'FIFO' if fifo else 'LJF'}: {len(inputs)}件 メイクスパン {makespan:.2f}秒")
+        return results
+
+    def compare_with_fifo(self, chain: Runnable, inputs: List[Any], max_concurrency: int = 4) -> Dict[str, float]:
+        """
+        同じワークロードをFIFOと長いジョブ優先で実行してメイクスパンを比較する
+
+        FIFOの実行で得た観測値は予測器に反映されるため、2回目（LJF）は履歴に基づいて順序付けされます。
+
+        Args:
+            chain: 実行するチェーン
+            inputs: 入力データのリスト
+            max_concurrency: 同時に実行するジョブの数
+
+        Returns:
+            Dict[str, float]: FIFOとLJFのメイクスパン（秒）と短縮率
+        """
+        self.batch(chain, inputs, max_concurrency, fifo=True)
+        fifo_makespan = self.metrics.gauge("makespan")
+        self.batch(chain, inputs, max_concurrency)
+        ljf_makespan = self.metrics.gauge("makespan")
+        return {
+            "fifo_makespan": round(fifo_makespan, 3),
+            "ljf_makespan": round(ljf_makespan, 3),
+            "reduction": round(1 - ljf_makespan / fifo_makespan, 3) if fifo_makespan else 0.0,
+        }
@@ -0,0 +1,79 @@
+"""
+長いジョブ優先スケジューリングのベンチマーク
+
+03_complex_parallel.py のチェーンを、出力の長さが入力ごとに異なる
+オフラインモデルでバッチ実行し、FIFOと長いジョブ優先（LJF）のメイクスパンを比較します。
+
+使用例:
+    python bench_batch_scheduler.py --inputs 12 --max-concurrency 3
+"""
+
+import argparse
+import importlib
+import json
+import os
+import random
+
+from batch_scheduler import LongestJobFirstScheduler, OutputLengthPredictor
+from fake_model import OfflineChatModel
+from logger_setup import setup_logger, print_tutorial_header
+
+# ロガーのセットアップ
+logger = setup_logger()
+
+TOPICS = ["宇宙探査", "AI", "量子コンピュータの実用化", "再生可能エネルギー", "教育", "自動運転技術の社会実装"]
+
+
+def make_responder(long_every: int):
+    """
+    トピックによって出力の長さが大きく異なるオフライン応答関数を作成する
+
+    Args:
+        long_every: N番目ごとのトピックで長い出力を返す
+
+    Returns:
+        Callable[[str], str]: 応答関数
+    """
+    def responder(prompt: str) -> str:
+        topic = next((t for t in sorted(TOPICS, key=len, reverse=True) if t in prompt), "")
+        length = 200 if TOPICS.index(topic) % long_every == 0 else 20
+        return f"{topic}について: " + "詳細な説明です。" * (length // 8)
+    return responder
+
+
+def main():
+    """
+    ベンチマークのメイン関数
+    FIFOと長いジョブ優先のメイクスパンを比較表示します。
+    """
+    parser = argparse.ArgumentParser(description="長いジョブ優先スケジューリングのベンチマーク")
+    parser.add_argument("--inputs", type=int, default=12, help="入力の件数")
+    parser.add_argument("--max-concurrency", type=int, default=3, help="同時に実行するジョブの数")
+    parser.add_argument("--latency-per-token", type=float, default=0.005, help="出力トークンあたりのレイテンシ（秒）")
+    parser.add_argument("--long-every", type=int, default=3, help="N番目ごとのトピックで長い出力を返す")
+    parser.add_argument("--seed", type=int, default=0, help="入力順序の乱数シード")
+    args = parser.parse_args()
+
+    print_tutorial_header(os.path.basename(__file__))
+
+    model = OfflineChatModel(
+        responder=make_responder(args.long_every),
+        latency=0.05,
+        latency_per_token=args.latency_per_token,
+    )
+    chain = importlib.import_module("03_complex_parallel").create_complex_parallel(model)
+
+    # 長いジョブが末尾に集まる入力順序（FIFOで不利になるケース）
+    topics = [TOPICS[i % len(TOPICS)] for i in range(args.inputs)]
+    random.Random(args.seed).shuffle(topics)
+    topics.sort(key=lambda t: TOPICS.index(t) % args.long_every == 0)
+    inputs = [{"topic": topic} for topic in topics]
+
+    scheduler = LongestJobFirstScheduler(OutputLengthPredictor(prompt_hint="概要 挙げて"))
+    report = scheduler.compare_with_fifo(chain, inputs, args.max_concurrency)
+    report["prediction_error_p50"] = scheduler.metrics.percentile("prediction_error", 50)
+    logger.success(f"[Benchmark] {json.dumps(report, ensure_ascii=False)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+同時実行数の自動調整のベンチマーク
+
+02_enhanced_parallel_chains.py の複合チェーンを、スロットリングを注入した
+オフラインモデルでバッチ実行し、固定の max_concurrency と
+AdaptiveConcurrencyLimiter による自動調整を比較します。
+
+使用例:
+    python bench_concurrency_tuner.py --inputs 16 --capacity 6
+"""
+
+import argparse
+import importlib
+import json
+import os
+import time
+from typing import Any, Dict, List
+
+from concurrency_tuner import AdaptiveConcurrencyLimiter
+from fake_model import OfflineChatModel, OfflineRateLimitError
+from logger_setup import setup_logger, print_tutorial_header
+from perf_metrics import UsageCallbackHandler
+
+# ロガーのセットアップ
+logger = setup_logger()
+
+ANIMALS = ["象", "キリン", "ライオン", "ペンギン", "カンガルー", "パンダ", "イルカ", "フクロウ"]
+
+
+def run_fixed(inputs: List[Dict[str, Any]], args, max_concurrency: int) -> Dict[str, Any]:
+    """
+    固定の max_concurrency でバッチ実行する（レート制限エラーは指数バックオフで再試行）
+
+    Args:
+        inputs: 入力データのリスト
+        args: コマンドライン引数
+        max_concurrency: 同時実行数の上限
+
+    Returns:
+        Dict[str, Any]: 計測結果
+    """
+    multi_chain = importlib.import_module("02_enhanced_parallel_chains")
+    model = OfflineChatModel(
+        latency=args.latency,
+        capacity=args.capacity,
+        latency_per_inflight=args.latency_per_inflight,
+    )
+    retrying_model = model.with_retry(
+        retry_if_exception_type=(OfflineRateLimitError,),
+        stop_after_attempt=10,
+        wait_exponential_jitter=True,
+    )
+    usage = UsageCallbackHandler()
+    start_time = time.perf_counter()
+    multi_chain.create_multi_chain(retrying_model).batch(
+        inputs, {"callbacks": [usage], "max_concurrency": max_concurrency}
+    )
+    elapsed = time.perf_counter() - start_time
+    return {
+        "mode": f"fixed-{max_concurrency}",
+        "elapsed_sec": round(elapsed, 3),
+        "llm_calls": int(usage.metrics.counter("llm_calls")),
+        "throttled": int(usage.metrics.counter("llm_errors")),
+    }
+
+
+def run_adaptive(inputs: List[Dict[str, Any]], args) -> Dict[str, Any]:
+    """
+    AdaptiveConcurrencyLimiter で同時実行数を自動調整しながらバッチ実行する
+
+    Args:
+        inputs: 入力データのリスト
+        args: コマンドライン引数
+
+    Returns:
+        Dict[str, Any]: 計測結果（上限の推移を含む）
+    """
+    multi_chain = importlib.import_module("02_enhanced_parallel_chains")
+    model = OfflineChatModel(
+        latency=args.latency,
+        capacity=args.capacity,
+        latency_per_inflight=args.latency_per_inflight,
+    )
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=2, max_limit=args.max_concurrency)
+    usage = UsageCallbackHandler()
+    start_time = time.perf_counter()
+    multi_chain.create_multi_chain(limiter.wrap(model)).batch(
+        inputs, {"callbacks": [usage], "max_concurrency": args.max_concurrency}
+    )
+    elapsed = time.perf_counter() - start_time
+    decisions = limiter.metrics.events("limit_change")
+    return {
+        "mode": "adaptive",
+        "elapsed_sec": round(elapsed, 3),
+        "llm_calls": int(usage.metrics.counter("llm_calls")),
+        "throttled": int(limiter.metrics.counter("throttled")),
+        "final_limit": limiter.limit,
+        "latency_p95": limiter.metrics.percentile("llm_latency", 95),
+        "limit_trajectory": [d["current"] for d in decisions],
+        "decisions": {
+            reason: sum(1 for d in decisions if d["reason"] == reason)
+            for reason in ("increase", "latency", "throttled")
+        },
+    }
+
+
+def main():
+    """
+    ベンチマークのメイン関数
+    固定の同時実行数と自動調整の結果を比較表示します。
+    """
+    parser = argparse.ArgumentParser(description="同時実行数の自動調整のベンチマーク")
+    parser.add_argument("--inputs", type=int, default=16, help="入力の件数")
+    parser.add_argument("--capacity", type=int, default=6, help="オフラインモデルの同時実行数の上限（超えると429）")
+    parser.add_argument("--latency", type=float, default=0.2, help="1回の呼び出しの基本レイテンシ（秒）")
+    parser.add_argument("--latency-per-inflight", type=float, default=0.02, help="同時実行1つあたりの追加レイテンシ（秒）")
+    parser.add_argument("--max-concurrency", type=int, default=32, help="バッチ実行の同時実行数の上限")
+    parser.add_argument("--fixed", type=int, nargs="*", default=[2, 32], help="比較する固定の max_concurrency")
+    args = parser.parse_args()
+
+    print_tutorial_header(os.path.basename(__file__))
+
+    inputs = [{"animal": ANIMALS[i % len(ANIMALS)]} for i in range(args.inputs)]
+    reports = [run_fixed(inputs, args, value) for value in args.fixed]
+    reports.append(run_adaptive(inputs, args))
+
+    for report in reports:
+        logger.success(f"[Benchmark] {json.dumps(report, ensure_ascii=False)}")
+
+
+if __name__ == "__main__":
+    main()
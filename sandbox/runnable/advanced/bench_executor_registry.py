@@ -0,0 +1,87 @@
+"""
+共有スレッドプールのベンチマーク
+
+03_complex_parallel.py のチェーンを同時にバッチ実行し、
+RunnableParallel（呼び出しごとにプールを作成）と SharedPoolParallel（共有プール）で
+スレッド数のピークと処理時間を比較します。
+
+使用例:
+    python bench_executor_registry.py --inputs 32 --max-concurrency 16 --io-workers 8
+"""
+
+import argparse
+import importlib
+import json
+import os
+import threading
+import time
+
+from executor_registry import configure_registry, use_shared_executors
+from fake_model import OfflineChatModel
+from logger_setup import setup_logger, print_tutorial_header
+
+# ロガーのセットアップ
+logger = setup_logger()
+
+
+def run_batch(chain, inputs, max_concurrency: int) -> dict:
+    """
+    バッチ実行中のスレッド数を監視しながらチェーンを実行する
+
+    Returns:
+        dict: 処理時間（秒）とスレッド数のピーク
+    """
+    peak = threading.active_count()
+    done = threading.Event()
+
+    def watch():
+        nonlocal peak
+        while not done.is_set():
+            peak = max(peak, threading.active_count())
+            time.sleep(0.005)
+
+    watcher = threading.Thread(target=watch, daemon=True)
+    watcher.start()
+    start_time = time.perf_counter()
+    chain.batch(inputs, {"max_concurrency": max_concurrency})
+    elapsed = time.perf_counter() - start_time
+    done.set()
+    watcher.join()
+    return {"elapsed": round(elapsed, 3), "peak_threads": peak}
+
+
+def main():
+    """
+    ベンチマークのメイン関数
+    プールの共有の有無によるスレッド数と処理時間を比較表示します。
+    """
+    parser = argparse.ArgumentParser(description="共有スレッドプールのベンチマーク")
+    parser.add_argument("--inputs", type=int, default=32, help="入力の件数")
+    parser.add_argument("--max-concurrency", type=int, default=16, help="バッチ実行の同時実行数")
+    parser.add_argument("--io-workers", type=int, default=8, help="共有ioプールの最大スレッド数")
+    parser.add_argument("--latency", type=float, default=0.1, help="1回の呼び出しのレイテンシ（秒）")
+    args = parser.parse_args()
+
+    print_tutorial_header(os.path.basename(__file__))
+
+    factory = importlib.import_module("03_complex_parallel").create_complex_parallel
+    inputs = [{"topic": f"トピック{i}"} for i in range(args.inputs)]
+    registry = configure_registry({"io": args.io_workers, "cpu": 2, "callbacks": 1})
+
+    reports = []
+    for mode in ("per-invoke-pools", "shared-pools"):
+        chain = factory(OfflineChatModel(latency=args.latency))
+        if mode == "shared-pools":
+            chain = use_shared_executors(chain)
+        report = {"mode": mode, **run_batch(chain, inputs, args.max_concurrency)}
+        if mode == "shared-pools":
+            report["io_queue_wait_p95"] = round(registry.metrics.percentile("pool.io.queue_wait", 95), 3)
+            report["io_inline"] = registry.metrics.counter("pool.io.inline")
+        reports.append(report)
+
+    for report in reports:
+        logger.success(f"[Benchmark] {json.dumps(report, ensure_ascii=False)}")
+
+
+if __name__ == "__main__":
+    main()
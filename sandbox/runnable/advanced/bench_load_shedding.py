@@ -0,0 +1,107 @@
+"""
+ロードシェディングのベンチマーク
+
+03_complex_parallel.py（cons を省略）と 02_enhanced_parallel_chains.py（habitat を省略）の
+チェーンに同時リクエストのスパイクを与え、オプションのブランチを省略した場合としない場合の
+レイテンシ（p50/p95）、劣化応答の割合、1リクエストあたりのLLM呼び出し回数を比較します。
+
+使用例:
+    python bench_load_shedding.py --requests 40 --spike 16
+    python bench_load_shedding.py --chain multi
+"""
+
+import argparse
+import importlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fake_model import OfflineChatModel
+from load_shedding import LoadMonitor, shed_optional_branches
+from logger_setup import setup_logger, print_tutorial_header
+from perf_metrics import MetricsRecorder, UsageCallbackHandler
+
+# ロガーのセットアップ
+logger = setup_logger()
+
+# チェーン名: (モジュール, ファクトリ関数, 入力, オプションのブランチと優先度)
+CHAINS = {
+    "complex": ("03_complex_parallel", "create_complex_parallel", {"topic": "宇宙探査"}, {"cons": 1}),
+    "multi": ("02_enhanced_parallel_chains", "create_multi_chain", {"animal": "象"}, {"habitat": 1}),
+}
+
+
+def run_spike(chain, input_data: dict, requests: int, spike: int) -> MetricsRecorder:
+    """
+    spike件の同時リクエストでチェーンを実行し、レイテンシと劣化応答を記録する
+
+    Args:
+        chain: 実行するチェーン
+        input_data: チェーンの入力
+        requests: リクエストの総数
+        spike: 同時リクエスト数
+
+    Returns:
+        MetricsRecorder: e2e_latency と degraded を記録したメトリクス
+    """
+    metrics = MetricsRecorder()
+
+    def request(_):
+        start_time = time.perf_counter()
+        result = chain.invoke(input_data)
+        metrics.observe("e2e_latency", time.perf_counter() - start_time)
+        if isinstance(result, dict) and result.get("degraded"):
+            metrics.incr("degraded")
+
+    with ThreadPoolExecutor(max_workers=spike) as executor:
+        list(executor.map(request, range(requests)))
+    return metrics
+
+
+def main():
+    """
+    ベンチマークのメイン関数
+    ロードシェディングの有無によるレイテンシを比較表示します。
+    """
+    parser = argparse.ArgumentParser(description="ロードシェディングのベンチマーク")
+    parser.add_argument("--chain", choices=["all", *CHAINS], default="all", help="対象のチェーン")
+    parser.add_argument("--requests", type=int, default=40, help="リクエストの総数")
+    parser.add_argument("--spike", type=int, default=16, help="同時リクエスト数")
+    parser.add_argument("--latency", type=float, default=0.2, help="1回の呼び出しの基本レイテンシ（秒）")
+    parser.add_argument("--latency-per-inflight", type=float, default=0.02, help="同時実行1つあたりの追加レイテンシ（秒）")
+    parser.add_argument("--max-in-flight", type=int, default=6, help="過負荷と判定する実行中リクエスト数")
+    parser.add_argument("--max-latency", type=float, default=0.6, help="過負荷と判定するレイテンシ（秒）")
+    args = parser.parse_args()
+
+    print_tutorial_header(os.path.basename(__file__))
+
+    reports = []
+    for chain_name in ([args.chain] if args.chain != "all" else list(CHAINS)):
+        module_name, factory_name, input_data, optional = CHAINS[chain_name]
+        factory = getattr(importlib.import_module(module_name), factory_name)
+        for mode in ("all-branches", "shedding"):
+            usage = UsageCallbackHandler()
+            model = OfflineChatModel(
+                latency=args.latency, latency_per_inflight=args.latency_per_inflight, callbacks=[usage]
+            )
+            chain = factory(model)
+            if mode == "shedding":
+                monitor = LoadMonitor(max_in_flight=args.max_in_flight, max_latency=args.max_latency)
+                chain = shed_optional_branches(chain, optional, monitor)
+            metrics = run_spike(chain, input_data, args.requests, args.spike)
+            reports.append({
+                "chain": chain_name,
+                "mode": mode,
+                "p50": round(metrics.percentile("e2e_latency", 50), 3),
+                "p95": round(metrics.percentile("e2e_latency", 95), 3),
+                "degraded_ratio": round(metrics.counter("degraded") / args.requests, 3),
+                "llm_calls_per_request": round(usage.metrics.counter("llm_calls") / args.requests, 2),
+            })
+
+    for report in reports:
+        logger.success(f"[Benchmark] {json.dumps(report, ensure_ascii=False)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+レイテンシ考慮型ルーターのベンチマーク
+
+全ブランチを品質重視のモデルで実行する場合と、LatencyAwareRouterで
+ブランチごとにモデルを選択する場合の、invokeあたりのレイテンシ（p50/p95）を比較します。
+オフラインモデルを使うため、APIキーなしで実行できます。
+
+使用例:
+    python bench_model_router.py --chain multi --inputs 20
+"""
+
+import argparse
+import importlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from fake_model import OfflineChatModel
+from logger_setup import setup_logger, print_tutorial_header
+from model_router import BranchPolicy, LatencyAwareRouter, ModelOption
+from perf_metrics import MetricsRecorder
+
+# ロガーのセットアップ
+logger = setup_logger()
+
+CHAINS = {
+    "multi": ("02_enhanced_parallel_chains", "create_multi_chain", {"animal": "象"}),
+    "complex": ("03_complex_parallel", "create_complex_parallel", {"topic": "宇宙探査"}),
+}
+
+# 簡単なブランチは速いモデル、品質が重要なブランチ（summary）は高品質なモデルに割り当てる
+BRANCH_POLICIES = {
+    "description": BranchPolicy(slo=0.8),
+    "fun_fact": BranchPolicy(slo=0.8),
+    "habitat": BranchPolicy(slo=0.8),
+    "pros": BranchPolicy(slo=0.8),
+    "cons": BranchPolicy(slo=0.8),
+    "summary": BranchPolicy(slo=3.0, min_quality=2),
+}
+
+
+def run(chain, inputs: List[Dict[str, Any]], concurrency: int) -> MetricsRecorder:
+    """
+    入力ごとにinvokeを実行し、end-to-endレイテンシを記録する
+
+    Args:
+        chain: 実行するチェーン
+        inputs: 入力データのリスト
+        concurrency: 同時に実行するinvokeの数
+
+    Returns:
+        MetricsRecorder: e2e_latency を記録したメトリクス
+    """
+    metrics = MetricsRecorder()
+
+    def timed_invoke(input_data):
+        start_time = time.perf_counter()
+        chain.invoke(input_data)
+        metrics.observe("e2e_latency", time.perf_counter() - start_time)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(timed_invoke, inputs))
+    return metrics
+
+
+def main():
+    """
+    ベンチマークのメイン関数
+    単一モデルとルーティングのレイテンシを比較表示します。
+    """
+    parser = argparse.ArgumentParser(description="レイテンシ考慮型ルーターのベンチマーク")
+    parser.add_argument("--chain", choices=sorted(CHAINS), default="multi", help="対象のチェーン")
+    parser.add_argument("--inputs", type=int, default=20, help="invokeの回数")
+    parser.add_argument("--concurrency", type=int, default=4, help="同時に実行するinvokeの数")
+    parser.add_argument("--fast-latency", type=float, default=0.3, help="高速モデルのレイテンシ（秒）")
+    parser.add_argument("--quality-latency", type=float, default=1.2, help="高品質モデルのレイテンシ（秒）")
+    args = parser.parse_args()
+
+    print_tutorial_header(os.path.basename(__file__))
+
+    module_name, factory_name, input_data = CHAINS[args.chain]
+    factory = getattr(importlib.import_module(module_name), factory_name)
+    inputs = [input_data] * args.inputs
+
+    fast_model = OfflineChatModel(model_name="fast-mini", latency=args.fast_latency, latency_jitter=args.fast_latency * 0.3)
+    quality_model = OfflineChatModel(model_name="quality-large", latency=args.quality_latency, latency_jitter=args.quality_latency * 0.3)
+
+    baseline = run(factory(model=quality_model), inputs, args.concurrency)
+
+    router = LatencyAwareRouter(
+        pool=[
+            ModelOption("fast-mini", fast_model, quality=1, expected_latency=args.fast_latency),
+            ModelOption("quality-large", quality_model, quality=2, expected_latency=args.quality_latency),
+        ],
+        branch_policies=BRANCH_POLICIES,
+    )
+    routed = run(factory(router=router), inputs, args.concurrency)
+
+    for mode, metrics in (("single-model", baseline), ("routed", routed)):
+        report = {
+            "mode": mode,
+            "p50": round(metrics.percentile("e2e_latency", 50), 3),
+            "p95": round(metrics.percentile("e2e_latency", 95), 3),
+        }
+        logger.success(f"[Benchmark] {json.dumps(report, ensure_ascii=False)}")
+
+    routes = {
+        name: int(value) for name, value in router.metrics.snapshot()["counters"].items()
+        if name.startswith("route.")
+    }
+    logger.info(f"[Benchmark] ルーティング結果: {json.dumps(routes, ensure_ascii=False)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+段階間のプロンプト圧縮のベンチマーク
+
+basic/04_nested_chain.py の2段階チェーンを、中間結果を圧縮しない場合と
+トークン予算ごとに圧縮した場合で実行し、2回目の呼び出しの入力トークン数・レイテンシの削減と、
+圧縮しない場合の最終出力からのずれ（1 - 類似度）を比較します。
+どの文よりも小さいトークン予算（10など）でも、圧縮後の中間結果が空にならないことを確認します。
+
+使用例:
+    python bench_prompt_compression.py --budgets 200 120 60 10
+"""
+
+import argparse
+import json
+import os
+import time
+from typing import Optional
+
+from chain_profiler import load_tutorial_module
+from fake_model import OfflineChatModel, default_responder
+from logger_setup import setup_logger, print_tutorial_header
+from perf_metrics import UsageCallbackHandler
+from prompt_compression import ExtractiveCompressor, split_sentences, text_similarity
+
+# ロガーのセットアップ
+logger = setup_logger()
+
+# 1回目の呼び出しで返す長い説明文（要点の文と冗長な文が混在）
+LONG_EXPLANATION = (
+    "機械学習は、データからパターンを学習して予測や判断を行う技術です。"
+    "機械学習のモデルは、大量のデータを使って学習します。"
+    "ちなみに、この分野の歴史は古く、さまざまな研究者が関わってきました。"
+    "教師あり学習では、正解付きのデータを使ってモデルを学習します。"
+    "教師なし学習では、正解のないデータから構造を見つけます。"
+    "余談ですが、多くの人が日常的にこの技術の恩恵を受けています。"
+    "強化学習では、試行錯誤を通じて報酬を最大化する行動を学習します。"
+    "学習したモデルは、新しいデータに対する予測に使われます。"
+    "なお、ここで紹介した内容はあくまで概要にすぎません。"
+    "機械学習の応用例には、画像認識、音声認識、推薦システムなどがあります。"
+    "モデルの性能は、データの質と量に大きく左右されます。"
+    "最後に、興味があればぜひ自分でも試してみてください。"
+)
+
+
+def responder(prompt: str) -> str:
+    """説明文の依頼には長い説明を、箇条書きの依頼には文ごとの箇条書きを返す"""
+    if "箇条書きにしてください" in prompt:
+        text = prompt.split("：", 1)[-1]
+        return "\n".join(f"- {sentence.strip()}" for sentence in split_sentences(text) if sentence.strip())
+    if "説明を" in prompt:
+        return LONG_EXPLANATION
+    return default_responder(prompt)
+
+
+def run(factory, budget: Optional[int], args) -> dict:
+    """
+    指定したトークン予算でチェーンを実行する
+
+    Returns:
+        dict: 最終出力・入力トークン数・レイテンシ・圧縮後の中間結果のトークン数
+    """
+    model = OfflineChatModel(
+        responder=responder,
+        latency=args.latency,
+        latency_per_prompt_token=args.latency_per_prompt_token,
+    )
+    compressor = ExtractiveCompressor(token_budget=budget) if budget else None
+    chain = factory(model, compressor=compressor)
+    usage = UsageCallbackHandler()
+    start_time = time.perf_counter()
+    output = chain.invoke({"topic": "機械学習", "style": "わかりやすく"}, {"callbacks": [usage]})
+    return {
+        "output": output,
+        "prompt_tokens": usage.metrics.counter("prompt_tokens"),
+        "latency": time.perf_counter() - start_time,
+        "compressed_tokens": compressor.metrics.percentile("compression.output_tokens", 100) if compressor else None,
+    }
+
+
+def main():
+    """
+    ベンチマークのメイン関数
+    トークン予算ごとの削減量とずれを比較表示します。
+    """
+    parser = argparse.ArgumentParser(description="段階間のプロンプト圧縮のベンチマーク")
+    parser.add_argument("--budgets", type=int, nargs="+", default=[200, 120, 60, 10], help="比較するトークン予算")
+    parser.add_argument("--latency", type=float, default=0.1, help="1回の呼び出しの基本レイテンシ（秒）")
+    parser.add_argument("--latency-per-prompt-token", type=float, default=0.002, help="入力トークン1つあたりのレイテンシ（秒）")
+    args = parser.parse_args()
+
+    print_tutorial_header(os.path.basename(__file__))
+
+    factory = load_tutorial_module(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "basic", "04_nested_chain.py")
+    ).create_nested_chain
+
+    baseline = run(factory, None, args)
+    for budget in args.budgets:
+        result = run(factory, budget, args)
+        report = {
+            "budget": budget,
+            "saved_prompt_tokens": baseline["prompt_tokens"] - result["prompt_tokens"],
+            "saved_latency": round(baseline["latency"] - result["latency"], 3),
+            "drift": round(1 - text_similarity(baseline["output"], result["output"]), 3),
+            "compressed_tokens": result["compressed_tokens"],
+        }
+        logger.success(f"[Benchmark] {json.dumps(report, ensure_ascii=False)}")
+        if not result["compressed_tokens"]:
+            logger.error(f"[Benchmark] 予算 {budget} で圧縮後の中間結果が空になりました")
+
+
+if __name__ == "__main__":
+    main()
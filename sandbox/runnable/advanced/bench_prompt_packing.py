@@ -0,0 +1,128 @@
+"""
+プロンプトパッキングのベンチマーク
+
+01_basic_parallel.py の並列チェーンを、通常のバッチ実行とパッキングモードで実行し、
+処理件数/秒・LLM呼び出し回数・トークン使用量を比較します。
+オフラインモデルを使うため、APIキーなしで実行できます。
+
+使用例:
+    python bench_prompt_packing.py --inputs 32 --pack-size 8 --latency 0.5
+"""
+
+import argparse
+import importlib
+import json
+import os
+import re
+import time
+from typing import Any, Dict, List
+
+from fake_model import OfflineChatModel, default_responder
+from logger_setup import setup_logger, print_tutorial_header
+from perf_metrics import UsageCallbackHandler
+from prompt_packing import batch_packed_parallel
+
+# ロガーのセットアップ
+logger = setup_logger()
+
+ANIMALS = ["象", "キリン", "ライオン", "ペンギン", "カンガルー", "パンダ", "イルカ", "フクロウ"]
+_ITEM_PATTERN = re.compile(r"^(\d+)\. (.+)$", re.MULTILINE)
+
+
+def make_responder(drop_every: int = 0):
+    """
+    パッキングされたプロンプトにも応答できるオフライン応答関数を作成する
+
+    Args:
+        drop_every: N件ごとに1件の回答を欠落させる（フォールバックの確認用、0で無効）
+
+    Returns:
+        Callable[[str], str]: 応答関数
+    """
+    def responder(prompt: str) -> str:
+        items = _ITEM_PATTERN.findall(prompt)
+        if not items:
+            return default_responder(prompt)
+        answers = {}
+        for number, body in items:
+            if drop_every and int(number) % drop_every == 0:
+                continue
+            answers[number] = default_responder(body)
+        return json.dumps(answers, ensure_ascii=False)
+    return responder
+
+
+def run_benchmark(mode: str, inputs: List[Dict[str, Any]], args) -> Dict[str, Any]:
+    """
+    指定モードでバッチ実行し、計測結果を返す
+
+    Args:
+        mode: "unpacked" または "packed"
+        inputs: 入力データのリスト
+        args: コマンドライン引数
+
+    Returns:
+        Dict[str, Any]: 計測結果
+    """
+    basic_parallel = importlib.import_module("01_basic_parallel")
+    model = OfflineChatModel(
+        responder=make_responder(args.drop_every),
+        latency=args.latency,
+        latency_per_token=args.latency_per_token,
+    )
+    usage = UsageCallbackHandler()
+    config = {"callbacks": [usage], "max_concurrency": args.max_concurrency}
+
+    start_time = time.perf_counter()
+    if mode == "packed":
+        branches = basic_parallel.create_packed_basic_parallel(model, pack_size=args.pack_size)
+        results = batch_packed_parallel(branches, inputs, config)
+    else:
+        chain = basic_parallel.create_basic_parallel(model)
+        results = chain.batch(inputs, config)
+    elapsed = time.perf_counter() - start_time
+
+    assert len(results) == len(inputs)
+    return {
+        "mode": mode,
+        "elapsed_sec": round(elapsed, 3),
+        "items_per_sec": round(len(inputs) / elapsed, 2),
+        "llm_calls": int(usage.metrics.counter("llm_calls")),
+        "llm_calls_per_sec": round(usage.metrics.counter("llm_calls") / elapsed, 2),
+        "prompt_tokens": int(usage.metrics.counter("prompt_tokens")),
+        "completion_tokens": int(usage.metrics.counter("completion_tokens")),
+        "total_tokens": int(usage.total_tokens),
+    }
+
+
+def main():
+    """
+    ベンチマークのメイン関数
+    通常のバッチ実行とパッキングモードの結果を比較表示します。
+    """
+    parser = argparse.ArgumentParser(description="プロンプトパッキングのベンチマーク")
+    parser.add_argument("--inputs", type=int, default=32, help="入力の件数")
+    parser.add_argument("--pack-size", type=int, default=8, help="1回の呼び出しにまとめる件数")
+    parser.add_argument("--latency", type=float, default=0.5, help="1回の呼び出しの基本レイテンシ（秒）")
+    parser.add_argument("--latency-per-token", type=float, default=0.0005, help="出力トークンあたりのレイテンシ（秒）")
+    parser.add_argument("--max-concurrency", type=int, default=4, help="同時実行数の上限")
+    parser.add_argument("--drop-every", type=int, default=0, help="N件ごとに回答を欠落させる（フォールバック確認用）")
+    args = parser.parse_args()
+
+    print_tutorial_header(os.path.basename(__file__))
+
+    inputs = [{"animal": ANIMALS[i % len(ANIMALS)]} for i in range(args.inputs)]
+    reports = [run_benchmark(mode, inputs, args) for mode in ("unpacked", "packed")]
+
+    for report in reports:
+        logger.success(f"[Benchmark] {json.dumps(report, ensure_ascii=False)}")
+    unpacked, packed = reports
+    logger.info(
+        f"[Benchmark] 処理件数/秒: {packed['items_per_sec'] / unpacked['items_per_sec']:.2f}倍, "
+        f"LLM呼び出し: {unpacked['llm_calls']} -> {packed['llm_calls']}, "
+        f"トークン: {unpacked['total_tokens']} -> {packed['total_tokens']}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+構造化出力による1回呼び出しへの書き換えのベンチマーク
+
+basic/04_nested_chain.py の2段階チェーンと 02_enhanced_parallel_chains.py の複合チェーンを、
+複数呼び出しのまま実行した場合と、構造化出力の1回呼び出しにまとめた場合で比較し、
+invokeあたりのLLM呼び出し回数とトークン使用量を表示します。
+
+使用例:
+    python bench_structured_rewrite.py --inputs 5
+    python bench_structured_rewrite.py --inputs 5 --invalid-every 2  # フォールバックの確認
+"""
+
+import argparse
+import importlib
+import itertools
+import json
+import os
+import time
+from typing import Any, Dict, List
+
+from chain_profiler import load_tutorial_module
+from fake_model import OfflineChatModel, default_responder
+from logger_setup import setup_logger, print_tutorial_header
+from perf_metrics import UsageCallbackHandler
+
+# ロガーのセットアップ
+logger = setup_logger()
+
+
+def make_responder(invalid_every: int = 0):
+    """
+    構造化出力の依頼にJSONで応答するオフライン応答関数を作成する
+
+    Args:
+        invalid_every: N回に1回、スキーマに合わない応答を返す（0で無効）
+
+    Returns:
+        Callable[[str], str]: 応答関数
+    """
+    counter = itertools.count(1)
+
+    def responder(prompt: str) -> str:
+        if '"bullets"' in prompt:
+            answer = {
+                "explanation": default_responder(prompt),
+                "bullets": ["要点1です。", "要点2です。", "要点3です。"],
+            }
+        elif '"summary"' in prompt:
+            answer = {key: default_responder(f"{key}: {prompt[:20]}") for key in ("description", "fun_fact", "habitat", "summary")}
+        else:
+            return default_responder(prompt)
+        if invalid_every and next(counter) % invalid_every == 0:
+            answer.pop(next(iter(answer)))
+        return json.dumps(answer, ensure_ascii=False)
+
+    return responder
+
+
+def measure(chain, inputs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    チェーンを入力ごとに実行し、invokeあたりの呼び出し回数とトークン数を計測する
+
+    Args:
+        chain: 実行するチェーン
+        inputs: 入力データのリスト
+
+    Returns:
+        Dict[str, Any]: 計測結果
+    """
+    usage = UsageCallbackHandler()
+    start_time = time.perf_counter()
+    for input_data in inputs:
+        chain.invoke(input_data, {"callbacks": [usage]})
+    elapsed = time.perf_counter() - start_time
+    return {
+        "llm_calls_per_invoke": round(usage.metrics.counter("llm_calls") / len(inputs), 2),
+        "tokens_per_invoke": round(usage.total_tokens / len(inputs), 1),
+        "latency_per_invoke": round(elapsed / len(inputs), 3),
+    }
+
+
+def main():
+    """
+    ベンチマークのメイン関数
+    複数呼び出しと構造化出力の1回呼び出しを比較表示します。
+    """
+    parser = argparse.ArgumentParser(description="構造化出力による1回呼び出しへの書き換えのベンチマーク")
+    parser.add_argument("--inputs", type=int, default=5, help="invokeの回数")
+    parser.add_argument("--latency", type=float, default=0.1, help="1回の呼び出しのレイテンシ（秒）")
+    parser.add_argument("--invalid-every", type=int, default=0, help="N回に1回スキーマに合わない応答を返す")
+    args = parser.parse_args()
+
+    print_tutorial_header(os.path.basename(__file__))
+
+    model = OfflineChatModel(responder=make_responder(args.invalid_every), latency=args.latency)
+    nested = load_tutorial_module(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "basic", "04_nested_chain.py")
+    )
+    multi = importlib.import_module("02_enhanced_parallel_chains")
+
+    cases = {
+        "nested": (
+            nested.create_nested_chain(model),
+            nested.create_structured_nested_chain(model),
+            {"topic": "機械学習", "style": "わかりやすく"},
+        ),
+        "multi": (
+            multi.create_multi_chain(model),
+            multi.create_structured_multi_chain(model),
+            {"animal": "象"},
+        ),
+    }
+    for name, (multi_call, structured, input_data) in cases.items():
+        inputs = [input_data] * args.inputs
+        for mode, chain in (("multi-call", multi_call), ("structured", structured)):
+            report = {"chain": name, "mode": mode, **measure(chain, inputs)}
+            logger.success(f"[Benchmark] {json.dumps(report, ensure_ascii=False)}")
+
+
+if __name__ == "__main__":
+    main()
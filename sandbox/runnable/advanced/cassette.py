@@ -0,0 +1,336 @@
+"""
+モデル呼び出しの記録・再生（カセット）モジュール
+
+実際のトラフィックを create_multi_chain や create_nested_chain に再投入して
+性能比較を行うために、モデルへのリクエストとレスポンスを記録し、
+APIやネットワークなしで再生できるようにします。
+
+カセットファイルの形式:
+- 1行1呼び出しのJSON Lines（拡張子が .gz の場合はgzip圧縮）
+- key: リクエストメッセージのハッシュ
+- messages: リクエストメッセージ（role, content）
+- content / usage: レスポンス本文とトークン使用量
+- latency: 記録時のレイテンシ（秒）
+
+記録中はカセットファイルを開いたままにし、gzipの場合も1つのストリームに書き込みます
+（記録の最後に close() するか、with 文で使ってください）。
+
+使用例:
+    # 記録（実際のChatOpenAIを使用）
+    python cassette.py record --chain multi --cassette traffic.jsonl.gz
+    # 再生（記録時のレイテンシを再現）
+    python cassette.py replay --chain multi --cassette traffic.jsonl.gz --reproduce-latency
+"""
+
+import argparse
+import asyncio
+import gzip
+import hashlib
+import importlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, List, Optional
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from loguru import logger
+from pydantic import PrivateAttr
+
+
+class CassetteMissError(KeyError):
+    """再生モードでカセットに該当するリクエストが見つからない場合のエラー"""
+
+
+def request_key(messages: List[BaseMessage]) -> str:
+    """
+    リクエストメッセージから記録・再生の照合キーを計算する
+
+    Args:
+        messages: モデルへのリクエストメッセージ
+
+    Returns:
+        str: メッセージの種類と本文から計算したSHA-256ハッシュ
+    """
+    payload = json.dumps([[m.type, m.content] for m in messages], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _open(path: str, mode: str):
+    """拡張子に応じて通常のファイルまたはgzipファイルを開く"""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class Cassette:
+    """
+    記録された呼び出しを保持するカセット
+
+    同じリクエストが複数回記録されている場合は、記録された順に返します
+    （使い切った後は最後のレスポンスを繰り返します）。
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Deque[Dict[str, Any]]] = defaultdict(deque)
+        self._last: Dict[str, Dict[str, Any]] = {}
+        # 記録用に開いたままにするファイル（最初の追記時に開く）
+        self._writer = None
+
+    @classmethod
+    def load(cls, path: str) -> "Cassette":
+        """
+        カセットファイルを読み込む
+
+        Args:
+            path: カセットファイルのパス
+
+        Returns:
+            Cassette: 読み込んだカセット
+        """
+        cassette = cls(path)
+        with _open(path, "r") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    cassette._entries[entry["key"]].append(entry)
+        logger.info(f"[Cassette] {path} から {len(cassette)} 件の呼び出しを読み込みました")
+        return cassette
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(entries) for entries in self._entries.values())
+
+    def append(self, messages: List[BaseMessage], message: AIMessage, latency: float, model_name: str) -> None:
+        """
+        呼び出しを1件カセットファイルに追記する
+
+        Args:
+            messages: リクエストメッセージ
+            message: レスポンスメッセージ
+            latency: レイテンシ（秒）
+            model_name: 記録元のモデル名
+        """
+        entry = {
+            "key": request_key(messages),
+            "messages": [{"role": m.type, "content": m.content} for m in messages],
+            "content": message.content,
+            "usage": dict(message.usage_metadata) if message.usage_metadata else None,
+            "latency": round(latency, 4),
+            "model_name": model_name,
+        }
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            if self._writer is None:
+                self._writer = _open(self.path, "a")
+            self._writer.write(line + "\n")
+
+    def close(self) -> None:
+        """記録用に開いたファイルを閉じる（gzipのストリームを終端する）"""
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+    def __enter__(self) -> "Cassette":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def next_response(self, messages: List[BaseMessage]) -> Dict[str, Any]:
+        """
+        リクエストに対応する記録済みレスポンスを取得する
+
+        Args:
+            messages: リクエストメッセージ
+
+        Returns:
+            Dict[str, Any]: 記録されたエントリ
+
+        Raises:
+            CassetteMissError: 該当するリクエストが記録されていない場合
+        """
+        key = request_key(messages)
+        with self._lock:
+            entries = self._entries.get(key)
+            if entries:
+                self._last[key] = entries.popleft()
+            if key not in self._last:
+                preview = str(messages[-1].content)[:80] if messages else ""
+                raise CassetteMissError(f"カセットに記録されていないリクエストです: {preview}")
+            return self._last[key]
+
+
+class CassetteChatModel(BaseChatModel):
+    """
+    モデル呼び出しを記録・再生するチャットモデル
+
+    - record: innerモデルを呼び出し、リクエスト・レスポンス・レイテンシをカセットに追記
+    - replay: カセットからレスポンスを返す（reproduce_latency=Trueで記録時のレイテンシを再現）
+    """
+
+    cassette_path: str
+    """カセットファイルのパス（.gzでgzip圧縮）"""
+
+    mode: str = "replay"
+    """"record" または "replay" """
+
+    inner: Optional[BaseChatModel] = None
+    """記録モードで実際に呼び出すモデル"""
+
+    reproduce_latency: bool = False
+    """再生時に記録時のレイテンシを再現するかどうか"""
+
+    latency_scale: float = 1.0
+    """再現するレイテンシの倍率"""
+
+    _cassette: Cassette = PrivateAttr()
+
+    def model_post_init(self, __context: Any) -> None:
+        if self.mode not in ("record", "replay"):
+            raise ValueError("modeには 'record' または 'replay' を指定してください。")
+        if self.mode == "record":
+            if self.inner is None:
+                raise ValueError("記録モードでは inner にモデルを指定してください。")
+            self._cassette = Cassette(self.cassette_path)
+        else:
+            self._cassette = Cassette.load(self.cassette_path)
+
+    @property
+    def _llm_type(self) -> str:
+        return f"cassette-{self.mode}"
+
+    def close(self) -> None:
+        """記録したカセットファイルを閉じる"""
+        self._cassette.close()
+
+    def _replay_result(self, entry: Dict[str, Any]) -> ChatResult:
+        """記録されたエントリからChatResultを組み立てる"""
+        message = AIMessage(content=entry["content"], usage_metadata=entry.get("usage"))
+        token_usage = {}
+        if entry.get("usage"):
+            token_usage = {
+                "prompt_tokens": entry["usage"].get("input_tokens", 0),
+                "completion_tokens": entry["usage"].get("output_tokens", 0),
+                "total_tokens": entry["usage"].get("total_tokens", 0),
+            }
+        return ChatResult(
+            generations=[ChatGeneration(message=message)],
+            llm_output={"token_usage": token_usage, "model_name": entry.get("model_name", "cassette")},
+        )
+
+    def _record_result(self, messages: List[BaseMessage], message: AIMessage, latency: float) -> ChatResult:
+        """innerモデルのレスポンスを記録してChatResultを組み立てる"""
+        model_name = getattr(self.inner, "model_name", None) or self.inner.get_name()
+        self._cassette.append(messages, message, latency, model_name)
+        return ChatResult(
+            generations=[ChatGeneration(message=message)],
+            llm_output={"model_name": model_name},
+        )
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if self.mode == "record":
+            start_time = time.perf_counter()
+            message = self.inner.invoke(messages, stop=stop, **kwargs)
+            return self._record_result(messages, message, time.perf_counter() - start_time)
+
+        entry = self._cassette.next_response(messages)
+        if self.reproduce_latency:
+            time.sleep(entry["latency"] * self.latency_scale)
+        return self._replay_result(entry)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if self.mode == "record":
+            start_time = time.perf_counter()
+            message = await self.inner.ainvoke(messages, stop=stop, **kwargs)
+            return self._record_result(messages, message, time.perf_counter() - start_time)
+
+        entry = self._cassette.next_response(messages)
+        if self.reproduce_latency:
+            await asyncio.sleep(entry["latency"] * self.latency_scale)
+        return self._replay_result(entry)
+
+
+def main():
+    """
+    カセットのメイン関数
+    create_multi_chain / create_nested_chain を記録モードまたは再生モードで実行します。
+    """
+    from chain_profiler import load_tutorial_module
+    from fake_model import OfflineChatModel
+    from logger_setup import setup_logger, print_tutorial_header
+
+    setup_logger()
+    parser = argparse.ArgumentParser(description="モデル呼び出しの記録・再生")
+    parser.add_argument("mode", choices=["record", "replay"], help="記録または再生")
+    parser.add_argument("--chain", choices=["multi", "nested"], default="multi", help="対象のチェーン")
+    parser.add_argument("--cassette", default="cassette.jsonl.gz", help="カセットファイルのパス")
+    parser.add_argument("--inputs", help="入力データのJSON Linesファイル（省略時はサンプル入力）")
+    parser.add_argument("--offline", action="store_true", help="記録時にChatOpenAIの代わりにオフラインモデルを使う")
+    parser.add_argument("--reproduce-latency", action="store_true", help="再生時に記録時のレイテンシを再現する")
+    parser.add_argument("--max-concurrency", type=int, default=4, help="バッチ実行の同時実行数")
+    args = parser.parse_args()
+
+    print_tutorial_header(os.path.basename(__file__))
+
+    if args.inputs:
+        with open(args.inputs, "r", encoding="utf-8") as f:
+            inputs = [json.loads(line) for line in f if line.strip()]
+    elif args.chain == "multi":
+        inputs = [{"animal": animal} for animal in ["象", "キリン", "ペンギン"]]
+    else:
+        inputs = [{"topic": "機械学習", "style": "わかりやすく"}]
+
+    if args.mode == "record":
+        if args.offline:
+            inner = OfflineChatModel(latency=0.2, latency_jitter=0.1)
+        else:
+            from dotenv import load_dotenv
+            from langchain_openai import ChatOpenAI
+            load_dotenv()
+            inner = ChatOpenAI(temperature=0.7)
+        model = CassetteChatModel(cassette_path=args.cassette, mode="record", inner=inner)
+    else:
+        model = CassetteChatModel(
+            cassette_path=args.cassette, mode="replay", reproduce_latency=args.reproduce_latency
+        )
+
+    if args.chain == "multi":
+        chain = importlib.import_module("02_enhanced_parallel_chains").create_multi_chain(model)
+    else:
+        chain = load_tutorial_module(
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "basic", "04_nested_chain.py")
+        ).create_nested_chain(model)
+
+    start_time = time.perf_counter()
+    try:
+        results = chain.batch(inputs, {"max_concurrency": args.max_concurrency})
+    finally:
+        model.close()
+    elapsed = time.perf_counter() - start_time
+    logger.success(f"[Cassette] {args.mode}: {len(results)}件を{elapsed:.2f}秒で処理しました ({args.cassette})")
+
+
+if __name__ == "__main__":
+    main()
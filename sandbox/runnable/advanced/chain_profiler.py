@@ -0,0 +1,397 @@
+"""
+合成されたチェーンの静的コスト・クリティカルパス解析モジュール
+
+チェーンを実行せずにRunnableの構造をたどり、1回のinvokeあたりの
+LLM呼び出し回数や逐次的な呼び出しの深さを予測します。
+
+レポート内容:
+1. invokeあたりのLLM呼び出し回数
+2. 重複して実行される部分グラフ（同じRunnableが複数回参照されている箇所）
+3. LLM呼び出しが直列に連なる最長経路（クリティカルパス）
+4. モデルごとの推定レイテンシから求めた期待レイテンシ
+
+結果はテキストまたはMermaid形式（READMEの図と同じ形式）で出力できます。
+
+使用例:
+    python chain_profiler.py --format mermaid
+"""
+
+import argparse
+import importlib
+import importlib.util
+import os
+import sys
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.language_models import BaseLanguageModel
+from langchain_core.runnables import (
+    Runnable,
+    RunnableBranch,
+    RunnableParallel,
+    RunnableSequence,
+    RunnableWithFallbacks,
+)
+
+from model_router import RoutedModel
+
+
+@dataclass
+class NodeCost:
+    """部分グラフ1つ分の解析結果"""
+    calls: int = 0
+    depth: int = 0
+    latency: float = 0.0
+    critical_path: List[str] = field(default_factory=list)
+
+
+@dataclass
+class DuplicatedSubgraph:
+    """複数回実行される部分グラフ"""
+    name: str
+    occurrences: int
+    calls_per_occurrence: int
+
+    @property
+    def redundant_calls(self) -> int:
+        """重複によって余分に発生するLLM呼び出し回数"""
+        return (self.occurrences - 1) * self.calls_per_occurrence
+
+
+@dataclass
+class ChainProfile:
+    """チェーン全体の解析結果"""
+    calls_per_invoke: int
+    sequential_depth: int
+    expected_latency: float
+    critical_path: List[str]
+    calls_by_model: Dict[str, int]
+    duplicated_subgraphs: List[DuplicatedSubgraph]
+    mermaid: str
+
+    def to_text(self) -> str:
+        """解析結果をテキストのレポートとして整形する"""
+        lines = [
+            "📊 チェーン解析結果",
+            f"- invokeあたりのLLM呼び出し回数: {self.calls_per_invoke}",
+            f"- 直列LLM呼び出しの最大深さ: {self.sequential_depth}",
+            f"- 期待レイテンシ: {self.expected_latency:.2f}秒",
+            "- モデル別の呼び出し回数:",
+        ]
+        lines += [f"    {name}: {count}" for name, count in self.calls_by_model.items()]
+        lines.append("- クリティカルパス:")
+        lines += [f"    {i}. {step}" for i, step in enumerate(self.critical_path, start=1)]
+        if self.duplicated_subgraphs:
+            lines.append("- 重複して実行される部分グラフ:")
+            lines += [
+                f"    {dup.name}: {dup.occurrences}回参照 "
+                f"(1回あたり{dup.calls_per_occurrence}呼び出し, 余分な呼び出し {dup.redundant_calls})"
+                for dup in self.duplicated_subgraphs
+            ]
+        else:
+            lines.append("- 重複して実行される部分グラフ: なし")
+        return "\n".join(lines)
+
+    def to_mermaid(self) -> str:
+        """解析結果をMermaid形式の図として取得する"""
+        return self.mermaid
+
+
+def model_label(model: Runnable) -> str:
+    """
+    モデルの表示名を取得する（モデル名があればそれを使用）
+
+    Args:
+        model: チャットモデル
+
+    Returns:
+        str: 推定レイテンシの参照キーにも使う表示名
+    """
+    if isinstance(model, RoutedModel):
+        return f"{model.router.preview(model.branch).name} (router:{model.branch})"
+    for attr in ("model_name", "model"):
+        value = getattr(model, attr, None)
+        if isinstance(value, str) and value:
+            return value
+    return model.get_name()
+
+
+def child_runnables(runnable: Runnable) -> Optional[Tuple[str, List[Tuple[str, Runnable]]]]:
+    """
+    合成Runnableの子要素を取得する
+
+    Args:
+        runnable: 対象のRunnable
+
+    Returns:
+        Optional[Tuple[str, List[Tuple[str, Runnable]]]]:
+            ("sequence" | "parallel" | "alternatives", [(ラベル, 子Runnable)])、
+            子要素を持たない場合はNone
+    """
+    if isinstance(runnable, RunnableSequence):
+        return "sequence", [(f"{step.get_name()}#{i}", step) for i, step in enumerate(runnable.steps, start=1)]
+    if isinstance(runnable, RunnableParallel):
+        return "parallel", list(runnable.steps__.items())
+    if isinstance(runnable, RunnableWithFallbacks):
+        # フォールバックは失敗時のみ実行されるため、主経路のみを解析する
+        return "sequence", [(runnable.runnable.get_name(), runnable.runnable)]
+    if isinstance(runnable, RunnableBranch):
+        branches = [(f"branch{i}", r) for i, (_, r) in enumerate(runnable.branches)]
+        return "alternatives", branches + [("default", runnable.default)]
+    mapper = getattr(runnable, "mapper", None)
+    if isinstance(mapper, Runnable):
+        return "sequence", [(mapper.get_name(), mapper)]
+    bound = getattr(runnable, "bound", None)
+    if isinstance(bound, Runnable):
+        return "sequence", [(bound.get_name(), bound)]
+    return None
+
+
+class ChainProfiler:
+    """
+    Runnableのグラフをたどってコストとクリティカルパスを解析するクラス
+    """
+    def __init__(self, latency_estimates: Optional[Dict[str, float]] = None, default_latency: float = 1.0):
+        """
+        Args:
+            latency_estimates: モデル名ごとの推定レイテンシ（秒）
+            default_latency: 推定値がないモデルのレイテンシ（秒）
+        """
+        self.latency_estimates = latency_estimates or {}
+        self.default_latency = default_latency
+
+    def profile(self, chain: Runnable) -> ChainProfile:
+        """
+        チェーンを解析する
+
+        Args:
+            chain: 解析対象のチェーン
+
+        Returns:
+            ChainProfile: 解析結果
+        """
+        self._occurrences: Dict[int, int] = {}
+        self._costs: Dict[int, NodeCost] = {}
+        self._calls_by_model: Dict[str, int] = {}
+        self._mermaid_lines: List[str] = []
+        self._model_nodes: List[Tuple[str, List[str]]] = []
+        self._node_counter = 0
+
+        root = self._visit(chain, chain.get_name(), [])
+        entries, _ = self._render(chain, chain.get_name(), [])
+        start = self._new_node("入力データ", shape="input")
+        for entry in entries:
+            self._mermaid_lines.append(f"    {start} --> {entry}")
+
+        return ChainProfile(
+            calls_per_invoke=root.calls,
+            sequential_depth=root.depth,
+            expected_latency=root.latency,
+            critical_path=root.critical_path,
+            calls_by_model=dict(self._calls_by_model),
+            duplicated_subgraphs=self._find_duplicates(chain),
+            mermaid=self._build_mermaid(root.critical_path),
+        )
+
+    def _visit(self, runnable: Runnable, label: str, path: List[str]) -> NodeCost:
+        """部分グラフのコストを再帰的に計算する"""
+        key = id(runnable)
+        self._occurrences[key] = self._occurrences.get(key, 0) + 1
+        step_path = path + [label]
+
+        if isinstance(runnable, (BaseLanguageModel, RoutedModel)):
+            name = model_label(runnable)
+            self._calls_by_model[name] = self._calls_by_model.get(name, 0) + 1
+            latency = self.latency_estimates.get(name, self.default_latency)
+            if isinstance(runnable, RoutedModel) and name not in self.latency_estimates:
+                latency = runnable.router.estimated_latency(runnable.router.preview(runnable.branch).name)
+            cost = NodeCost(1, 1, latency, [f"{' > '.join(step_path)} ({name}, {latency:.2f}秒)"])
+            self._costs[key] = cost
+            return cost
+
+        children = child_runnables(runnable)
+        if children is None:
+            return NodeCost()
+
+        kind, items = children
+        child_costs = [self._visit(child, child_label, step_path) for child_label, child in items]
+        if kind == "sequence":
+            cost = NodeCost(
+                calls=sum(c.calls for c in child_costs),
+                depth=sum(c.depth for c in child_costs),
+                latency=sum(c.latency for c in child_costs),
+                critical_path=[step for c in child_costs for step in c.critical_path],
+            )
+        else:
+            slowest = max(child_costs, key=lambda c: (c.latency, c.depth), default=NodeCost())
+            cost = NodeCost(
+                calls=sum(c.calls for c in child_costs) if kind == "parallel" else slowest.calls,
+                depth=max((c.depth for c in child_costs), default=0),
+                latency=slowest.latency,
+                critical_path=list(slowest.critical_path),
+            )
+        self._costs[key] = cost
+        return cost
+
+    def _find_duplicates(self, chain: Runnable) -> List[DuplicatedSubgraph]:
+        """複数回参照され、LLM呼び出しを含む最大の部分グラフを列挙する"""
+        duplicates: List[DuplicatedSubgraph] = []
+        reported = set()
+
+        def walk(runnable: Runnable) -> None:
+            key = id(runnable)
+            cost = self._costs.get(key)
+            if (
+                self._occurrences.get(key, 0) > 1
+                and cost is not None
+                and cost.calls > 0
+                and not isinstance(runnable, (BaseLanguageModel, RoutedModel))
+            ):
+                if key not in reported:
+                    reported.add(key)
+                    duplicates.append(DuplicatedSubgraph(runnable.get_name(), self._occurrences[key], cost.calls))
+                return
+            children = child_runnables(runnable)
+            if children:
+                for _, child in children[1]:
+                    walk(child)
+
+        walk(chain)
+        return duplicates
+
+    def _new_node(self, text: str, shape: str = "box") -> str:
+        """Mermaidのノードを追加してIDを返す"""
+        self._node_counter += 1
+        node_id = f"N{self._node_counter}"
+        text = text.replace('"', "'")
+        if shape == "input":
+            self._mermaid_lines.append(f'    {node_id}["{text}"]')
+            self._mermaid_lines.append(f"    style {node_id} fill:#f9f,stroke:#333,stroke-width:2px")
+        elif shape == "parallel":
+            self._mermaid_lines.append(f'    {node_id}{{"{text}"}}')
+            self._mermaid_lines.append(f"    style {node_id} fill:#ff9,stroke:#333,stroke-width:2px")
+        else:
+            self._mermaid_lines.append(f'    {node_id}["{text}"]')
+        return node_id
+
+    def _render(self, runnable: Runnable, label: str, path: List[str]) -> Tuple[List[str], List[str]]:
+        """Runnableを図のノードに展開し、(入口ノード, 出口ノード) を返す"""
+        step_path = path + [label]
+        if isinstance(runnable, (BaseLanguageModel, RoutedModel)):
+            name = model_label(runnable)
+            node_id = self._new_node(f"{name}")
+            self._model_nodes.append((node_id, step_path))
+            return [node_id], [node_id]
+
+        children = child_runnables(runnable)
+        if children is None:
+            node_id = self._new_node(runnable.get_name())
+            return [node_id], [node_id]
+
+        kind, items = children
+        if kind == "sequence":
+            entries: List[str] = []
+            exits: List[str] = []
+            for child_label, child in items:
+                child_entries, child_exits = self._render(child, child_label, step_path)
+                if not entries:
+                    entries = child_entries
+                for src in exits:
+                    for dst in child_entries:
+                        self._mermaid_lines.append(f"    {src} --> {dst}")
+                exits = child_exits
+            return entries, exits
+
+        occurrences = self._occurrences.get(id(runnable), 1)
+        suffix = f" ×{occurrences}" if occurrences > 1 and self._costs.get(id(runnable), NodeCost()).calls else ""
+        fork = self._new_node(f"{runnable.get_name()}{suffix}", shape="parallel")
+        exits = []
+        for child_label, child in items:
+            child_entries, child_exits = self._render(child, child_label, step_path)
+            for dst in child_entries:
+                self._mermaid_lines.append(f"    {fork} --> |{child_label}| {dst}")
+            exits.extend(child_exits)
+        return [fork], exits
+
+    def _build_mermaid(self, critical_path: List[str]) -> str:
+        """ノードと辺からMermaidの図を組み立て、LLM呼び出しとクリティカルパスを強調する"""
+        critical_prefixes = [step.rsplit(" (", 1)[0] for step in critical_path]
+        lines = ["graph TB"] + self._mermaid_lines
+        for node_id, step_path in self._model_nodes:
+            if " > ".join(step_path) in critical_prefixes:
+                lines.append(f"    style {node_id} fill:#f99,stroke:#c00,stroke-width:4px")
+            else:
+                lines.append(f"    style {node_id} fill:#ddf,stroke:#333,stroke-width:2px")
+        return "\n".join(lines)
+
+
+def profile_chain(
+    chain: Runnable,
+    latency_estimates: Optional[Dict[str, float]] = None,
+    default_latency: float = 1.0,
+) -> ChainProfile:
+    """
+    チェーンを実行せずにコストとクリティカルパスを解析する
+
+    Args:
+        chain: 解析対象のチェーン
+        latency_estimates: モデル名ごとの推定レイテンシ（秒）
+        default_latency: 推定値がないモデルのレイテンシ（秒）
+
+    Returns:
+        ChainProfile: 解析結果
+    """
+    return ChainProfiler(latency_estimates, default_latency).profile(chain)
+
+
+def load_tutorial_module(path: str):
+    """
+    数字で始まるチュートリアルのファイルをモジュールとして読み込む
+
+    Args:
+        path: チュートリアルファイルのパス
+
+    Returns:
+        module: 読み込んだモジュール
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    name = os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(f"tutorial_{name}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def main():
+    """
+    解析のメイン関数
+    02_enhanced_parallel_chains.py と basic/04_nested_chain.py のチェーンを解析して表示します。
+    """
+    from fake_model import OfflineChatModel
+
+    parser = argparse.ArgumentParser(description="チェーンの静的コスト・クリティカルパス解析")
+    parser.add_argument("--format", choices=["text", "mermaid"], default="text", help="出力形式")
+    parser.add_argument("--latency", type=float, default=1.0, help="モデルの推定レイテンシ（秒）")
+    args = parser.parse_args()
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    model = OfflineChatModel()
+    chains = {
+        "create_multi_chain": importlib.import_module("02_enhanced_parallel_chains").create_multi_chain(model),
+        "create_nested_chain": load_tutorial_module(
+            os.path.join(here, "..", "basic", "04_nested_chain.py")
+        ).create_nested_chain(model),
+    }
+    for name, chain in chains.items():
+        profile = profile_chain(chain, {model.model_name: args.latency})
+        print(f"\n## {name}\n")
+        if args.format == "mermaid":
+            print(f"```mermaid\n{profile.to_mermaid()}\n```")
+        else:
+            print(profile.to_text())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+"""
+チェーンを常駐させて提供するローカルHTTPサーバーのモジュール
+
+チェーンを実行するにはスクリプトを起動するしかなく、リクエストごとに
+プロセスの起動とチェーンの構築のコストがかかります。
+このモジュールでは、create_* で構築したチェーンをプロセス内に保持し、
+asyncioのイベントループ上で invoke / batch / stream のエンドポイントを提供します。
+標準ライブラリのみで動作し、オフラインモデルでの動作確認にも使えます。
+
+エンドポイント:
+- POST /chains/<名前>/invoke  {"input": {...}}          -> {"output": ...}
+- POST /chains/<名前>/batch   {"inputs": [{...}, ...]}  -> {"outputs": [...]}
+- POST /chains/<名前>/stream  {"input": {...}}          -> 出力のチャンクをNDJSONで逐次返す
+- GET  /chains                                         -> 提供中のチェーン名
+- GET  /metrics                                        -> エンドポイントごとのレイテンシなどのメトリクス
+- GET  /health
+
+同時実行の制御:
+- 同時に実行するリクエストは max_concurrency 件まで（超えた分はキューで待機）
+- キューで待機するリクエストが max_queue 件を超えると 503 を返す
+
+使用例:
+    python chain_server.py --offline --port 8765
+    curl -X POST localhost:8765/chains/multi/invoke -d '{"input": {"animal": "象"}}'
+"""
+
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import time
+from typing import Any, Callable, Dict, Optional
+
+from langchain_core.runnables import Runnable
+from loguru import logger
+
+from perf_metrics import MetricsRecorder
+
+# invoke / stream は対話的な呼び出し、batch はバッチとして扱う（priority_dispatch.py のtraffic_class）
+INTERACTIVE_CONFIG = {"metadata": {"traffic_class": "interactive"}}
+
+# HTTPステータスコードと理由句
+STATUS_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                  500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class HTTPError(Exception):
+    """ステータスコード付きでリクエストを失敗させる例外"""
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class StreamAborted(Exception):
+    """ストリームの途中で失敗したことを示す例外（エラーのチャンクと終端は書き込み済み）"""
+
+
+class ChainServer:
+    """
+    チェーンを常駐させてHTTPで提供するサーバー
+
+    記録されるメトリクス:
+    - timing latency.<エンドポイント> / queue_wait: リクエストの処理時間と待ち時間（秒）
+    - counter requests.<エンドポイント>.<ステータス>: ステータスごとのリクエスト数
+      （エンドポイントは提供中のチェーンの場合 <チェーン名>.<invoke|batch|stream>、
+      health / metrics / chains はその名前、それ以外のパスは not_found）
+    - gauge in_flight / queued: 実行中・待機中のリクエスト数
+    """
+    def __init__(
+        self,
+        chains: Dict[str, Runnable],
+        max_concurrency: int = 8,
+        max_queue: int = 64,
+        metrics: Optional[MetricsRecorder] = None,
+    ):
+        self.chains = chains
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.metrics = metrics or MetricsRecorder()
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._queued = 0
+        self._in_flight = 0
+
+    async def _acquire(self) -> None:
+        """実行枠を確保する（キューが満杯なら503）"""
+        if self._slots.locked() and self._queued >= self.max_queue:
+            raise HTTPError(503, "キューが満杯です。しばらくしてから再試行してください。")
+        self._queued += 1
+        self.metrics.set_gauge("queued", self._queued)
+        wait_started = time.perf_counter()
+        try:
+            await self._slots.acquire()
+        finally:
+            self._queued -= 1
+            self.metrics.set_gauge("queued", self._queued)
+        self.metrics.observe("queue_wait", time.perf_counter() - wait_started)
+        self._in_flight += 1
+        self.metrics.set_gauge("in_flight", self._in_flight)
+
+    def _release(self) -> None:
+        self._in_flight -= 1
+        self.metrics.set_gauge("in_flight", self._in_flight)
+        self._slots.release()
+
+    def _chain(self, name: str) -> Runnable:
+        if name not in self.chains:
+            raise HTTPError(404, f"チェーン {name} は提供されていません。")
+        return self.chains[name]
+
+    async def handle_invoke(self, name: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        """1件の入力でチェーンを実行する"""
+        chain = self._chain(name)
+        await self._acquire()
+        try:
+            return {"output": await chain.ainvoke(body.get("input"), INTERACTIVE_CONFIG)}
+        finally:
+            self._release()
+
+    async def handle_batch(self, name: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        """複数の入力でチェーンを実行する（バッチ全体で1つの実行枠を使う）"""
+        chain = self._chain(name)
+        inputs = body.get("inputs")
+        if not isinstance(inputs, list):
+            raise HTTPError(400, "inputs にはリストを指定してください。")
+        await self._acquire()
+        try:
+            return {"outputs": await chain.abatch(
+                inputs, {"max_concurrency": self.max_concurrency, "metadata": {"traffic_class": "batch"}}
+            )}
+        finally:
+            self._release()
+
+    async def handle_stream(self, name: str, body: Dict[str, Any], writer: asyncio.StreamWriter) -> None:
+        """
+        チェーンの出力のチャンクをNDJSONのチャンク転送で逐次返す
+
+        ヘッダーの送信後にチェーンが失敗した場合は、{"error": ...} のチャンクと終端を書き込んで
+        StreamAborted を送出します（ステータスは送信済みのため、エラーの応答は書き込みません）。
+        """
+        chain = self._chain(name)
+        await self._acquire()
+        try:
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+                b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n"
+            )
+            try:
+                async for chunk in chain.astream(body.get("input"), INTERACTIVE_CONFIG):
+                    self._write_chunk(writer, chunk)
+                    await writer.drain()
+            except Exception as e:
+                logger.error(f"[Server] ストリームの途中でエラーが発生: {str(e)}")
+                self._write_chunk(writer, {"error": str(e)})
+                raise StreamAborted(str(e)) from e
+            finally:
+                writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        finally:
+            self._release()
+
+    @staticmethod
+    def _write_chunk(writer: asyncio.StreamWriter, payload: Any) -> None:
+        line = (json.dumps(payload, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+        writer.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+
+    async def route(self, method: str, path: str, body: Dict[str, Any],
+                    writer: asyncio.StreamWriter) -> Optional[Dict[str, Any]]:
+        """
+        リクエストをエンドポイントに振り分ける
+
+        Returns:
+            Optional[Dict[str, Any]]: 応答本文（ストリームの場合は書き込み済みのためNone）
+        """
+        parts = [part for part in path.split("?")[0].split("/") if part]
+        if method == "GET" and parts == ["health"]:
+            return {"status": "ok"}
+        if method == "GET" and parts == ["metrics"]:
+            return self.metrics.snapshot()
+        if method == "GET" and parts == ["chains"]:
+            return {"chains": sorted(self.chains)}
+        if len(parts) == 3 and parts[0] == "chains" and parts[2] in ("invoke", "batch", "stream"):
+            if method != "POST":
+                raise HTTPError(405, "POSTで呼び出してください。")
+            name, action = parts[1], parts[2]
+            if action == "invoke":
+                return await self.handle_invoke(name, body)
+            if action == "batch":
+                return await self.handle_batch(name, body)
+            await self.handle_stream(name, body, writer)
+            return None
+        raise HTTPError(404, f"{method} {path} は存在しません。")
+
+    def _endpoint(self, path: str) -> str:
+        """
+        メトリクスのエンドポイント名（提供中のチェーンは <チェーン名>.<invoke|batch|stream>）
+
+        クライアントが送ったパスをそのまま名前に使うとメトリクスの系列が際限なく増えるため、
+        登録されていないパスは not_found にまとめる
+        """
+        parts = [part for part in path.split("?")[0].split("/") if part]
+        if parts in (["health"], ["metrics"], ["chains"]):
+            return parts[0]
+        if (len(parts) == 3 and parts[0] == "chains" and parts[1] in self.chains
+                and parts[2] in ("invoke", "batch", "stream")):
+            return f"{parts[1]}.{parts[2]}"
+        return "not_found"
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """1つの接続で1件のリクエストを処理する"""
+        start_time = time.perf_counter()
+        endpoint, status = "unknown", 200
+        try:
+            request_line = (await reader.readline()).decode("latin-1").strip()
+            if not request_line:
+                return
+            request_parts = request_line.split(" ", 2)
+            if len(request_parts) != 3:
+                raise HTTPError(400, "リクエスト行が不正です。")
+            method, path, _ = request_parts
+            endpoint = self._endpoint(path)
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1").strip()
+                if not line:
+                    break
+                key, _, value = line.partition(":")
+                headers[key.strip().lower()] = value.strip()
+            try:
+                content_length = int(headers.get("content-length", 0))
+            except ValueError:
+                raise HTTPError(400, "Content-Length が不正です。")
+            if content_length < 0:
+                raise HTTPError(400, "Content-Length が不正です。")
+            try:
+                raw = await reader.readexactly(content_length)
+            except asyncio.IncompleteReadError:
+                raise HTTPError(400, "リクエスト本文が Content-Length より短いです。")
+            try:
+                body = json.loads(raw) if raw else {}
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                raise HTTPError(400, "リクエスト本文がJSONではありません。")
+            if not isinstance(body, dict):
+                raise HTTPError(400, "リクエスト本文はJSONオブジェクトにしてください。")
+
+            payload = await self.route(method, path, body, writer)
+            if payload is not None:
+                self._write_json(writer, 200, payload)
+        except HTTPError as e:
+            status = e.status
+            self._write_json(writer, status, {"error": str(e)})
+        except StreamAborted:
+            # 応答はストリームの中で書き込み済み
+            status = 500
+        except Exception as e:
+            status = 500
+            logger.error(f"[Server] リクエストの処理中にエラーが発生: {str(e)}")
+            self._write_json(writer, status, {"error": str(e)})
+        finally:
+            self.metrics.observe(f"latency.{endpoint}", time.perf_counter() - start_time)
+            self.metrics.incr(f"requests.{endpoint}.{status}")
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+            writer.close()
+
+    @staticmethod
+    def _write_json(writer: asyncio.StreamWriter, status: int, payload: Any) -> None:
+        data = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status} {STATUS_REASONS.get(status, '')}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode("latin-1") + data
+        )
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8765) -> None:
+        """サーバーを起動して停止されるまで待ち受ける"""
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        logger.success(f"[Server] http://{host}:{port} で待ち受けを開始 (チェーン: {', '.join(sorted(self.chains))})")
+        async with server:
+            await server.serve_forever()
+
+
+def build_chains(model: Optional[Runnable] = None) -> Dict[str, Runnable]:
+    """
+    提供するチェーンを構築する（起動時に1回だけ構築して常駐させる）
+
+    Args:
+        model: 全チェーンで使うチャットモデル（省略時はChatOpenAI）
+
+    Returns:
+        Dict[str, Runnable]: チェーン名とチェーン
+    """
+    from chain_profiler import load_tutorial_module
+
+    factories: Dict[str, Callable[[], Runnable]] = {
+        "basic": lambda: importlib.import_module("01_basic_parallel").create_basic_parallel(model),
+        "multi": lambda: importlib.import_module("02_enhanced_parallel_chains").create_multi_chain(model),
+        "complex": lambda: importlib.import_module("03_complex_parallel").create_complex_parallel(model),
+        "nested": lambda: load_tutorial_module(
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "basic", "04_nested_chain.py")
+        ).create_nested_chain(model),
+    }
+    return {name: factory() for name, factory in factories.items()}
+
+
+def main():
+    """
+    サーバーのメイン関数
+    チェーンを構築して常駐させ、HTTPリクエストを待ち受けます。
+    """
+    from logger_setup import setup_logger, print_tutorial_header
+
+    setup_logger()
+    parser = argparse.ArgumentParser(description="チェーンを常駐させるローカルHTTPサーバー")
+    parser.add_argument("--host", default="127.0.0.1", help="待ち受けるホスト")
+    parser.add_argument("--port", type=int, default=8765, help="待ち受けるポート")
+    parser.add_argument("--max-concurrency", type=int, default=8, help="同時に実行するリクエストの数")
+    parser.add_argument("--max-queue", type=int, default=64, help="待機できるリクエストの数")
+    parser.add_argument("--offline", action="store_true", help="ChatOpenAIの代わりにオフラインモデルを使う")
+    parser.add_argument("--model-capacity", type=int, default=0,
+                        help="モデル呼び出しの共有の実行枠（指定時は対話的な呼び出しをバッチより優先）")
+    args = parser.parse_args()
+
+    print_tutorial_header(os.path.basename(__file__))
+
+    if args.offline:
+        from fake_model import OfflineChatModel
+        model = OfflineChatModel(latency=0.2)
+    else:
+        from dotenv import load_dotenv
+        from langchain_openai import ChatOpenAI
+        load_dotenv()
+        model = ChatOpenAI(temperature=0.7) if args.model_capacity else None
+    if args.model_capacity:
+        from priority_dispatch import PriorityDispatcher
+        model = PriorityDispatcher(capacity=args.model_capacity).wrap(model)
+
+    server = ChainServer(build_chains(model), max_concurrency=args.max_concurrency, max_queue=args.max_queue)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        logger.info("[Server] サーバーを停止しました")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+LLM呼び出しの同時実行数を自動調整するモジュール
+
+バッチ実行の max_concurrency を手動で決めると、低すぎれば待ち時間が無駄になり、
+高すぎれば429エラーやレイテンシの急増を招きます。
+このモジュールでは、実行中に観測したレイテンシとエラーから
+同時実行中のLLM呼び出し数の上限を調整するコントローラーを実装しています。
+
+調整ルール（AIMD + レイテンシ勾配）:
+1. レート制限エラー: 上限を backoff_ratio 倍に縮小（乗算減少）
+2. レイテンシが基準値の latency_tolerance 倍を超過: 上限を latency_backoff_ratio 倍に縮小
+3. それ以外で上限まで使い切っている場合: 1ウィンドウごとに上限を+1（加算増加）
+
+使用例:
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=4, max_limit=32)
+    chain = create_multi_chain(model=limiter.wrap(ChatOpenAI()))
+    chain.batch(inputs, {"max_concurrency": 32})
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+
+from langchain_core.runnables import Runnable, RunnableConfig
+from loguru import logger
+
+from perf_metrics import MetricsRecorder
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """
+    例外がレート制限（HTTP 429）によるものか判定する
+
+    Args:
+        error: 判定する例外
+
+    Returns:
+        bool: レート制限エラーの場合True
+    """
+    if getattr(error, "status_code", None) == 429:
+        return True
+    name = error.__class__.__name__.lower()
+    return "ratelimit" in name or "429" in str(error)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    観測したレイテンシとエラーから同時実行数の上限を調整するリミッター
+
+    公開メトリクス:
+    - gauge concurrency_limit: 現在の上限
+    - gauge in_flight: 実行中の呼び出し数
+    - timing llm_latency / queue_wait: 呼び出しレイテンシと待ち時間
+    - counter throttled / calls: レート制限エラー数と呼び出し数
+    - event limit_change: 上限変更の履歴（理由・前後の値）
+    """
+    def __init__(
+        self,
+        initial_limit: int = 4,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        backoff_ratio: float = 0.5,
+        latency_backoff_ratio: float = 0.9,
+        latency_tolerance: float = 2.0,
+        baseline_window: int = 100,
+        metrics: Optional[MetricsRecorder] = None,
+    ):
+        if not 1 <= min_limit <= initial_limit <= max_limit:
+            raise ValueError("min_limit <= initial_limit <= max_limit を満たす値を指定してください。")
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_ratio = backoff_ratio
+        self.latency_backoff_ratio = latency_backoff_ratio
+        self.latency_tolerance = latency_tolerance
+        self.metrics = metrics or MetricsRecorder()
+
+        self._limit = float(initial_limit)
+        self._in_flight = 0
+        self._condition = threading.Condition()
+        self._recent_latencies: deque = deque(maxlen=baseline_window)
+        self._smoothed_latency: Optional[float] = None
+        self._last_decrease = 0.0
+        self.metrics.set_gauge("concurrency_limit", initial_limit)
+        self.metrics.set_gauge("in_flight", 0)
+
+    @property
+    def limit(self) -> int:
+        """現在の同時実行数の上限"""
+        with self._condition:
+            return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        """実行中の呼び出し数"""
+        with self._condition:
+            return self._in_flight
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """
+        呼び出し枠を確保するコンテキストマネージャー
+
+        上限に空きができるまで待機し、ブロック内の処理時間と例外を観測して上限を調整します。
+        """
+        wait_start = time.perf_counter()
+        with self._condition:
+            while self._in_flight >= int(self._limit):
+                self._condition.wait()
+            self._in_flight += 1
+            self.metrics.set_gauge("in_flight", self._in_flight)
+        self.metrics.observe("queue_wait", time.perf_counter() - wait_start)
+
+        start_time = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            self._on_complete(time.perf_counter() - start_time, e)
+            raise
+        else:
+            self._on_complete(time.perf_counter() - start_time, None)
+
+    def _on_complete(self, latency: float, error: Optional[BaseException]) -> None:
+        """呼び出し完了時に観測値を反映して上限を更新する"""
+        with self._condition:
+            saturated = self._in_flight >= int(self._limit)
+            self._in_flight -= 1
+            self.metrics.set_gauge("in_flight", self._in_flight)
+            self.metrics.incr("calls")
+
+            if error is not None and is_rate_limit_error(error):
+                self.metrics.incr("throttled")
+                self._decrease(self.backoff_ratio, "throttled", latency)
+            elif error is None:
+                self.metrics.observe("llm_latency", latency)
+                self._recent_latencies.append(latency)
+                if self._smoothed_latency is None:
+                    self._smoothed_latency = latency
+                else:
+                    self._smoothed_latency = 0.8 * self._smoothed_latency + 0.2 * latency
+                baseline = min(self._recent_latencies)
+                if self._smoothed_latency > baseline * self.latency_tolerance:
+                    self._decrease(self.latency_backoff_ratio, "latency", latency)
+                elif saturated:
+                    self._set_limit(self._limit + 1 / max(self._limit, 1), "increase", latency)
+            self._condition.notify_all()
+
+    def _decrease(self, ratio: float, reason: str, latency: float) -> None:
+        """上限を縮小する（同じ輻輳で連続して縮小しないようクールダウンを設ける）"""
+        now = time.monotonic()
+        cooldown = self._smoothed_latency or latency
+        if now - self._last_decrease < cooldown:
+            return
+        self._last_decrease = now
+        self._set_limit(self._limit * ratio, reason, latency)
+
+    def _set_limit(self, new_limit: float, reason: str, latency: float) -> None:
+        """上限を範囲内に収めて更新し、整数値が変わった場合にイベントを記録する"""
+        previous = int(self._limit)
+        self._limit = min(float(self.max_limit), max(float(self.min_limit), new_limit))
+        current = int(self._limit)
+        if current != previous:
+            self.metrics.set_gauge("concurrency_limit", current)
+            self.metrics.record_event(
+                "limit_change",
+                reason=reason,
+                previous=previous,
+                current=current,
+                latency=round(latency, 4),
+                smoothed_latency=round(self._smoothed_latency or latency, 4),
+            )
+            logger.debug(f"[Concurrency] 上限を変更: {previous} -> {current} (理由: {reason})")
+
+    def wrap(self, bound: Runnable, max_retries: int = 5) -> "AdaptiveConcurrencyRunnable":
+        """
+        Runnable（主にチャットモデル）をこのリミッターの管理下に置く
+
+        Args:
+            bound: 同時実行数を制御するRunnable
+            max_retries: レート制限エラー時の再試行回数
+
+        Returns:
+            AdaptiveConcurrencyRunnable: 上限を守って呼び出すRunnable
+        """
+        return AdaptiveConcurrencyRunnable(bound, self, max_retries=max_retries)
+
+
+class AdaptiveConcurrencyRunnable(Runnable):
+    """
+    AdaptiveConcurrencyLimiterの枠内でRunnableを呼び出すラッパー
+
+    レート制限エラーの場合は上限の縮小を待ってから再試行します。
+    """
+    def __init__(self, bound: Runnable, limiter: AdaptiveConcurrencyLimiter, max_retries: int = 5):
+        self.bound = bound
+        self.limiter = limiter
+        self.max_retries = max_retries
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        """上限の枠を確保してから呼び出す"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self.limiter.slot():
+                    return self.bound.invoke(input, config, **kwargs)
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == self.max_retries:
+                    raise
+                self.limiter.metrics.incr("retries")
+                time.sleep(min(2.0, 0.05 * 2 ** attempt))
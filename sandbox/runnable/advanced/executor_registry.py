@@ -0,0 +1,311 @@
+"""
+プロセス全体で共有する上限付きスレッドプールのレジストリ
+
+RunnableParallel.invoke は呼び出しごとに新しいスレッドプールを作るため、
+バッチ実行の中で並列チェーンが入れ子になると、スレッド数が上限なく増えていきます。
+このモジュールでは、用途ごとに名前の付いた上限付きのプールを用意し、
+チェーン内の RunnableParallel をそれらのプールで実行する SharedPoolParallel に置き換えます。
+
+標準のプール:
+- io: モデル呼び出しなどのI/O待ちが中心の処理
+- cpu: RunnableLambda などのCPU処理
+- callbacks: ログ出力やコールバック処理（BackgroundCallbackHandler）
+
+デッドロックの回避:
+入れ子の並列チェーンが同じプールを使っても、親は結果を待つ前にまだ開始されていない
+子のタスクを取り消して自分のスレッドで実行するため、プールが埋まっても処理は止まりません。
+
+使用例:
+    chain = use_shared_executors(create_multi_chain())
+    results = chain.batch(inputs, {"max_concurrency": 8})
+    print(get_registry().metrics.snapshot())
+"""
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextvars import copy_context
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler, CallbackManager
+from langchain_core.runnables import (
+    Runnable,
+    RunnableBinding,
+    RunnableConfig,
+    RunnableLambda,
+    RunnableParallel,
+    RunnablePassthrough,
+    RunnableSequence,
+)
+from langchain_core.runnables.config import ensure_config, patch_config, set_config_context
+from loguru import logger
+
+from perf_metrics import MetricsRecorder
+
+# 標準のプール名と最大スレッド数
+DEFAULT_POOL_SIZES = {"io": 16, "cpu": 4, "callbacks": 1}
+
+
+class ExecutorRegistry:
+    """
+    名前付きの上限付きスレッドプールを管理するレジストリ
+
+    記録されるメトリクス:
+    - gauge pool.<名前>.active / pool.<名前>.saturation: 実行中のタスク数と使用率
+    - timing pool.<名前>.queue_wait: タスクが投入されてから開始されるまでの待ち時間（秒）
+    - counter pool.<名前>.submitted / pool.<名前>.inline: 投入したタスク数と呼び出し元で実行したタスク数
+    """
+    def __init__(self, pool_sizes: Optional[Dict[str, int]] = None, metrics: Optional[MetricsRecorder] = None):
+        self.pool_sizes = dict(pool_sizes or DEFAULT_POOL_SIZES)
+        self.metrics = metrics or MetricsRecorder()
+        self._lock = threading.Lock()
+        self._pools: Dict[str, ThreadPoolExecutor] = {}
+        self._active: Dict[str, int] = {}
+
+    def pool(self, name: str) -> ThreadPoolExecutor:
+        """
+        名前付きのプールを取得する（初回の取得時に作成）
+
+        Args:
+            name: プール名
+
+        Returns:
+            ThreadPoolExecutor: 上限付きのスレッドプール
+        """
+        with self._lock:
+            if name not in self._pools:
+                if name not in self.pool_sizes:
+                    raise KeyError(f"登録されていないプールです: {name}")
+                self._pools[name] = ThreadPoolExecutor(
+                    max_workers=self.pool_sizes[name], thread_name_prefix=f"pool-{name}"
+                )
+                self._active[name] = 0
+                logger.debug(f"[Executor] プール {name} を作成しました (max_workers={self.pool_sizes[name]})")
+            return self._pools[name]
+
+    def _track(self, name: str, delta: int) -> None:
+        """実行中のタスク数を更新してゲージに記録する"""
+        with self._lock:
+            self._active[name] += delta
+            active = self._active[name]
+        self.metrics.set_gauge(f"pool.{name}.active", active)
+        self.metrics.set_gauge(f"pool.{name}.saturation", active / self.pool_sizes[name])
+
+    def submit(self, name: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+        """
+        タスクを名前付きのプールに投入する
+
+        Args:
+            name: プール名
+            fn: 実行する関数
+            *args, **kwargs: 関数の引数
+
+        Returns:
+            Future: タスクの結果
+        """
+        executor = self.pool(name)
+        submitted_at = time.perf_counter()
+
+        def run() -> Any:
+            self.metrics.observe(f"pool.{name}.queue_wait", time.perf_counter() - submitted_at)
+            self._track(name, 1)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._track(name, -1)
+
+        self.metrics.incr(f"pool.{name}.submitted")
+        return executor.submit(run)
+
+    def result(self, name: str, future: Future, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        タスクの結果を待つ（まだ開始されていなければ取り消して呼び出し元で実行する）
+
+        Args:
+            name: プール名
+            future: submit() の戻り値
+            fn, *args, **kwargs: submit() に渡した関数と引数
+
+        Returns:
+            Any: タスクの結果
+        """
+        if future.cancel():
+            self.metrics.incr(f"pool.{name}.inline")
+            return fn(*args, **kwargs)
+        return future.result()
+
+    def shutdown(self, wait: bool = True) -> None:
+        """全てのプールを終了する"""
+        with self._lock:
+            pools, self._pools = self._pools, {}
+        for executor in pools.values():
+            executor.shutdown(wait=wait)
+
+
+_registry: Optional[ExecutorRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ExecutorRegistry:
+    """プロセス全体で共有するレジストリを取得する"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ExecutorRegistry()
+        return _registry
+
+
+def configure_registry(pool_sizes: Dict[str, int], metrics: Optional[MetricsRecorder] = None) -> ExecutorRegistry:
+    """
+    共有レジストリをプールの上限を指定して作り直す
+
+    Args:
+        pool_sizes: プール名と最大スレッド数
+        metrics: メトリクスの記録先
+
+    Returns:
+        ExecutorRegistry: 新しい共有レジストリ
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is not None:
+            _registry.shutdown(wait=False)
+        _registry = ExecutorRegistry(pool_sizes, metrics)
+        return _registry
+
+
+def pool_for(step: Runnable) -> str:
+    """ブランチを実行するプールを選ぶ（ラムダやパススルーはcpu、それ以外はio）"""
+    if isinstance(step, (RunnableLambda, RunnablePassthrough)):
+        return "cpu"
+    return "io"
+
+
+class SharedPoolParallel(RunnableParallel):
+    """
+    ブランチを共有レジストリのプールで実行するRunnableParallel
+
+    出力とコールバックの親子関係は RunnableParallel と同じです。
+    """
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Dict[str, Any]:
+        config = ensure_config(config)
+        callback_manager = CallbackManager.configure(
+            inheritable_callbacks=config.get("callbacks"),
+            inheritable_tags=config.get("tags"),
+            inheritable_metadata=config.get("metadata"),
+        )
+        run_manager = callback_manager.on_chain_start(
+            None,
+            input,
+            name=config.get("run_name") or self.get_name(),
+            run_id=config.pop("run_id", None),
+        )
+
+        def invoke_step(step: Runnable, key: str) -> Any:
+            child_config = patch_config(config, callbacks=run_manager.get_child(f"map:key:{key}"))
+            with set_config_context(child_config) as context:
+                return context.run(step.invoke, input, child_config)
+
+        registry = get_registry()
+        try:
+            steps = dict(self.steps__)
+            tasks = []
+            for key, step in steps.items():
+                name = pool_for(step)
+                # プールのスレッドにもコンテキスト変数（トレースなど）を引き継ぐ
+                future = registry.submit(name, copy_context().run, invoke_step, step, key)
+                tasks.append((name, step, key, future))
+            output = {
+                key: registry.result(name, future, copy_context().run, invoke_step, step, key)
+                for name, step, key, future in tasks
+            }
+        except BaseException as e:
+            run_manager.on_chain_error(e)
+            raise
+        run_manager.on_chain_end(output)
+        return output
+
+
+def use_shared_executors(runnable: Runnable) -> Runnable:
+    """
+    チェーン内の RunnableParallel を SharedPoolParallel に置き換える
+
+    RunnableSequence・RunnableParallel・RunnableBinding（with_configなど）の中を再帰的に置き換え、
+    それ以外のRunnableはそのまま残します。
+
+    Args:
+        runnable: 対象のチェーン
+
+    Returns:
+        Runnable: 共有プールで並列実行するチェーン
+    """
+    if isinstance(runnable, RunnableSequence):
+        return RunnableSequence(*[use_shared_executors(step) for step in runnable.steps], name=runnable.name)
+    if isinstance(runnable, RunnableParallel):
+        # RunnableParallelのキーワード引数はブランチとして扱われるため、nameは後から設定する
+        parallel = SharedPoolParallel({key: use_shared_executors(step) for key, step in runnable.steps__.items()})
+        parallel.name = runnable.name
+        return parallel
+    if isinstance(runnable, RunnableBinding):
+        return runnable.model_copy(update={"bound": use_shared_executors(runnable.bound)})
+    return runnable
+
+
+class BackgroundCallbackHandler(BaseCallbackHandler):
+    """
+    コールバック処理を callbacks プールで実行するハンドラー
+
+    UsageCallbackHandler などの集計やログ出力を、モデル呼び出しのスレッドから切り離します。
+    開始と終了のイベントを同じ順序で処理するため、プールのワーカー数は1にしてください。
+    """
+    def __init__(self, inner: BaseCallbackHandler, pool: str = "callbacks"):
+        self.inner = inner
+        self.pool = pool
+
+    def _dispatch(self, event: str, *args: Any, **kwargs: Any) -> None:
+        # 開始イベントの name 引数が submit の引数と衝突しないよう、先に束縛しておく
+        future = get_registry().submit(self.pool, partial(getattr(self.inner, event), *args, **kwargs))
+        future.add_done_callback(lambda done: self._log_error(event, done))
+
+    def _log_error(self, event: str, future: Future) -> None:
+        """ハンドラーで発生した例外を記録する（langchainのコールバックマネージャーと同様に、呼び出し元には伝えない）"""
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            logger.warning(f"[Executor] コールバック {type(self.inner).__name__}.{event} でエラーが発生: {error!r}")
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: Any, **kwargs: Any) -> None:
+        self._dispatch("on_llm_start", serialized, prompts, **kwargs)
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: Any, **kwargs: Any) -> None:
+        # 内側のハンドラーが実装していない場合は、langchainの既定と同じく on_llm_start にフォールバックさせる
+        if type(self.inner).on_chat_model_start is BaseCallbackHandler.on_chat_model_start:
+            raise NotImplementedError
+        self._dispatch("on_chat_model_start", serialized, messages, **kwargs)
+
+    def on_llm_end(self, response: Any, **kwargs: Any) -> None:
+        self._dispatch("on_llm_end", response, **kwargs)
+
+    def on_llm_error(self, error: BaseException, **kwargs: Any) -> None:
+        self._dispatch("on_llm_error", error, **kwargs)
+
+    def on_chain_start(self, serialized: Dict[str, Any], inputs: Any, **kwargs: Any) -> None:
+        self._dispatch("on_chain_start", serialized, inputs, **kwargs)
+
+    def on_chain_end(self, outputs: Any, **kwargs: Any) -> None:
+        self._dispatch("on_chain_end", outputs, **kwargs)
+
+    def on_chain_error(self, error: BaseException, **kwargs: Any) -> None:
+        self._dispatch("on_chain_error", error, **kwargs)
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, **kwargs: Any) -> None:
+        self._dispatch("on_tool_start", serialized, input_str, **kwargs)
+
+    def on_tool_end(self, output: Any, **kwargs: Any) -> None:
+        self._dispatch("on_tool_end", output, **kwargs)
+
+    def on_tool_error(self, error: BaseException, **kwargs: Any) -> None:
+        self._dispatch("on_tool_error", error, **kwargs)
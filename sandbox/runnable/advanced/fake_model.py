@@ -0,0 +1,188 @@
+"""
+オフライン実行用のチャットモデルを提供するモジュール
+
+このモジュールでは、APIキーやネットワークなしでチェーンを実行するための
+ChatOpenAIの代替モデルを実装しています。
+- 決定的な応答（応答関数で差し替え可能）
+- レイテンシの再現（固定値 + 入力・出力トークン比例）
+- トークン使用量の報告（usage_metadata / llm_output）
+- スロットリングの注入（同時実行数が上限を超えると429相当のエラー）
+
+ベンチマークやチェーン構成の比較に使用します。
+"""
+
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import PrivateAttr
+
+from perf_metrics import estimate_tokens
+
+
+def default_responder(prompt: str) -> str:
+    """
+    デフォルトの応答関数
+
+    Args:
+        prompt: モデルへの入力テキスト
+
+    Returns:
+        str: プロンプトの最終行を含む決定的な応答
+    """
+    last_line = prompt.strip().splitlines()[-1] if prompt.strip() else ""
+    return f"「{last_line.strip()}」へのオフライン応答です。"
+
+
+class OfflineRateLimitError(Exception):
+    """オフラインモデルが注入するレート制限エラー（HTTP 429相当）"""
+    status_code = 429
+
+
+class OfflineChatModel(BaseChatModel):
+    """
+    ネットワークを使わないChatOpenAIの代替モデル
+
+    使用例:
+        model = OfflineChatModel(latency=0.2)
+        chain = prompt | model | StrOutputParser()
+    """
+
+    responder: Callable[[str], str] = default_responder
+    """プロンプトから応答テキストを生成する関数"""
+
+    latency: float = 0.05
+    """1回の呼び出しの基本レイテンシ（秒）"""
+
+    latency_per_token: float = 0.0
+    """出力トークン1つあたりの追加レイテンシ（秒）"""
+
+    latency_per_prompt_token: float = 0.0
+    """入力トークン1つあたりの追加レイテンシ（秒）"""
+
+    latency_jitter: float = 0.0
+    """レイテンシに加えるランダムなゆらぎの最大値（秒）"""
+
+    model_name: str = "offline-stand-in"
+    """メトリクスに報告するモデル名"""
+
+    capacity: Optional[int] = None
+    """同時実行数の上限（超えるとOfflineRateLimitErrorを送出、Noneで無制限）"""
+
+    latency_per_inflight: float = 0.0
+    """同時実行中の呼び出し1つあたりの追加レイテンシ（秒）"""
+
+    _inflight: int = PrivateAttr(default=0)
+    _inflight_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self) -> str:
+        return "offline-chat"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name, "latency": self.latency}
+
+    def _render(self, messages: List[BaseMessage]) -> str:
+        """メッセージ列を1つのプロンプト文字列にまとめる"""
+        return "\n".join(str(m.content) for m in messages)
+
+    def _enter(self) -> int:
+        """同時実行数を加算し、上限を超えていればスロットリングする"""
+        with self._inflight_lock:
+            if self.capacity is not None and self._inflight >= self.capacity:
+                raise OfflineRateLimitError(
+                    f"Rate limit exceeded: {self._inflight} requests in flight (capacity={self.capacity})"
+                )
+            self._inflight += 1
+            return self._inflight
+
+    def _exit(self) -> None:
+        """同時実行数を減算する"""
+        with self._inflight_lock:
+            self._inflight -= 1
+
+    def _simulated_latency(self, prompt: str, completion: str, inflight: int = 1) -> float:
+        """応答に対する擬似レイテンシを計算する"""
+        return (
+            self.latency
+            + self.latency_per_prompt_token * estimate_tokens(prompt)
+            + self.latency_per_token * estimate_tokens(completion)
+            + self.latency_per_inflight * (inflight - 1)
+            + random.uniform(0, self.latency_jitter)
+        )
+
+    def _build_result(self, prompt: str, completion: str) -> ChatResult:
+        """応答テキストとトークン使用量からChatResultを組み立てる"""
+        prompt_tokens = estimate_tokens(prompt)
+        completion_tokens = estimate_tokens(completion)
+        message = AIMessage(
+            content=completion,
+            usage_metadata={
+                "input_tokens": prompt_tokens,
+                "output_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        )
+        return ChatResult(
+            generations=[ChatGeneration(message=message)],
+            llm_output={
+                "token_usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+                "model_name": self.model_name,
+            },
+        )
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        prompt = self._render(messages)
+        completion = self.responder(prompt)
+        inflight = self._enter()
+        try:
+            time.sleep(self._simulated_latency(prompt, completion, inflight))
+        finally:
+            self._exit()
+        return self._build_result(prompt, completion)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        prompt = self._render(messages)
+        completion = self.responder(prompt)
+        inflight = self._enter()
+        try:
+            await asyncio.sleep(self._simulated_latency(prompt, completion, inflight))
+        finally:
+            self._exit()
+        return self._build_result(prompt, completion)
+
+    def _combine_llm_outputs(self, llm_outputs: List[Optional[dict]]) -> dict:
+        """複数呼び出しのトークン使用量を合算する"""
+        token_usage: Dict[str, int] = {}
+        for output in llm_outputs:
+            if not output:
+                continue
+            for key, value in output.get("token_usage", {}).items():
+                token_usage[key] = token_usage.get(key, 0) + value
+        return {"token_usage": token_usage, "model_name": self.model_name}
@@ -0,0 +1,162 @@
+"""
+負荷に応じてオプションのブランチを省略するロードシェディングのモジュール
+
+create_multi_chain は常に habitat を、create_complex_parallel は常に cons を計算しますが、
+過負荷の時には呼び出し側が少ない項目で妥協できる場合があります。
+このモジュールでは、ブランチを優先度付きのオプションとして指定し、
+実行中のリクエスト数やレイテンシがしきい値を超えた時にそれらを省略して
+"degraded" マーカーを返すことで、必須ブランチのレイテンシを守ります。
+
+負荷の判定:
+- pressure = max(実行中のリクエスト数 / max_in_flight, 直近のレイテンシ / max_latency)
+- 優先度 p のブランチは pressure >= 1 + (p - 1) * 0.5 の時に省略
+  （優先度1が最初に省略され、優先度が高いほど強い負荷まで維持される）
+
+使用例:
+    monitor = LoadMonitor(max_in_flight=8, max_latency=3.0)
+    chain = shed_optional_branches(create_complex_parallel(), {"cons": 1}, monitor)
+    result = chain.invoke({"topic": "宇宙探査"})
+    # 過負荷時: {"summary": ..., "pros": ..., "cons": None, "degraded": True, "skipped": ["cons"]}
+"""
+
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableParallel, RunnableSequence
+from loguru import logger
+
+from perf_metrics import MetricsRecorder
+
+
+class LoadMonitor:
+    """
+    実行中のリクエスト数と直近のレイテンシから負荷を判定するモニター
+
+    記録されるメトリクス:
+    - gauge in_flight / pressure: 実行中のリクエスト数と負荷
+    - timing latency: リクエストのレイテンシ
+    - counter shed.<ブランチ> / degraded: 省略したブランチの回数と劣化応答の数
+    """
+    def __init__(
+        self,
+        max_in_flight: int = 8,
+        max_latency: float = 5.0,
+        smoothing: float = 0.3,
+        metrics: Optional[MetricsRecorder] = None,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_latency = max_latency
+        self.smoothing = smoothing
+        self.metrics = metrics or MetricsRecorder()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._smoothed_latency = 0.0
+
+    def pressure(self) -> float:
+        """現在の負荷（1.0でしきい値に到達）"""
+        with self._lock:
+            return max(self._in_flight / self.max_in_flight, self._smoothed_latency / self.max_latency)
+
+    def should_shed(self, priority: int) -> bool:
+        """
+        指定した優先度のブランチを省略すべきか判定する
+
+        Args:
+            priority: ブランチの優先度（1が最も低い）
+
+        Returns:
+            bool: 省略する場合True
+        """
+        return self.pressure() >= 1 + (priority - 1) * 0.5
+
+    def enter(self) -> None:
+        """リクエストの開始を記録する"""
+        with self._lock:
+            self._in_flight += 1
+            in_flight = self._in_flight
+        self.metrics.set_gauge("in_flight", in_flight)
+        self.metrics.set_gauge("pressure", self.pressure())
+
+    def exit(self, latency: float) -> None:
+        """リクエストの完了とレイテンシを記録する"""
+        with self._lock:
+            self._in_flight -= 1
+            self._smoothed_latency = (1 - self.smoothing) * self._smoothed_latency + self.smoothing * latency
+            in_flight = self._in_flight
+        self.metrics.set_gauge("in_flight", in_flight)
+        self.metrics.observe("latency", latency)
+
+
+class LoadSheddingParallel(Runnable):
+    """
+    負荷が高い時にオプションのブランチを省略するRunnableParallel
+
+    出力には全ブランチのキーが含まれ、省略したブランチの値はNoneになります。
+    さらに "degraded"（省略があったかどうか）と "skipped"（省略したブランチ名）を追加します。
+    """
+    def __init__(self, branches: Dict[str, Runnable], optional: Dict[str, int], monitor: LoadMonitor):
+        unknown = set(optional) - set(branches)
+        if unknown:
+            raise ValueError(f"存在しないブランチがオプションに指定されています: {sorted(unknown)}")
+        self.branches = branches
+        self.optional = optional
+        self.monitor = monitor
+
+    def get_name(self, suffix: Optional[str] = None, *, name: Optional[str] = None) -> str:
+        return name or f"LoadSheddingParallel<{','.join(self.branches)}>"
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Dict[str, Any]:
+        """負荷を判定し、省略しないブランチだけを並列に実行する"""
+        skipped: List[str] = [
+            name for name, priority in sorted(self.optional.items(), key=lambda item: item[1])
+            if self.monitor.should_shed(priority)
+        ]
+        active = {name: branch for name, branch in self.branches.items() if name not in skipped}
+        if skipped:
+            self.monitor.metrics.incr("degraded")
+            for name in skipped:
+                self.monitor.metrics.incr(f"shed.{name}")
+            logger.warning(f"[LoadShedding] 負荷が高いためブランチを省略します: {skipped}")
+
+        self.monitor.enter()
+        start_time = time.perf_counter()
+        try:
+            result = RunnableParallel(active).invoke(input, config, **kwargs)
+        finally:
+            self.monitor.exit(time.perf_counter() - start_time)
+
+        output = {name: result.get(name) for name in self.branches}
+        output["degraded"] = bool(skipped)
+        output["skipped"] = skipped
+        return output
+
+
+def shed_optional_branches(chain: Runnable, optional: Dict[str, int], monitor: LoadMonitor) -> Runnable:
+    """
+    並列チェーンのブランチを優先度付きのオプションとして指定する
+
+    RunnableParallel の場合はそのブランチを、先頭が RunnableParallel の RunnableSequence
+    （create_multi_chain のように並列部分の結果を後段で使うチェーン）の場合は先頭のブランチを対象にし、
+    後段はそのまま続けます。ブランチ同士が独立していないチェーンでは省略しても負荷が下がらないため、
+    それ以外の形のチェーンはエラーにします。
+
+    Args:
+        chain: 元の並列チェーン（create_multi_chain / create_complex_parallel の戻り値など）
+        optional: オプションにするブランチ名と優先度（1が最も低い）
+        monitor: 負荷を判定するモニター
+
+    Returns:
+        Runnable: 負荷に応じてオプションのブランチを省略するチェーン
+
+    Raises:
+        TypeError: 並列部分が独立したブランチのRunnableParallelでない場合
+    """
+    if isinstance(chain, RunnableParallel):
+        return LoadSheddingParallel(dict(chain.steps__), optional, monitor)
+    if isinstance(chain, RunnableSequence) and isinstance(chain.first, RunnableParallel):
+        shedding = LoadSheddingParallel(dict(chain.first.steps__), optional, monitor)
+        return RunnableSequence(shedding, *chain.steps[1:], name=chain.name)
+    raise TypeError(
+        f"ブランチを省略できるのは RunnableParallel か、先頭が RunnableParallel の RunnableSequence だけです: {type(chain).__name__}"
+    )
@@ -0,0 +1,222 @@
+"""
+ブランチごとにモデルを選択するレイテンシ考慮型ルーターのモジュール
+
+create_multi_chain や create_complex_parallel の全ブランチは同じ
+ChatOpenAI(temperature=0.7) を使っていますが、fun_fact のような簡単なブランチと
+summary のような品質が重要なブランチでは、適したモデルが異なります。
+
+ルーティングの流れ:
+1. プロンプトの推定トークン数がモデルの上限を超える候補を除外
+2. ブランチの最低品質を満たさない候補を除外
+3. 観測したレイテンシ（指数移動平均）がブランチのSLO以内の候補から最も品質の高いモデルを選択
+4. SLOを満たす候補がない場合は最も速いモデルを選択
+
+失敗した呼び出し（タイムアウトなど）は、経過時間とブランチのSLO × failure_penalty の大きい方を
+レイテンシとして反映するため、失敗し続けるモデルは選ばれにくくなります。
+
+使用例:
+    router = LatencyAwareRouter(
+        pool=[ModelOption("fast", fast_model, quality=1, expected_latency=0.5),
+              ModelOption("quality", quality_model, quality=2, expected_latency=2.0)],
+        branch_policies={"fun_fact": BranchPolicy(slo=1.0),
+                         "summary": BranchPolicy(slo=5.0, min_quality=2)},
+    )
+    chain = create_multi_chain(router=router)
+"""
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from langchain_core.prompt_values import PromptValue
+from langchain_core.runnables import Runnable, RunnableConfig
+from loguru import logger
+
+from perf_metrics import MetricsRecorder, estimate_tokens
+
+
+@dataclass
+class ModelOption:
+    """ルーターが選択できるモデル"""
+    name: str
+    model: Runnable
+    quality: int = 1
+    expected_latency: float = 1.0
+    max_prompt_tokens: Optional[int] = None
+
+
+@dataclass
+class BranchPolicy:
+    """ブランチごとのルーティング方針"""
+    slo: float = 2.0
+    min_quality: int = 0
+
+
+class LatencyAwareRouter:
+    """
+    プロンプトサイズ・ブランチのレイテンシSLO・観測レイテンシからモデルを選ぶルーター
+
+    記録されるメトリクス:
+    - event route: ブランチ・選択モデル・推定レイテンシ・選択理由
+    - counter route.<ブランチ>.<モデル>: ブランチごとの選択回数
+    - timing latency.<モデル> / branch_latency.<ブランチ>: 観測レイテンシ
+    - gauge ewma_latency.<モデル>: モデルごとの推定レイテンシ
+    - counter failures.<モデル>: 失敗した呼び出しの数
+    """
+    def __init__(
+        self,
+        pool: List[ModelOption],
+        branch_policies: Optional[Dict[str, BranchPolicy]] = None,
+        default_policy: Optional[BranchPolicy] = None,
+        smoothing: float = 0.3,
+        failure_penalty: float = 2.0,
+        metrics: Optional[MetricsRecorder] = None,
+    ):
+        if not pool:
+            raise ValueError("モデルの候補を1つ以上指定してください。")
+        self.pool = {option.name: option for option in pool}
+        self.branch_policies = branch_policies or {}
+        self.default_policy = default_policy or BranchPolicy()
+        self.smoothing = smoothing
+        self.failure_penalty = failure_penalty
+        self.metrics = metrics or MetricsRecorder()
+        self._lock = threading.Lock()
+        self._ewma = {option.name: option.expected_latency for option in pool}
+        for name, latency in self._ewma.items():
+            self.metrics.set_gauge(f"ewma_latency.{name}", latency)
+
+    def estimated_latency(self, name: str) -> float:
+        """モデルの推定レイテンシ（観測値の指数移動平均）を取得する"""
+        with self._lock:
+            return self._ewma[name]
+
+    def _choose(self, branch: str, prompt_tokens: int):
+        """ルーティング規則に従ってモデルを選び、(モデル, 理由, 推定レイテンシ) を返す"""
+        policy = self.branch_policies.get(branch, self.default_policy)
+        with self._lock:
+            estimates = dict(self._ewma)
+
+        candidates = [
+            option for option in self.pool.values()
+            if option.max_prompt_tokens is None or prompt_tokens <= option.max_prompt_tokens
+        ] or list(self.pool.values())
+        qualified = [option for option in candidates if option.quality >= policy.min_quality] or candidates
+        within_slo = [option for option in qualified if estimates[option.name] <= policy.slo]
+
+        if within_slo:
+            chosen = max(within_slo, key=lambda o: (o.quality, -estimates[o.name]))
+            return chosen, "best_quality_within_slo", estimates[chosen.name], policy
+        chosen = min(qualified, key=lambda o: estimates[o.name])
+        return chosen, "fastest_slo_unreachable", estimates[chosen.name], policy
+
+    def preview(self, branch: str, prompt_tokens: int = 0) -> ModelOption:
+        """
+        メトリクスを記録せずに、現時点で選択されるモデルを取得する
+
+        Args:
+            branch: ブランチ名
+            prompt_tokens: プロンプトの推定トークン数
+
+        Returns:
+            ModelOption: 選択されるモデル
+        """
+        return self._choose(branch, prompt_tokens)[0]
+
+    def select(self, branch: str, prompt_tokens: int) -> ModelOption:
+        """
+        ブランチとプロンプトサイズからモデルを選択し、判断をメトリクスに記録する
+
+        Args:
+            branch: ブランチ名
+            prompt_tokens: プロンプトの推定トークン数
+
+        Returns:
+            ModelOption: 選択されたモデル
+        """
+        chosen, reason, estimate, policy = self._choose(branch, prompt_tokens)
+        self.metrics.incr(f"route.{branch}.{chosen.name}")
+        self.metrics.record_event(
+            "route",
+            branch=branch,
+            model=chosen.name,
+            reason=reason,
+            prompt_tokens=prompt_tokens,
+            estimated_latency=round(estimate, 4),
+            slo=policy.slo,
+        )
+        logger.debug(f"[Router] {branch} -> {chosen.name} ({reason})")
+        return chosen
+
+    def observe(self, branch: str, name: str, latency: float) -> None:
+        """
+        呼び出しの観測レイテンシを反映する
+
+        Args:
+            branch: ブランチ名
+            name: モデル名
+            latency: 観測レイテンシ（秒）
+        """
+        self._update_estimate(name, latency)
+        self.metrics.observe(f"latency.{name}", latency)
+        self.metrics.observe(f"branch_latency.{branch}", latency)
+
+    def observe_failure(self, branch: str, name: str, elapsed: float) -> None:
+        """
+        失敗した呼び出しを反映する（SLOに応じたペナルティのレイテンシとして推定値に加える）
+
+        Args:
+            branch: ブランチ名
+            name: モデル名
+            elapsed: 失敗するまでの経過時間（秒）
+        """
+        policy = self.branch_policies.get(branch, self.default_policy)
+        penalty = max(elapsed, policy.slo * self.failure_penalty)
+        self._update_estimate(name, penalty)
+        self.metrics.incr(f"failures.{name}")
+        logger.debug(f"[Router] {name} の呼び出しが失敗したため推定レイテンシに {penalty:.2f}秒 を反映しました")
+
+    def _update_estimate(self, name: str, latency: float) -> None:
+        with self._lock:
+            self._ewma[name] = (1 - self.smoothing) * self._ewma[name] + self.smoothing * latency
+            current = self._ewma[name]
+        self.metrics.set_gauge(f"ewma_latency.{name}", current)
+
+    def for_branch(self, branch: str) -> "RoutedModel":
+        """
+        指定ブランチ用のルーティングRunnableを作成する
+
+        Args:
+            branch: ブランチ名
+
+        Returns:
+            RoutedModel: 呼び出しごとにモデルを選択するRunnable
+        """
+        return RoutedModel(self, branch)
+
+
+class RoutedModel(Runnable):
+    """
+    呼び出しごとにLatencyAwareRouterでモデルを選択して実行するRunnable
+
+    チェーン内ではチャットモデルと同じ位置（prompt | model | parser）に置けます。
+    """
+    def __init__(self, router: LatencyAwareRouter, branch: str):
+        self.router = router
+        self.branch = branch
+
+    def get_name(self, suffix: Optional[str] = None, *, name: Optional[str] = None) -> str:
+        return name or f"RoutedModel<{self.branch}>"
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        """プロンプトサイズを推定してモデルを選択し、観測レイテンシ（失敗時はペナルティ）を記録する"""
+        text = input.to_string() if isinstance(input, PromptValue) else str(input)
+        option = self.router.select(self.branch, estimate_tokens(text))
+        start_time = time.perf_counter()
+        try:
+            result = option.model.invoke(input, config, **kwargs)
+        except Exception:
+            self.router.observe_failure(self.branch, option.name, time.perf_counter() - start_time)
+            raise
+        self.router.observe(self.branch, option.name, time.perf_counter() - start_time)
+        return result
@@ -0,0 +1,177 @@
+"""
+チェーン実行のメトリクスを収集するモジュール
+
+このモジュールでは、並列チェーンのパフォーマンス計測に使う
+共通の部品を提供します。
+1. スレッドセーフなメトリクスレコーダー（カウンター・ゲージ・計測値・イベント）
+2. LLM呼び出し回数とトークン使用量を集計するコールバックハンドラー
+3. ローカルで完結する簡易トークン数推定
+"""
+
+import math
+import threading
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    テキストのトークン数を簡易的に推定する
+
+    日本語などのCJK文字は1文字1トークン、それ以外は4文字1トークンとして数えます。
+    トークナイザーを使わずにローカルで高速に計算できます。
+
+    Args:
+        text: 推定対象のテキスト
+
+    Returns:
+        int: 推定トークン数
+    """
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if ord(ch) >= 0x3000)
+    other = len(text) - cjk
+    return cjk + math.ceil(other / 4)
+
+
+class MetricsRecorder:
+    """
+    スレッドセーフなメトリクスレコーダー
+
+    記録できるメトリクス:
+    - counter: 単調増加するカウンター（呼び出し回数など）
+    - gauge: 現在値（同時実行数の上限など）
+    - timing: 計測値の系列（レイテンシなど、直近 max_samples 件からパーセンタイルを計算可能）
+    - event: 判断の履歴（ルーティングや上限変更の理由など）
+    """
+    def __init__(self, max_events: int = 1000, max_samples: int = 10000):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._gauges: Dict[str, float] = {}
+        # 常駐するプロセスでもメモリが増え続けないよう、系列ごとに直近の計測値だけを保持する
+        self._timings: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=max_samples))
+        self._timing_counts: Dict[str, int] = defaultdict(int)
+        self._events: List[Dict[str, Any]] = []
+        self._max_events = max_events
+
+    def incr(self, name: str, value: float = 1) -> None:
+        """カウンターを加算する"""
+        with self._lock:
+            self._counters[name] += value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        """ゲージの現在値を設定する"""
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, value: float) -> None:
+        """計測値を系列に追加する"""
+        with self._lock:
+            self._timings[name].append(value)
+            self._timing_counts[name] += 1
+
+    def record_event(self, name: str, **fields: Any) -> None:
+        """判断の履歴をイベントとして記録する（古いものから破棄）"""
+        with self._lock:
+            self._events.append({"event": name, **fields})
+            if len(self._events) > self._max_events:
+                del self._events[0]
+
+    def counter(self, name: str) -> float:
+        """カウンターの現在値を取得する"""
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def gauge(self, name: str, default: Optional[float] = None) -> Optional[float]:
+        """ゲージの現在値を取得する"""
+        with self._lock:
+            return self._gauges.get(name, default)
+
+    def percentile(self, name: str, q: float) -> Optional[float]:
+        """
+        計測値系列のパーセンタイルを計算する
+
+        Args:
+            name: 計測値の名前
+            q: パーセンタイル（0〜100）
+
+        Returns:
+            Optional[float]: パーセンタイル値（データがない場合はNone）
+        """
+        with self._lock:
+            values = sorted(self._timings.get(name, []))
+        if not values:
+            return None
+        index = min(len(values) - 1, max(0, math.ceil(q / 100 * len(values)) - 1))
+        return values[index]
+
+    def events(self, name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """記録されたイベントを取得する（nameを指定すると絞り込み）"""
+        with self._lock:
+            return [e for e in self._events if name is None or e["event"] == name]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        現在のメトリクスを辞書として取得する
+
+        Returns:
+            Dict[str, Any]: counters, gauges, timings（件数・直近の計測値の平均・p50・p95）
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            names = list(self._timings)
+        timings = {}
+        for name in names:
+            with self._lock:
+                values = list(self._timings[name])
+                count = self._timing_counts[name]
+            timings[name] = {
+                "count": count,
+                "mean": sum(values) / len(values) if values else None,
+                "p50": self.percentile(name, 50),
+                "p95": self.percentile(name, 95),
+            }
+        return {"counters": counters, "gauges": gauges, "timings": timings}
+
+
+class UsageCallbackHandler(BaseCallbackHandler):
+    """
+    LLM呼び出し回数とトークン使用量を集計するコールバックハンドラー
+
+    集計されるメトリクス:
+    - llm_calls: LLM呼び出し回数
+    - prompt_tokens: 入力トークン数
+    - completion_tokens: 出力トークン数
+    - llm_errors: LLM呼び出しのエラー数
+    """
+    def __init__(self, metrics: Optional[MetricsRecorder] = None):
+        self.metrics = metrics or MetricsRecorder()
+
+    def on_llm_end(self, response, **kwargs) -> None:
+        """LLMの終了時に呼び出し回数とトークン数を加算する"""
+        self.metrics.incr("llm_calls")
+        prompt_tokens, completion_tokens = 0, 0
+        for gens in response.generations:
+            for gen in gens:
+                usage = getattr(getattr(gen, "message", None), "usage_metadata", None)
+                if usage:
+                    prompt_tokens += usage.get("input_tokens", 0)
+                    completion_tokens += usage.get("output_tokens", 0)
+        if not prompt_tokens and not completion_tokens and response.llm_output:
+            token_usage = response.llm_output.get("token_usage", {}) or {}
+            prompt_tokens = token_usage.get("prompt_tokens", 0)
+            completion_tokens = token_usage.get("completion_tokens", 0)
+        self.metrics.incr("prompt_tokens", prompt_tokens)
+        self.metrics.incr("completion_tokens", completion_tokens)
+
+    def on_llm_error(self, error: BaseException, **kwargs) -> None:
+        """LLMでエラーが発生した時にエラー数を加算する"""
+        self.metrics.incr("llm_errors")
+
+    @property
+    def total_tokens(self) -> float:
+        """入力と出力の合計トークン数"""
+        return self.metrics.counter("prompt_tokens") + self.metrics.counter("completion_tokens")
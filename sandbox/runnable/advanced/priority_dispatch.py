@@ -0,0 +1,318 @@
+"""
+対話的なリクエストとバッチのモデル呼び出しを優先度付きで振り分けるモジュール
+
+Streamlitアプリやチェーンサーバーからの対話的な呼び出しと、夜間の create_complex_parallel の
+バッチ実行は同じレート制限を共有しているため、大きなバッチが対話的な利用者を待たせてしまいます。
+このモジュールでは、全てのモデル呼び出しの前に優先度付きの振り分け層を置きます。
+
+振り分けの方法:
+- トラフィックの種類（interactive / batch など）ごとにキューを持つ
+- 重み付き公平スケジューリング（Start-time Fair Queuing）で次に実行する呼び出しを選ぶ
+  （重みが4:1なら、両方が待っている間は4:1の割合で実行枠を割り当てる）
+- キューが満杯の時に優先度の高い呼び出しが届くと、待機中のバッチ呼び出しを追い出す（preemption）
+  追い出された呼び出し（とキューが満杯で並べなかった呼び出し）は少し待ってから並び直す
+
+トラフィックの種類は config の metadata で指定し、チェーン内の全てのモデル呼び出しに引き継がれます。
+invoke はスレッドで、ainvoke はイベントループ上で（スレッドを使わずに）順番を待ちます。
+
+使用例:
+    dispatcher = PriorityDispatcher(capacity=4)
+    chain = create_complex_parallel(dispatcher.wrap(ChatOpenAI()))
+    chain.invoke({"topic": "宇宙探査"}, {"metadata": {"traffic_class": "interactive"}})
+    chain.batch(inputs, {"metadata": {"traffic_class": "batch"}})
+"""
+
+import asyncio
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from langchain_core.runnables import Runnable, RunnableConfig
+from loguru import logger
+
+from perf_metrics import MetricsRecorder
+
+# トラフィックの種類ごとの重みの初期値
+DEFAULT_WEIGHTS = {"interactive": 4.0, "batch": 1.0}
+
+
+class DispatchQueueFullError(Exception):
+    """キューが満杯で、追い出せる呼び出しもない場合のエラー"""
+
+
+class PreemptedError(Exception):
+    """優先度の高い呼び出しのためにキューから追い出された場合のエラー"""
+
+
+class _Ticket:
+    """キューで待機中の呼び出し（非同期の呼び出しは状態が変わった時にイベントで起こす）"""
+    __slots__ = ("traffic_class", "tag", "seq", "enqueued_at", "preempted", "loop", "event")
+
+    def __init__(self, traffic_class: str, tag: float, seq: int):
+        self.traffic_class = traffic_class
+        self.tag = tag
+        self.seq = seq
+        self.enqueued_at = time.perf_counter()
+        self.preempted = False
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.event: Optional[asyncio.Event] = None
+
+    def wake(self) -> None:
+        if self.event is not None:
+            self.loop.call_soon_threadsafe(self.event.set)
+
+
+class PriorityDispatcher:
+    """
+    共有の実行枠をトラフィックの種類ごとに重み付きで割り当てるディスパッチャー
+
+    記録されるメトリクス:
+    - timing wait.<種類>: キューでの待ち時間（秒）
+    - counter dispatched.<種類> / preempted.<種類>: 実行した呼び出しと追い出された呼び出しの数
+    - gauge queued.<種類> / in_flight: 待機中・実行中の呼び出しの数
+    """
+    def __init__(
+        self,
+        capacity: int = 4,
+        weights: Optional[Dict[str, float]] = None,
+        max_queue: int = 256,
+        preemptible: Sequence[str] = ("batch",),
+        metrics: Optional[MetricsRecorder] = None,
+    ):
+        """
+        Args:
+            capacity: 同時に実行できるモデル呼び出しの数（共有のレート制限に合わせる）
+            weights: トラフィックの種類ごとの重み
+            max_queue: 全ての種類を合わせたキューの上限
+            preemptible: キューが満杯の時に追い出せる種類
+            metrics: メトリクスの記録先
+        """
+        self.capacity = capacity
+        self.weights = dict(weights or DEFAULT_WEIGHTS)
+        self.max_queue = max_queue
+        self.preemptible = set(preemptible)
+        self.metrics = metrics or MetricsRecorder()
+        self._cond = threading.Condition()
+        self._queue: List[_Ticket] = []
+        self._in_flight = 0
+        self._virtual_time = 0.0
+        self._last_tag: Dict[str, float] = {}
+        self._seq = itertools.count()
+
+    def _update_gauges(self) -> None:
+        for traffic_class in self.weights:
+            self.metrics.set_gauge(
+                f"queued.{traffic_class}", sum(1 for t in self._queue if t.traffic_class == traffic_class)
+            )
+        self.metrics.set_gauge("in_flight", self._in_flight)
+
+    def _notify(self) -> None:
+        """状態が変わったことを待機中の呼び出しに伝える（ロックを取得した状態で呼び出す）"""
+        self._cond.notify_all()
+        for ticket in self._queue:
+            ticket.wake()
+
+    def _preempt_for(self, traffic_class: str) -> bool:
+        """キューが満杯の時に、最後に並んだ追い出し可能な呼び出しを追い出す"""
+        if traffic_class in self.preemptible:
+            return False
+        victims = [t for t in self._queue if t.traffic_class in self.preemptible]
+        if not victims:
+            return False
+        victim = max(victims, key=lambda t: t.seq)
+        victim.preempted = True
+        self._queue.remove(victim)
+        victim.wake()
+        self.metrics.incr(f"preempted.{victim.traffic_class}")
+        logger.debug(f"[Dispatch] {traffic_class} のために待機中の {victim.traffic_class} を追い出しました")
+        return True
+
+    def _enqueue(self, traffic_class: str, loop: Optional[asyncio.AbstractEventLoop] = None) -> _Ticket:
+        """呼び出しをキューに並べる（ロックを取得した状態で呼び出す）"""
+        weight = self.weights.get(traffic_class, 1.0)
+        if len(self._queue) >= self.max_queue and not self._preempt_for(traffic_class):
+            raise DispatchQueueFullError(f"キューが満杯です (max_queue={self.max_queue})")
+        # Start-time Fair Queuing: 種類ごとの直前のタグと仮想時刻の大きい方から 1/重み 進める
+        tag = max(self._virtual_time, self._last_tag.get(traffic_class, 0.0)) + 1.0 / weight
+        self._last_tag[traffic_class] = tag
+        ticket = _Ticket(traffic_class, tag, next(self._seq))
+        if loop is not None:
+            ticket.loop, ticket.event = loop, asyncio.Event()
+        self._queue.append(ticket)
+        self._update_gauges()
+        self._notify()
+        return ticket
+
+    def _try_dispatch(self, ticket: _Ticket) -> bool:
+        """
+        順番が来ていれば実行枠を割り当てる（ロックを取得した状態で呼び出す）
+
+        Raises:
+            PreemptedError: 待機中に優先度の高い呼び出しに追い出された場合
+        """
+        if ticket.preempted:
+            self._update_gauges()
+            self._notify()
+            raise PreemptedError(f"{ticket.traffic_class} の呼び出しがキューから追い出されました")
+        head = min(self._queue, key=lambda t: (t.tag, t.seq))
+        if head is not ticket or self._in_flight >= self.capacity:
+            return False
+        self._queue.remove(ticket)
+        self._in_flight += 1
+        self._virtual_time = max(self._virtual_time, ticket.tag - 1.0 / self.weights.get(ticket.traffic_class, 1.0))
+        self._update_gauges()
+        self._notify()
+        return True
+
+    def _dispatched(self, ticket: _Ticket) -> None:
+        self.metrics.observe(f"wait.{ticket.traffic_class}", time.perf_counter() - ticket.enqueued_at)
+        self.metrics.incr(f"dispatched.{ticket.traffic_class}")
+
+    def acquire(self, traffic_class: str) -> None:
+        """
+        実行枠を確保する（順番が来るまでスレッドで待機する）
+
+        Args:
+            traffic_class: トラフィックの種類
+
+        Raises:
+            DispatchQueueFullError: キューが満杯で追い出せる呼び出しもない場合
+            PreemptedError: 待機中に優先度の高い呼び出しに追い出された場合
+        """
+        with self._cond:
+            ticket = self._enqueue(traffic_class)
+            while not self._try_dispatch(ticket):
+                self._cond.wait()
+        self._dispatched(ticket)
+
+    async def aacquire(self, traffic_class: str) -> None:
+        """
+        実行枠を確保する（順番が来るまでイベントループ上で待機し、スレッドを占有しない）
+
+        Args:
+            traffic_class: トラフィックの種類
+
+        Raises:
+            DispatchQueueFullError: キューが満杯で追い出せる呼び出しもない場合
+            PreemptedError: 待機中に優先度の高い呼び出しに追い出された場合
+        """
+        with self._cond:
+            ticket = self._enqueue(traffic_class, asyncio.get_running_loop())
+        try:
+            while True:
+                with self._cond:
+                    if self._try_dispatch(ticket):
+                        break
+                    ticket.event.clear()
+                await ticket.event.wait()
+        except asyncio.CancelledError:
+            # 待機中にキャンセルされた場合はキューから外す
+            with self._cond:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    self._update_gauges()
+                    self._notify()
+            raise
+        self._dispatched(ticket)
+
+    def release(self) -> None:
+        """実行枠を解放する"""
+        with self._cond:
+            self._in_flight -= 1
+            self._update_gauges()
+            self._notify()
+
+    @contextmanager
+    def slot(self, traffic_class: str) -> Iterator[None]:
+        """実行枠を確保して処理を実行するコンテキストマネージャー"""
+        self.acquire(traffic_class)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def wrap(
+        self,
+        model: Runnable,
+        default_class: str = "interactive",
+        retry_delay: float = 0.05,
+        max_requeues: int = 100,
+    ) -> "PrioritizedModel":
+        """
+        モデルをディスパッチャー経由で呼び出すRunnableで包む
+
+        Args:
+            model: 包むモデル
+            default_class: metadataにtraffic_classがない場合の種類
+            retry_delay: 追い出された後やキューが満杯の時に並び直すまでの待ち時間（秒）
+            max_requeues: 並び直す回数の上限（超えた場合は最後のエラーを送出する）
+
+        Returns:
+            PrioritizedModel: 優先度付きで呼び出すモデル
+        """
+        return PrioritizedModel(model, self, default_class, retry_delay, max_requeues)
+
+
+class PrioritizedModel(Runnable):
+    """
+    PriorityDispatcherで実行枠を確保してからモデルを呼び出すRunnable
+
+    チェーン内ではチャットモデルと同じ位置（prompt | model | parser）に置けます。
+    """
+    def __init__(
+        self,
+        model: Runnable,
+        dispatcher: PriorityDispatcher,
+        default_class: str,
+        retry_delay: float,
+        max_requeues: int = 100,
+    ):
+        self.model = model
+        self.dispatcher = dispatcher
+        self.default_class = default_class
+        self.retry_delay = retry_delay
+        self.max_requeues = max_requeues
+
+    def get_name(self, suffix: Optional[str] = None, *, name: Optional[str] = None) -> str:
+        return name or f"Prioritized<{self.model.get_name()}>"
+
+    def _traffic_class(self, config: Optional[RunnableConfig]) -> str:
+        return ((config or {}).get("metadata") or {}).get("traffic_class", self.default_class)
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        """
+        metadataのtraffic_classで実行枠を確保してモデルを呼び出す
+
+        追い出された場合やキューが満杯の場合は、retry_delay秒待ってから最大 max_requeues 回並び直します。
+        """
+        traffic_class = self._traffic_class(config)
+        for attempt in range(self.max_requeues + 1):
+            try:
+                self.dispatcher.acquire(traffic_class)
+                break
+            except (PreemptedError, DispatchQueueFullError):
+                if attempt == self.max_requeues:
+                    raise
+                time.sleep(self.retry_delay)
+        try:
+            return self.model.invoke(input, config, **kwargs)
+        finally:
+            self.dispatcher.release()
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        """invoke と同じ方法で、イベントループ上で実行枠を待ってからモデルを非同期に呼び出す"""
+        traffic_class = self._traffic_class(config)
+        for attempt in range(self.max_requeues + 1):
+            try:
+                await self.dispatcher.aacquire(traffic_class)
+                break
+            except (PreemptedError, DispatchQueueFullError):
+                if attempt == self.max_requeues:
+                    raise
+                await asyncio.sleep(self.retry_delay)
+        try:
+            return await self.model.ainvoke(input, config, **kwargs)
+        finally:
+            self.dispatcher.release()
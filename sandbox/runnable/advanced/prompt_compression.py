@@ -0,0 +1,189 @@
+"""
+チェーンの段階間で中間テキストを圧縮するモジュール
+
+basic/04_nested_chain.py の create_nested_chain では、1回目の応答の全文が
+{"text": RunnablePassthrough()} を通して outer_prompt に渡されるため、
+説明文が長いと2回目の呼び出しの入力トークン数とレイテンシが増えます。
+このモジュールでは、LLMを使わない抽出型の文スコアリングで中間テキストを
+トークン予算内に収める圧縮器を提供します。
+
+スコアリングの方法:
+- 文をテキスト全体での出現頻度の高い語（英数字の単語・日本語の文字bigram）を多く含むほど高く評価
+- 長い文が有利にならないよう、語数の平方根で正規化
+- 先頭の文（話題の導入）には加点
+- スコアの高い順に予算内で選び、元の順序で連結
+
+使用例:
+    compressor = ExtractiveCompressor(token_budget=120)
+    chain = create_nested_chain(compressor=compressor)
+"""
+
+import math
+import re
+from collections import Counter
+from typing import List, Optional
+
+from loguru import logger
+
+from perf_metrics import MetricsRecorder, estimate_tokens
+
+# 文の区切り（句点・感嘆符・疑問符・改行）で分割し、区切り文字は文に含める
+SENTENCE_PATTERN = re.compile(r"[^。！？!?\.\n]*(?:[。！？!?\.]+|\n+|$)")
+WORD_PATTERN = re.compile(r"[A-Za-z0-9]+")
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    テキストを文に分割する（連結すると元のテキストに戻る）
+
+    Args:
+        text: 分割するテキスト
+
+    Returns:
+        List[str]: 文のリスト
+    """
+    return [sentence for sentence in SENTENCE_PATTERN.findall(text) if sentence]
+
+
+def extract_terms(text: str) -> List[str]:
+    """
+    スコアリングに使う語を抽出する（英数字は単語、日本語などは文字bigram）
+
+    Args:
+        text: 対象のテキスト
+
+    Returns:
+        List[str]: 語のリスト
+    """
+    terms = [word.lower() for word in WORD_PATTERN.findall(text)]
+    cjk = [ch if ord(ch) >= 0x3000 and ch not in "。、！？「」" else " " for ch in text]
+    for i in range(len(cjk) - 1):
+        if cjk[i] != " " and cjk[i + 1] != " ":
+            terms.append(cjk[i] + cjk[i + 1])
+    return terms
+
+
+def text_similarity(a: str, b: str) -> float:
+    """
+    2つのテキストの類似度（語の出現回数のコサイン類似度）を計算する
+
+    Args:
+        a, b: 比較するテキスト
+
+    Returns:
+        float: 0.0〜1.0の類似度
+    """
+    counts_a, counts_b = Counter(extract_terms(a)), Counter(extract_terms(b))
+    dot = sum(count * counts_b[term] for term, count in counts_a.items())
+    norm = math.sqrt(sum(v * v for v in counts_a.values())) * math.sqrt(sum(v * v for v in counts_b.values()))
+    if norm == 0:
+        return 1.0 if a == b else 0.0
+    return dot / norm
+
+
+def truncate_to_budget(text: str, token_budget: int) -> str:
+    """
+    テキストの先頭からトークン予算に収まる部分だけを残す
+
+    Args:
+        text: 切り詰めるテキスト
+        token_budget: トークン数の上限
+
+    Returns:
+        str: 予算内に収まる先頭部分
+    """
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(text[:middle]) <= token_budget:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low]
+
+
+class ExtractiveCompressor:
+    """
+    抽出型の文スコアリングでテキストをトークン予算内に圧縮するクラス
+
+    チェーンには関数と同じように RunnableLambda(compressor) として組み込めます。
+
+    記録されるメトリクス:
+    - timing compression.input_tokens / compression.output_tokens: 圧縮前後のトークン数
+    - counter compression.saved_tokens / compression.compressed: 削減したトークン数と圧縮した回数
+    """
+    def __init__(self, token_budget: int, lead_bonus: float = 0.5, metrics: Optional[MetricsRecorder] = None):
+        """
+        Args:
+            token_budget: 圧縮後のトークン数の上限
+            lead_bonus: 先頭の文に加えるスコアの割合
+            metrics: メトリクスの記録先
+        """
+        self.token_budget = token_budget
+        self.lead_bonus = lead_bonus
+        self.metrics = metrics or MetricsRecorder()
+
+    def score_sentences(self, sentences: List[str]) -> List[float]:
+        """
+        文ごとのスコアを計算する
+
+        Args:
+            sentences: 文のリスト
+
+        Returns:
+            List[float]: 文と同じ順序のスコア
+        """
+        frequencies = Counter(term for sentence in sentences for term in extract_terms(sentence))
+        scores = []
+        for sentence in sentences:
+            terms = set(extract_terms(sentence))
+            scores.append(sum(frequencies[term] for term in terms) / math.sqrt(len(terms)) if terms else 0.0)
+        if scores:
+            scores[0] += self.lead_bonus * max(scores)
+        return scores
+
+    def compress(self, text: str) -> str:
+        """
+        テキストをトークン予算内に圧縮する（予算内ならそのまま返す）
+
+        Args:
+            text: 圧縮するテキスト
+
+        Returns:
+            str: 選んだ文を元の順序で連結したテキスト（予算に収まる文がない場合は、
+                スコアが最も高い文を予算で切り詰めたもの）
+        """
+        input_tokens = estimate_tokens(text)
+        self.metrics.observe("compression.input_tokens", input_tokens)
+        if input_tokens <= self.token_budget:
+            self.metrics.observe("compression.output_tokens", input_tokens)
+            return text
+
+        sentences = split_sentences(text)
+        scores = self.score_sentences(sentences)
+        selected, used = set(), 0
+        for index in sorted(range(len(sentences)), key=lambda i: (-scores[i], i)):
+            tokens = estimate_tokens(sentences[index])
+            if used + tokens <= self.token_budget:
+                selected.add(index)
+                used += tokens
+        if selected:
+            compressed = "".join(sentences[i] for i in sorted(selected)).strip()
+        else:
+            # 予算に収まる文が1つもない場合は、空の文脈を渡さないようにスコアが最も高い文を予算で切り詰める
+            best = max(range(len(sentences)), key=lambda i: (scores[i], -i))
+            selected.add(best)
+            compressed = truncate_to_budget(sentences[best].strip(), self.token_budget)
+
+        output_tokens = estimate_tokens(compressed)
+        self.metrics.observe("compression.output_tokens", output_tokens)
+        self.metrics.incr("compression.saved_tokens", input_tokens - output_tokens)
+        self.metrics.incr("compression.compressed")
+        logger.debug(
+            f"[Compression] {input_tokens} -> {output_tokens} トークン "
+            f"({len(selected)}/{len(sentences)} 文を保持)"
+        )
+        return compressed
+
+    def __call__(self, text: str) -> str:
+        return self.compress(text)
@@ -0,0 +1,203 @@
+"""
+小さなプロンプトを1回のLLM呼び出しにまとめるモジュール
+
+「{animal}について1文で説明してください。」のような短いプロンプトをバッチ実行すると、
+1件ごとのリクエストのオーバーヘッドが処理時間の大半を占めます。
+このモジュールでは、K件分のプロンプトを番号付きの1つのリクエストにまとめ（パッキング）、
+JSON形式の応答を入力ごとの結果に分割して返します。
+
+処理の流れ:
+1. 入力をpack_size件ずつのグループに分割
+2. 各グループのプロンプトを番号付きで1つの依頼文にまとめる
+3. JSON応答を検証し、番号ごとの結果に分割
+4. 解析できなかった項目だけを個別呼び出しで再実行（フォールバック）
+"""
+
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import Runnable, RunnableConfig
+from loguru import logger
+
+PACKED_PROMPT_HEADER = (
+    "以下の{count}個の依頼にそれぞれ回答してください。\n"
+    "回答は依頼の番号（文字列）をキー、回答文を値とするJSONオブジェクトのみで出力してください。\n"
+    '例: {{"1": "回答1", "2": "回答2"}}\n'
+)
+
+_CODE_FENCE_PATTERN = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+def render_prompt_text(prompt: ChatPromptTemplate, input_data: Dict[str, Any]) -> str:
+    """
+    プロンプトテンプレートを展開して依頼文のテキストを取得する
+
+    Args:
+        prompt: 展開するプロンプトテンプレート
+        input_data: テンプレート変数の辞書
+
+    Returns:
+        str: 展開されたメッセージ本文を改行で連結したもの
+    """
+    return "\n".join(str(m.content) for m in prompt.format_messages(**input_data))
+
+
+def build_packed_prompt(items: List[str]) -> str:
+    """
+    複数の依頼文を番号付きの1つのプロンプトにまとめる
+
+    Args:
+        items: 依頼文のリスト
+
+    Returns:
+        str: パッキングされたプロンプト
+    """
+    lines = [PACKED_PROMPT_HEADER.format(count=len(items))]
+    for number, item in enumerate(items, start=1):
+        body = " ".join(item.split())
+        lines.append(f"{number}. {body}")
+    return "\n".join(lines)
+
+
+def parse_packed_response(text: str, count: int) -> Dict[int, str]:
+    """
+    パッキングされた応答を番号ごとの結果に分割する
+
+    検証内容:
+    - JSONオブジェクトとして解析できること
+    - キーが1〜countの番号であること
+    - 値が空でない文字列であること
+
+    Args:
+        text: モデルの応答テキスト
+        count: 依頼の件数
+
+    Returns:
+        Dict[int, str]: 検証に成功した項目（0始まりの位置 -> 回答）
+    """
+    cleaned = _CODE_FENCE_PATTERN.sub("", text.strip())
+    try:
+        data = json.loads(cleaned)
+    except json.JSONDecodeError:
+        start, end = cleaned.find("{"), cleaned.rfind("}")
+        if start < 0 or end <= start:
+            return {}
+        try:
+            data = json.loads(cleaned[start:end + 1])
+        except json.JSONDecodeError:
+            return {}
+    if not isinstance(data, dict):
+        return {}
+
+    parsed = {}
+    for key, value in data.items():
+        try:
+            number = int(str(key).strip().rstrip("."))
+        except ValueError:
+            continue
+        if 1 <= number <= count and isinstance(value, str) and value.strip():
+            parsed[number - 1] = value.strip()
+    return parsed
+
+
+class PackedPromptRunnable(Runnable[Dict[str, Any], str]):
+    """
+    バッチ実行時にプロンプトをパッキングするRunnable
+
+    invokeは通常の `prompt | model | parser` と同じ1件ずつの呼び出しを行い、
+    batchではpack_size件ずつまとめて1回のLLM呼び出しで処理します。
+    """
+    def __init__(self, prompt: ChatPromptTemplate, model: BaseChatModel, pack_size: int = 8):
+        if pack_size < 1:
+            raise ValueError("pack_sizeは1以上を指定してください。")
+        self.prompt = prompt
+        self.model = model
+        self.pack_size = pack_size
+        self.single_chain = prompt | model | StrOutputParser()
+
+    def invoke(self, input: Dict[str, Any], config: Optional[RunnableConfig] = None, **kwargs: Any) -> str:
+        """1件の入力を通常のチェーンで処理する"""
+        return self.single_chain.invoke(input, config, **kwargs)
+
+    def batch(
+        self,
+        inputs: List[Dict[str, Any]],
+        config: Optional[RunnableConfig] = None,
+        *,
+        return_exceptions: bool = False,
+        **kwargs: Any,
+    ) -> List[str]:
+        """
+        複数の入力をパッキングして処理する
+
+        Args:
+            inputs: 入力データのリスト
+            config: 全呼び出しに共通の実行設定（max_concurrency、callbacksなど）
+
+        Returns:
+            List[str]: 入力と同じ順序の結果リスト
+        """
+        if not inputs:
+            return []
+        if isinstance(config, list):
+            config = config[0] if config else None
+
+        groups = [
+            list(range(start, min(start + self.pack_size, len(inputs))))
+            for start in range(0, len(inputs), self.pack_size)
+        ]
+        packed_prompts = [
+            build_packed_prompt([render_prompt_text(self.prompt, inputs[i]) for i in group])
+            for group in groups
+        ]
+        logger.debug(f"[Packing] {len(inputs)}件を{len(groups)}回の呼び出しにまとめます")
+
+        responses = self.model.batch(packed_prompts, config, return_exceptions=True)
+
+        results: List[Optional[str]] = [None] * len(inputs)
+        for group, response in zip(groups, responses):
+            if isinstance(response, Exception):
+                logger.warning(f"[Packing] パッキング呼び出しが失敗しました: {response}")
+                continue
+            parsed = parse_packed_response(str(response.content), len(group))
+            for position, answer in parsed.items():
+                results[group[position]] = answer
+
+        failed = [i for i, result in enumerate(results) if result is None]
+        if failed:
+            logger.warning(f"[Packing] {len(failed)}件の解析に失敗したため個別に再実行します")
+            fallback = self.single_chain.batch(
+                [inputs[i] for i in failed], config, return_exceptions=return_exceptions, **kwargs
+            )
+            for i, answer in zip(failed, fallback):
+                results[i] = answer
+        return results
+
+
+def batch_packed_parallel(
+    branches: Dict[str, PackedPromptRunnable],
+    inputs: List[Dict[str, Any]],
+    config: Optional[RunnableConfig] = None,
+) -> List[Dict[str, str]]:
+    """
+    複数のパッキングブランチを並列にバッチ実行する
+
+    RunnableParallel.batchと同じ形（入力ごとに {ブランチ名: 結果} の辞書）で結果を返します。
+
+    Args:
+        branches: ブランチ名とPackedPromptRunnableの辞書
+        inputs: 入力データのリスト
+        config: 実行設定
+
+    Returns:
+        List[Dict[str, str]]: 入力ごとの結果辞書
+    """
+    with ThreadPoolExecutor(max_workers=max(1, len(branches))) as executor:
+        futures = {name: executor.submit(branch.batch, inputs, config) for name, branch in branches.items()}
+        outputs = {name: future.result() for name, future in futures.items()}
+    return [{name: outputs[name][i] for name in branches} for i in range(len(inputs))]
@@ -0,0 +1,217 @@
+"""
+チェーンの実行結果を列指向の形式で保存するモジュール
+
+execute_chain / execute_parallel_chain の結果は logger.success でテキストとして出力されるだけなので、
+大量の結果を分析するにはログを解析する必要があります。
+このモジュールでは、結果をバッファに溜めてバッチごとに列指向のファイルへ書き出します。
+分析側は必要な列だけを読み込めます。
+
+保存形式:
+- parquet: pyarrowがインストールされている場合（part-00000.parquet, part-00001.parquet, ...）
+- columnar: pyarrowがない場合のフォールバック（part-00000/<列名>.json.gz に列ごとの値の配列）
+
+列:
+- input.<キー> / output.<キー>: 入力と出力のフィールド（文字列以外はJSON文字列）
+- latency: 実行時間（秒）
+- prompt_tokens / completion_tokens: トークン使用量
+- timestamp: 記録時刻（UNIX時間）
+
+使用例:
+    with ResultSink("results") as sink:
+        execute_chain(chain, {"animal": "象"}, sink=sink)
+    columns = read_columns("results", ["output.summary", "latency"])
+"""
+
+import glob
+import gzip
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+from perf_metrics import UsageCallbackHandler
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrowがない環境では列ごとのJSONファイルにフォールバック
+    pa = None
+    pq = None
+
+
+def _to_cell(value: Any) -> Any:
+    """列に格納する値に変換する（数値・文字列・None以外はJSON文字列）"""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if hasattr(value, "model_dump"):
+        value = value.model_dump()
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+def _flatten(prefix: str, data: Any) -> Dict[str, Any]:
+    """辞書を「接頭辞.キー」の列に展開する（辞書以外は「接頭辞」の1列）"""
+    if isinstance(data, dict):
+        return {f"{prefix}.{key}": _to_cell(value) for key, value in data.items()}
+    return {prefix: _to_cell(data)}
+
+
+class ResultSink:
+    """
+    チェーンの実行結果をバッチごとに列指向のファイルへ書き出すクラス
+
+    スレッドセーフで、バッチ実行の各スレッドから record() を呼び出せます。
+    """
+    def __init__(self, path: str, batch_size: int = 1000, format: Optional[str] = None):
+        """
+        Args:
+            path: 出力先のディレクトリ
+            batch_size: 1つのファイルにまとめる結果の件数
+            format: "parquet" または "columnar"（省略時はpyarrowの有無で決定）
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.format = format or ("parquet" if pa is not None else "columnar")
+        if self.format == "parquet" and pa is None:
+            raise ImportError("parquet形式で保存するには pyarrow をインストールしてください。")
+        self._lock = threading.Lock()
+        self._rows: List[Dict[str, Any]] = []
+        os.makedirs(path, exist_ok=True)
+        self._part = len(glob.glob(os.path.join(path, "part-*")))
+
+    def record(
+        self,
+        input_data: Any,
+        output: Any,
+        latency: float,
+        prompt_tokens: float = 0,
+        completion_tokens: float = 0,
+    ) -> None:
+        """
+        実行結果を1件追加する（バッファがbatch_sizeに達したら書き出す）
+
+        Args:
+            input_data: チェーンの入力
+            output: チェーンの出力
+            latency: 実行時間（秒）
+            prompt_tokens: 入力トークン数
+            completion_tokens: 出力トークン数
+        """
+        row = {
+            **_flatten("input", input_data),
+            **_flatten("output", output),
+            "latency": latency,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "timestamp": time.time(),
+        }
+        with self._lock:
+            self._rows.append(row)
+            if len(self._rows) < self.batch_size:
+                return
+            rows, self._rows = self._rows, []
+            part = self._part
+            self._part += 1
+        self._write(rows, part)
+
+    def flush(self) -> None:
+        """バッファに残っている結果を書き出す"""
+        with self._lock:
+            rows, self._rows = self._rows, []
+            part = self._part
+            if rows:
+                self._part += 1
+        if rows:
+            self._write(rows, part)
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self) -> "ResultSink":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def _write(self, rows: List[Dict[str, Any]], part: int) -> None:
+        """結果のバッチを列ごとにまとめて1つのパートとして書き出す"""
+        names = sorted({name for row in rows for name in row})
+        columns = {name: [row.get(name) for row in rows] for name in names}
+        if self.format == "parquet":
+            target = os.path.join(self.path, f"part-{part:05d}.parquet")
+            pq.write_table(pa.Table.from_pydict(columns), target)
+        else:
+            target = os.path.join(self.path, f"part-{part:05d}")
+            os.makedirs(target, exist_ok=True)
+            for name, values in columns.items():
+                with gzip.open(os.path.join(target, f"{name}.json.gz"), "wt", encoding="utf-8") as f:
+                    json.dump(values, f, ensure_ascii=False)
+        logger.debug(f"[ResultSink] {len(rows)}件を {target} に書き出しました")
+
+
+def read_columns(path: str, columns: List[str]) -> Dict[str, List[Any]]:
+    """
+    保存された結果から指定した列だけを読み込む
+
+    Args:
+        path: ResultSinkの出力先のディレクトリ
+        columns: 読み込む列名
+
+    Returns:
+        Dict[str, List[Any]]: 列名ごとの値のリスト（列がないパートの値はNone）
+    """
+    result: Dict[str, List[Any]] = {name: [] for name in columns}
+    for part in sorted(glob.glob(os.path.join(path, "part-*"))):
+        if part.endswith(".parquet"):
+            if pq is None:
+                raise ImportError("parquet形式の結果を読み込むには pyarrow をインストールしてください。")
+            available = [name for name in columns if name in pq.read_schema(part).names]
+            table = pq.read_table(part, columns=available)
+            size = table.num_rows
+            for name in columns:
+                result[name].extend(table.column(name).to_pylist() if name in available else [None] * size)
+        else:
+            size = None
+            values: Dict[str, Optional[List[Any]]] = {}
+            for name in columns:
+                file = os.path.join(part, f"{name}.json.gz")
+                if os.path.exists(file):
+                    with gzip.open(file, "rt", encoding="utf-8") as f:
+                        values[name] = json.load(f)
+                    size = len(values[name])
+                else:
+                    values[name] = None
+            if size is None:
+                # 要求した列がどれもない場合は件数だけを timestamp 列から取得する
+                with gzip.open(os.path.join(part, "timestamp.json.gz"), "rt", encoding="utf-8") as f:
+                    size = len(json.load(f))
+            for name in columns:
+                result[name].extend(values[name] if values[name] is not None else [None] * size)
+    return result
+
+
+def invoke_with_sink(chain: Any, input_data: Any, sink: ResultSink) -> Any:
+    """
+    チェーンを実行し、実行時間とトークン使用量とともに結果をシンクに記録する
+
+    Args:
+        chain: 実行するチェーン
+        input_data: 入力データ
+        sink: 記録先のシンク
+
+    Returns:
+        Any: チェーンの実行結果
+    """
+    usage = UsageCallbackHandler()
+    start_time = time.perf_counter()
+    result = chain.invoke(input_data, {"callbacks": [usage]})
+    sink.record(
+        input_data,
+        result,
+        time.perf_counter() - start_time,
+        prompt_tokens=usage.metrics.counter("prompt_tokens"),
+        completion_tokens=usage.metrics.counter("completion_tokens"),
+    )
+    return result
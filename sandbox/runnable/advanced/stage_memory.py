@@ -0,0 +1,261 @@
+"""
+チェーンのステージごとのメモリ使用量を計測するモジュール
+
+DebugCallbackHandler のログ出力と大きな中間文字列を組み合わせた長時間のバッチ実行で
+常駐メモリが増え続ける場合に、どのステージが原因かを特定するための計測ツールです。
+tracemalloc で各Runnableノードの開始・終了時のメモリを計測し、
+ステージごとの割り当て箇所の上位とinvokeごとのピークメモリを記録します。
+バッチの最後には、計測開始時からの差分レポートをファイルに出力します。
+
+スナップショットの取得は重い処理のため、計測時のみ有効にしてください（オプトイン）。
+ステージごとのメモリ増加は全ての実行で軽量なカウンタ（tracemalloc.get_traced_memory）から記録し、
+割り当て箇所のスナップショットはステージごとに最初の site_samples 回だけ取得します。
+同時に実行されるinvokeがある場合、メモリ増加やピークメモリはそれらを合わせた値になります。
+
+使用例:
+    profiler = StageMemoryProfiler()
+    with profiler:
+        chain.batch(inputs, {"callbacks": [profiler]})
+    profiler.write_report("memory_report.txt")
+
+    # CLI（オフラインモデルで複合チェーンを実行）
+    python stage_memory.py --chain multi --inputs 20 --report memory_report.txt
+"""
+
+import argparse
+import importlib
+import os
+import threading
+import tracemalloc
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from loguru import logger
+
+from perf_metrics import MetricsRecorder
+
+# 計測結果から除外するファイル（計測処理自身の割り当て）
+IGNORED_FILES = (tracemalloc.__file__, __file__)
+
+
+class StageMemoryProfiler(BaseCallbackHandler):
+    """
+    Runnableノードごとにtracemallocのスナップショットを取得するコールバックハンドラー
+
+    記録されるメトリクス:
+    - timing memory.peak_bytes: invokeごとのピークメモリ（バイト）
+    - timing memory.stage.<ステージ>: ステージ実行中に増えたメモリ（バイト）
+    """
+    def __init__(
+        self,
+        top_n: int = 5,
+        frames: int = 1,
+        site_samples: int = 3,
+        metrics: Optional[MetricsRecorder] = None,
+    ):
+        """
+        Args:
+            top_n: レポートに出力する割り当て箇所の数
+            frames: 割り当て箇所として記録するスタックフレームの深さ
+            site_samples: ステージごとにスナップショットを取得する回数
+            metrics: メトリクスの記録先
+        """
+        self.top_n = top_n
+        self.frames = frames
+        self.site_samples = site_samples
+        self.metrics = metrics or MetricsRecorder()
+        self._lock = threading.Lock()
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._started: Dict[UUID, Tuple[str, int, Optional[tracemalloc.Snapshot]]] = {}
+        self._stage_sites: Dict[str, Counter] = defaultdict(Counter)
+        self._samples: Counter = Counter()
+        self._active_roots = 0
+        self._owns_tracing = False
+
+    def start(self) -> None:
+        """計測を開始する（tracemallocが無効なら有効にする）"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._owns_tracing = True
+        self._baseline = self._snapshot()
+        logger.info("[Memory] tracemallocによるメモリ計測を開始しました")
+
+    def stop(self) -> None:
+        """計測を終了する（start()で有効にした場合のみtracemallocを停止）"""
+        if self._owns_tracing:
+            tracemalloc.stop()
+            self._owns_tracing = False
+
+    def __enter__(self) -> "StageMemoryProfiler":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        """計測処理自身の割り当てを除いたスナップショットを取得する"""
+        return tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, filename) for filename in IGNORED_FILES]
+        )
+
+    def _on_start(self, name: str, run_id: UUID, parent_run_id: Optional[UUID]) -> None:
+        """ステージの開始時のメモリ使用量（とサンプリング対象ならスナップショット）を保存する"""
+        if not tracemalloc.is_tracing():
+            return
+        with self._lock:
+            if parent_run_id is None:
+                if self._active_roots == 0:
+                    tracemalloc.reset_peak()
+                self._active_roots += 1
+            sample = self._samples[name] < self.site_samples
+            if sample:
+                self._samples[name] += 1
+        snapshot = self._snapshot() if sample else None
+        with self._lock:
+            self._started[run_id] = (name, tracemalloc.get_traced_memory()[0], snapshot)
+
+    def _on_end(self, run_id: UUID, parent_run_id: Optional[UUID]) -> None:
+        """ステージの終了時に開始時との差分を集計する"""
+        with self._lock:
+            started = self._started.pop(run_id, None)
+        if started is None or not tracemalloc.is_tracing():
+            return
+        name, current_before, before = started
+        self.metrics.observe(f"memory.stage.{name}", tracemalloc.get_traced_memory()[0] - current_before)
+        if before is not None:
+            stats = self._snapshot().compare_to(before, "lineno")
+            with self._lock:
+                sites = self._stage_sites[name]
+                for stat in stats:
+                    if stat.size_diff > 0:
+                        frame = stat.traceback[0]
+                        sites[f"{frame.filename}:{frame.lineno}"] += stat.size_diff
+
+        if parent_run_id is None:
+            with self._lock:
+                self._active_roots -= 1
+            peak = tracemalloc.get_traced_memory()[1]
+            self.metrics.observe("memory.peak_bytes", peak)
+            logger.debug(f"[Memory] invoke完了 ピークメモリ {peak / 1024:.1f} KiB")
+
+    def on_chain_start(self, serialized: Optional[Dict[str, Any]], inputs: Any, *, run_id: UUID,
+                       parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        name = kwargs.get("name") or (serialized or {}).get("name", "chain")
+        self._on_start(name, run_id, parent_run_id)
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        self._on_end(run_id, parent_run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID,
+                       parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        self._on_end(run_id, parent_run_id)
+
+    def on_llm_start(self, serialized: Optional[Dict[str, Any]], prompts: List[str], *, run_id: UUID,
+                     parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        name = kwargs.get("name") or (serialized or {}).get("name", "llm")
+        self._on_start(name, run_id, parent_run_id)
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        self._on_end(run_id, parent_run_id)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID,
+                     parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        self._on_end(run_id, parent_run_id)
+
+    def top_sites(self, stage: str) -> List[Tuple[str, int]]:
+        """
+        ステージの割り当て箇所の上位を取得する
+
+        Args:
+            stage: ステージ名
+
+        Returns:
+            List[Tuple[str, int]]: (ファイル:行, 増えたバイト数) のリスト
+        """
+        with self._lock:
+            return self._stage_sites[stage].most_common(self.top_n)
+
+    def write_report(self, path: str) -> str:
+        """
+        ステージごとの集計と計測開始時からの差分をレポートに出力する
+
+        Args:
+            path: レポートの出力先
+
+        Returns:
+            str: レポートの内容
+        """
+        lines = ["# ステージごとのメモリ増加（合計の大きい順）"]
+        timings = self.metrics.snapshot()["timings"]
+        stages = sorted(
+            (name[len("memory.stage."):] for name in timings if name.startswith("memory.stage.")),
+            key=lambda stage: -timings[f"memory.stage.{stage}"]["mean"] * timings[f"memory.stage.{stage}"]["count"],
+        )
+        for stage in stages:
+            summary = timings[f"memory.stage.{stage}"]
+            lines.append(f"\n## {stage} (実行回数 {summary['count']}, 平均 {summary['mean'] / 1024:.1f} KiB)")
+            lines.append(f"  割り当て箇所の上位（最初の{self.site_samples}回の合計）:")
+            for site, size in self.top_sites(stage):
+                lines.append(f"  {size / 1024:10.1f} KiB  {site}")
+
+        if "memory.peak_bytes" in timings:
+            peak = timings["memory.peak_bytes"]
+            lines.append(
+                f"\n# invokeごとのピークメモリ: p50 {peak['p50'] / 1024:.1f} KiB / p95 {peak['p95'] / 1024:.1f} KiB"
+            )
+
+        if self._baseline is not None and tracemalloc.is_tracing():
+            lines.append("\n# 計測開始時からの差分（残っている割り当ての上位）")
+            for stat in self._snapshot().compare_to(self._baseline, "lineno")[: self.top_n * 2]:
+                lines.append(f"  {stat}")
+
+        report = "\n".join(lines) + "\n"
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(report)
+        logger.success(f"[Memory] メモリレポートを {path} に出力しました")
+        return report
+
+
+def main():
+    """
+    メモリ計測のメイン関数
+    オフラインモデルで create_multi_chain / create_nested_chain をバッチ実行し、レポートを出力します。
+    """
+    from chain_profiler import load_tutorial_module
+    from fake_model import OfflineChatModel
+    from logger_setup import setup_logger, print_tutorial_header
+
+    setup_logger()
+    parser = argparse.ArgumentParser(description="チェーンのステージごとのメモリ計測")
+    parser.add_argument("--chain", choices=["multi", "nested"], default="multi", help="対象のチェーン")
+    parser.add_argument("--inputs", type=int, default=20, help="入力の件数")
+    parser.add_argument("--response-size", type=int, default=2000, help="オフラインモデルの応答の文字数")
+    parser.add_argument("--max-concurrency", type=int, default=4, help="バッチ実行の同時実行数")
+    parser.add_argument("--report", default="memory_report.txt", help="レポートの出力先")
+    args = parser.parse_args()
+
+    print_tutorial_header(os.path.basename(__file__))
+
+    # 大きな中間文字列を再現するため、長い応答を返すオフラインモデルを使う
+    model = OfflineChatModel(latency=0.01, responder=lambda prompt: prompt[-40:] + "あ" * args.response_size)
+    if args.chain == "multi":
+        module = importlib.import_module("02_enhanced_parallel_chains")
+        chain = module.create_multi_chain(model.with_config(callbacks=[module.DebugCallbackHandler()]))
+        inputs = [{"animal": f"動物{i}"} for i in range(args.inputs)]
+    else:
+        chain = load_tutorial_module(
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "basic", "04_nested_chain.py")
+        ).create_nested_chain(model)
+        inputs = [{"topic": f"トピック{i}", "style": "わかりやすく"} for i in range(args.inputs)]
+
+    profiler = StageMemoryProfiler()
+    with profiler:
+        chain.batch(inputs, {"max_concurrency": args.max_concurrency, "callbacks": [profiler]})
+        print(profiler.write_report(args.report))
+
+
+if __name__ == "__main__":
+    main()
@@ -5,12 +5,14 @@ Runnableの入れ子構造を使用したチェーン作成モジュール
 より複雑な処理フローを実現する方法を説明します。
 """
 
-from typing import Dict
+from typing import Callable, Dict, List, Optional
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
+from langchain_core.output_parsers import PydanticOutputParser, StrOutputParser
+from langchain_core.exceptions import OutputParserException
 from langchain_core.runnables import RunnableLambda, RunnablePassthrough
+from pydantic import BaseModel, Field
 from logger_setup import setup_logger, print_tutorial_header
 import os
 
@@ -45,7 +47,75 @@ def log_intermediate_result(result: str) -> str:
     logger.info("-" * 40)
     return result
 
-def create_nested_chain():
+class ExplanationWithBullets(BaseModel):
+    """1回の呼び出しで生成する説明文と箇条書きのスキーマ"""
+    explanation: str = Field(min_length=1, description="トピックの説明文")
+    bullets: List[str] = Field(min_length=1, description="説明文を箇条書きにしたもの")
+
+def parse_structured_output(text: str) -> ExplanationWithBullets:
+    """
+    構造化出力を検証してスキーマに変換する関数
+
+    Args:
+        text (str): モデルの応答テキスト（JSON）
+
+    Returns:
+        ExplanationWithBullets: 検証済みの説明文と箇条書き
+
+    Raises:
+        OutputParserException: JSONの解析やスキーマの検証に失敗した場合
+    """
+    parser = PydanticOutputParser(pydantic_object=ExplanationWithBullets)
+    try:
+        return parser.parse(text)
+    except OutputParserException as e:
+        logger.warning(f"構造化出力の検証に失敗したため2段階の呼び出しにフォールバックします: {str(e)[:200]}")
+        raise
+
+def format_bullets(result: ExplanationWithBullets) -> str:
+    """構造化出力の箇条書きを2段階チェーンと同じ文字列形式に変換する関数"""
+    log_intermediate_result(result.explanation)
+    return "\n".join(f"- {bullet.lstrip('-・* ').strip()}" for bullet in result.bullets)
+
+def create_structured_nested_chain(model=None, fallback_chain=None):
+    """
+    説明文の生成と箇条書き化を1回の構造化出力呼び出しにまとめたチェーンを作成します。
+
+    2段階のチェーンでは説明文の生成と箇条書き化で2回LLMを呼び出しますが、
+    このチェーンは explanation と bullets を持つJSONを1回の呼び出しで生成し、
+    JSONが不正な場合だけ2段階のチェーンを使います。
+
+    Args:
+        model: 使用するチャットモデル（省略時はChatOpenAI）
+        fallback_chain: 検証失敗時に使う2段階のチェーン（省略時はcreate_nested_chainで作成）
+
+    Returns:
+        Runnable: 箇条書きの文字列を返すチェーン
+    """
+    logger.info("構造化出力チェーンの作成を開始")
+    structured_model = model if model is not None else ChatOpenAI()
+    if fallback_chain is None:
+        fallback_chain = create_nested_chain(model)
+
+    structured_prompt = ChatPromptTemplate.from_template(
+        "{formatted_topic}の説明を{style}書き、その説明文を箇条書きにしてください。\n"
+        "回答は次の形式のJSONオブジェクトのみで出力してください：\n"
+        '{{"explanation": "説明文", "bullets": ["箇条書き1", "箇条書き2"]}}'
+    )
+
+    chain = (
+        RunnableLambda(format_input)                   # 入力の整形
+        | structured_prompt                            # 説明と箇条書きをまとめて依頼
+        | structured_model                             # 1回のChatGPT呼び出し
+        | StrOutputParser()                            # 文字列に変換
+        | RunnableLambda(parse_structured_output)      # スキーマの検証
+        | RunnableLambda(format_bullets)               # 箇条書きの文字列に変換
+    ).with_fallbacks([fallback_chain], exceptions_to_handle=(OutputParserException,))
+
+    logger.info("構造化出力チェーンの作成が完了")
+    return chain
+
+def create_nested_chain(model=None, compressor: Optional[Callable[[str], str]] = None):
     """
     Runnableの入れ子構造を使用したチェーンを作成します。
 
@@ -62,10 +132,17 @@ def create_nested_chain():
         - 説明文の箇条書き化
         - 最終的な文字列生成
 
+    Args:
+        model: 使用するチャットモデル（省略時はChatOpenAI）
+        compressor: 中間結果を外部チェーンに渡す前に圧縮する関数
+            （例: advanced/prompt_compression.py の ExtractiveCompressor、省略時は全文を渡す）
+
     Returns:
         Runnable: 入れ子構造を持つ複雑なチェーン
     """
     logger.info("チェーンの作成を開始")
+    inner_model = model if model is not None else ChatOpenAI()
+    outer_model = model if model is not None else ChatOpenAI()
 
     # 内部チェーン: トピックの説明を生成
     inner_prompt = ChatPromptTemplate.from_template(
@@ -83,12 +160,18 @@ def create_nested_chain():
     # チェーンの組み立て
     chain = (
         inner_chain                        # 内部チェーンで説明を生成
-        | ChatOpenAI()                    # ChatGPTで処理
+        | inner_model                     # ChatGPTで処理
         | StrOutputParser()               # 文字列に変換
         | RunnableLambda(log_intermediate_result)  # 中間結果のログ出力
+    )
+    if compressor is not None:
+        chain = chain | RunnableLambda(compressor, name="compress_intermediate")  # 中間結果の圧縮
+        logger.info("中間結果の圧縮を有効化")
+    chain = (
+        chain
         | {"text": RunnablePassthrough()} # 中間結果の保持
         | outer_prompt                    # 外部チェーンで箇条書きに変換
-        | ChatOpenAI()                    # 再度ChatGPTで処理
+        | outer_model                     # 再度ChatGPTで処理
         | StrOutputParser()               # 最終的な文字列に変換
     )
 
@@ -129,8 +212,11 @@ def main():
     
     logger.info("=== Runnableの入れ子構造を使用したチェーンの実演を開始 ===")
     
-    # チェーンの作成
-    chain = create_nested_chain()
+    # チェーンの作成（STRUCTURED_OUTPUT=1 で1回の構造化出力呼び出しにまとめる）
+    if os.getenv("STRUCTURED_OUTPUT") == "1":
+        chain = create_structured_nested_chain()
+    else:
+        chain = create_nested_chain()
     
     # テスト用の入力
     test_input = {
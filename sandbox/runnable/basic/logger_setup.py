@@ -1,11 +1,23 @@
 from loguru import logger
+import atexit
+import cProfile
+import os
 import sys
+import threading
+import time
+from collections import Counter
 from art import text2art
 
+# CPUプロファイラの設定（環境変数 TUTORIAL_PROFILE またはコマンドライン引数 --profile で有効化）
+# - sample: 全スレッドのスタックを一定間隔で採取し、フレームグラフ用のcollapsed形式で出力
+# - cprofile: cProfileで決定的に計測し、pstats形式で出力（メインスレッドのみ）
+PROFILE_MODES = ("sample", "cprofile")
+_profiler_started = False
+
 def setup_logger():
     # ロガーの初期設定をクリア
     logger.remove()
-    
+
     # カスタムフォーマットでロガーを追加
     logger.add(
         sys.stdout,
@@ -15,7 +27,10 @@ def setup_logger():
         "<level>{message}</level>",
         level="INFO"
     )
-    
+
+    # プロファイラが指定されていれば開始（インポートが終わった後の実行部分を計測）
+    start_profiler_from_env()
+
     return logger
 
 def print_tutorial_header(title):
@@ -24,3 +39,139 @@ def print_tutorial_header(title):
     print("\n" + "="*80)
     print(ascii_art)
     print("="*80 + "\n")
+
+def _profile_mode_from_args():
+    """
+    コマンドライン引数から --profile / --profile=<mode> / --profile <mode> を取り除き、指定されたモードを返す
+
+    --profile の次の引数がモード名の場合のみ、それをモードとして一緒に取り除く
+    （それ以外の場合は sample とし、次の引数はスクリプトの引数として残す）
+    """
+    mode = None
+    args = sys.argv[1:]
+    remaining = []
+    index = 0
+    while index < len(args):
+        arg = args[index]
+        if arg.startswith("--profile="):
+            mode = arg.partition("=")[2] or "sample"
+        elif arg == "--profile":
+            if index + 1 < len(args) and args[index + 1] in PROFILE_MODES:
+                index += 1
+                mode = args[index]
+            else:
+                mode = "sample"
+        else:
+            remaining.append(arg)
+        index += 1
+    sys.argv[1:] = remaining
+    return mode
+
+def _process_elapsed():
+    """プロセスの起動からの経過時間（秒、/proc のない環境ではNone）"""
+    try:
+        with open("/proc/self/stat") as f:
+            # コマンド名の後ろの22番目のフィールドが起動時刻（起動からのクロック数）
+            start_ticks = int(f.read().rpartition(")")[2].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+def _format_seconds(seconds):
+    return "不明" if seconds is None else f"{seconds:.2f}秒"
+
+def _frame_label(code):
+    """スタックフレームの表示名（関数名とファイル:行）"""
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class SamplingProfiler:
+    """全スレッドのスタックを一定間隔で採取するサンプリングプロファイラ"""
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, path):
+        """採取を終了し、collapsed形式（flamegraph.pl / speedscope で表示可能）で出力する"""
+        self._stop.set()
+        self._thread.join()
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+def start_profiler_from_env():
+    """
+    環境変数またはコマンドライン引数で指定されたCPUプロファイラを開始する
+
+    使用例:
+        TUTORIAL_PROFILE=sample python 02_enhanced_parallel_chains.py
+        python 04_nested_chain.py --profile=cprofile
+        python 04_nested_chain.py --profile cprofile
+
+    環境変数:
+        TUTORIAL_PROFILE: sample または cprofile
+        TUTORIAL_PROFILE_DIR: 出力先のディレクトリ（デフォルト: profiles）
+        TUTORIAL_PROFILE_INTERVAL: サンプリング間隔（秒、デフォルト: 0.005）
+    """
+    global _profiler_started
+    mode = _profile_mode_from_args() or os.getenv("TUTORIAL_PROFILE")
+    if _profiler_started or not mode:
+        return
+    if mode not in PROFILE_MODES:
+        logger.warning(f"[Profile] 不明なプロファイラです: {mode}（{' / '.join(PROFILE_MODES)} を指定してください）")
+        return
+    _profiler_started = True
+
+    # ここまでの時間はインタープリタの起動とモジュールのインポートに使われた時間
+    # （インポートと実行のどちらも、経過時間とCPU時間の両方で計測する）
+    import_time = _process_elapsed()
+    import_cpu_time = time.process_time()
+    run_started = time.perf_counter()
+    output_dir = os.getenv("TUTORIAL_PROFILE_DIR", "profiles")
+    os.makedirs(output_dir, exist_ok=True)
+    script = os.path.splitext(os.path.basename(sys.argv[0] or "interactive"))[0]
+
+    if mode == "sample":
+        profiler = SamplingProfiler(float(os.getenv("TUTORIAL_PROFILE_INTERVAL", "0.005")))
+        path = os.path.join(output_dir, f"{script}.collapsed")
+    else:
+        profiler = cProfile.Profile()
+        path = os.path.join(output_dir, f"{script}.pstats")
+    if mode == "cprofile":
+        profiler.enable()
+    else:
+        profiler.start()
+
+    def finish():
+        if mode == "cprofile":
+            profiler.disable()
+            profiler.dump_stats(path)
+        else:
+            profiler.stop(path)
+        run_time = time.perf_counter() - run_started
+        run_cpu_time = time.process_time() - import_cpu_time
+        logger.info(
+            f"[Profile] インポート {_format_seconds(import_time)} (CPU {import_cpu_time:.2f}秒) / "
+            f"実行 {run_time:.2f}秒 (CPU {run_cpu_time:.2f}秒) -> {path}"
+        )
+
+    atexit.register(finish)
+    logger.info(f"[Profile] {mode} プロファイラで実行を計測します")